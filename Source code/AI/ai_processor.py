@@ -1,5 +1,3 @@
-
-
 """
 Phiên bản sử dụng Webcam máy tính
 Xử lý trực tiếp video stream từ camera
@@ -7,68 +5,134 @@ Xử lý trực tiếp video stream từ camera
 import cv2
 import numpy as np
 import mediapipe as mp
+import os
 import time
-import requests
-import threading
 from collections import Counter
-import base64
-import math
+
+from alert_dispatcher import AlertDispatcher
+from capture import open_frame_source, parse_source
+from cascade import POSE_MODEL_COMPLEXITY, CascadePipeline
+from detection_result import DetectionResult
+from evidence_buffer import EVIDENCE_ENABLED, EvidenceRecorder
+from recording import RECORDING_ENABLED, Recorder
+from multi_person import MultiPersonPipeline, MultiResults
+import overlay
+from overlay import FrameAnalysis
+import landmarks as lmk
+import pose_rules
+from scheduler import InferenceScheduler
+from frame_context import FrameContext
+from frame_ingest import BufferPool
+from session_store import SessionStore
+from stage_timer import StageTimer
+from wall_tracker import PINNED_WALLS, WallTracker
 
 
 # --- CẤU HÌNH ---
 SERVER_URL = "http://localhost:3000/api/alert"
 SAFE_DURATION = 30
-CAMERA_ID = 0
+CAMERA_ID = parse_source(os.environ.get("CAMERA_SOURCE", "0"))   # Số webcam, URL hoặc "shm://<ring>"
+DEFAULT_CAMERA_ID = "default"
+# "cascade": Pose mỗi frame + Face Mesh vùng đầu khi cần | "holistic": Holistic đầy đủ
+# "multi": phát hiện + theo dõi nhiều người, Pose trên vùng cắt của từng người (multi_person.py)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "cascade")
+# Backend cascade: chỉ đưa vùng quanh người vào Pose (cắt + thu nhỏ), dò lại toàn khung khi mất dấu
+ROI_INFERENCE = os.environ.get("ROI_INFERENCE", "0") == "1"
+# Không có màn hình (server): không mở cửa sổ, không copy / vẽ lớp phủ mỗi frame
+HEADLESS = os.environ.get("HEADLESS", "0") == "1"
+STATUS_PRIORITY = {"NORMAL": 0, "UNKNOWN": 0, "GREEN": 1, "YELLOW": 2, "RED": 3}
 
 class AIProcessor:
-    def __init__(self):
+    def __init__(self, backend=INFERENCE_BACKEND, pose_model_complexity=POSE_MODEL_COMPLEXITY,
+                 roi=ROI_INFERENCE, evidence=EVIDENCE_ENABLED, recording=RECORDING_ENABLED):
+        self.backend = backend
+        self.pose_model_complexity = pose_model_complexity
+        self.roi = roi
         self.mp_holistic = mp.solutions.holistic
-        self.mp_drawing = mp.solutions.drawing_utils
-        self.holistic = self.mp_holistic.Holistic(
+        # Trạng thái theo dõi + graph MediaPipe riêng cho từng camera
+        self.sessions = SessionStore(self.create_graph)
+        # Một luồng gửi cảnh báo dùng chung (hàng chờ giới hạn, keep-alive)
+        self.alerts = AlertDispatcher(SERVER_URL)
+        # Clip bằng chứng trước / sau sự kiện RED (vòng đệm JPEG mỗi camera, ghi trên luồng nền)
+        self.evidence = EvidenceRecorder() if evidence else None
+        # Ghi liên tục vào kho segment có chỉ mục thời gian (recording.py, tắt mặc định)
+        self.recording = Recorder() if recording else None
+        # Bộ đệm RGB / xám dùng lại giữa các frame (analyze chạy tuần tự trên 1 luồng)
+        self.buffers = BufferPool()
+        # Đo thời gian từng giai đoạn (tắt mặc định, replay.py / metrics bật lên)
+        self.timer = StageTimer()
+        # Đồng hồ cho bộ lọc thời gian / safe mode (replay.py thay bằng thời gian của video)
+        self.clock = time.time
+        self.send_cooldown = 2.0        # Giãn cách cảnh báo không phải RED (RED luôn gửi ngay)
+        self.WAVE_THRESHOLD = 3
+        self.MIN_MOVE_DIST = 0.02
+
+    def create_graph(self):
+        """Tạo graph mới (mỗi camera một graph vì tracking phụ thuộc frame trước)"""
+        if self.backend == "cascade":
+            return CascadePipeline(model_complexity=self.pose_model_complexity, roi=self.roi)
+        if self.backend == "multi":
+            return MultiPersonPipeline(model_complexity=self.pose_model_complexity)
+        return self.mp_holistic.Holistic(
             min_detection_confidence=0.5, 
             min_tracking_confidence=0.5
         )
-        self.current_status = "UNKNOWN"
-        self.last_sent_time = 0
-        self.send_cooldown = 2.0
-        self.safe_mode_until = 0
-        self.wave_counter = 0
-        self.prev_wrist_x = 0
-        self.prev_direction = 0
-        self.WAVE_THRESHOLD = 3
-        self.MIN_MOVE_DIST = 0.02
 
-    def send_alert_thread(self, status, message, frame):
-        """Gửi cảnh báo sang server Node.js"""
-        try:
-            _, buffer = cv2.imencode('.jpg', frame)
-            jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-            
-            payload = {
-                "status": status,
-                "message": message,
-                "timestamp": time.time(),
-                "image_base64": jpg_as_text
-            }
-            response = requests.post(SERVER_URL, json=payload, timeout=2)
-            print(f">>> [GỬI SERVER] {status}: {message}")
-        except Exception as e:
-            print(f"[LỖI] Không gửi được: {e}")
+    def record_frame(self, camera_id, frame=None, jpeg=None, session=None):
+        """
+        Đưa frame vào vòng đệm bằng chứng + kho ghi hình của camera
+        (gọi với mọi frame, kể cả frame bỏ qua suy luận; frame BGR chỉ encode JPEG 1 lần cho cả hai)
+        """
+        if self.evidence is None and self.recording is None:
+            return
+        now = self.clock()
+        if self.evidence is not None:
+            if session is None:
+                session = self.sessions.get(camera_id)
+            if session.evidence is None:
+                session.evidence = self.evidence.buffer()
+            jpeg = self.evidence.add_frame(camera_id, session.evidence, now, frame, jpeg) or jpeg
+        if self.recording is not None:
+            self.recording.append(camera_id, now, frame, jpeg)
+
+    def wall_tracker(self, session):
+        """WallTracker của camera (tạo khi cần, áp dụng vạch ghim từ PINNED_WALLS)"""
+        if session.wall_tracker is None:
+            session.wall_tracker = WallTracker(self.detect_wall_region,
+                                               pinned_y=PINNED_WALLS.get(session.camera_id))
+        return session.wall_tracker
+
+    def pin_wall(self, camera_id, wall_y):
+        """Người vận hành ghim vạch tường cho camera (tỉ lệ 0.0 -> 1.0 chiều cao, None để bỏ ghim; ngoài khoảng -> ValueError)"""
+        tracker = self.wall_tracker(self.sessions.get(camera_id))
+        if wall_y is None:
+            tracker.unpin()
+        else:
+            tracker.pin(wall_y)
+
+    def get_wall(self, ctx, tracker=None):
+        """Kết quả dò tường của frame (chỉ tính 1 lần mỗi frame)"""
+        if tracker is not None:
+            return ctx.cached("wall", lambda: tracker.update(ctx))
+        return ctx.cached("wall", lambda: self.detect_wall_region(ctx.frame, ctx))
 
-    def detect_wall_region(self, frame):
+    def detect_wall_region(self, frame, ctx=None):
         """
         Phát hiện tường bằng Cạnh (Edge) thay vì Màu
         Tìm các đường thẳng nằm ngang dài nhất ở nửa dưới màn hình.
+        ctx: FrameContext để dùng lại ảnh xám đã tính (nếu có)
         """
         try:
             h, w = frame.shape[:2]
             
             # 1. Chỉ xử lý nửa dưới màn hình (để tránh trần nhà, đèn...)
             roi_y_start = int(h * 0.3) 
-            roi = frame[roi_y_start:h, 0:w]
             
             # 2. Xử lý ảnh: Grayscale -> Blur -> Canny
-            gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+            if ctx is not None:
+                gray = ctx.gray[roi_y_start:h, 0:w]
+            else:
+                gray = cv2.cvtColor(frame[roi_y_start:h, 0:w], cv2.COLOR_BGR2GRAY)
             blurred = cv2.GaussianBlur(gray, (5, 5), 0)
             
             # Canny threshold: 50, 150 là ngưỡng phổ biến cho môi trường tự nhiên
@@ -115,114 +179,28 @@ class AIProcessor:
             return False, None
         
 
-    def check_pose_logic(self, landmarks, frame):
+    def check_pose_logic(self, keypoints, wall_y):
         """
-        Kiểm tra logic Ngã và Trèo 
-        Sử dụng góc nghiêng cơ thể thay vì tỷ lệ khung hình.
+        Kiểm tra logic Ngã và Trèo trên mảng keypoints (33, 4) - xem pose_rules.py
+        - NGÃ: trục vai-hông nằm ngang / thân bị bẹt (thấy rõ thân),
+          hoặc khung người rộng > 1.5 lần cao (cam mờ, không thấy hông)
+        - LEO TƯỜNG: thân trên cao hơn vạch tường
+        wall_y: vạch tường của frame từ WallTracker (None = chưa có tường)
         """
-        # Lấy tọa độ các điểm mốc quan trọng (Thân trên)
-        l_shoulder = landmarks[self.mp_holistic.PoseLandmark.LEFT_SHOULDER]
-        r_shoulder = landmarks[self.mp_holistic.PoseLandmark.RIGHT_SHOULDER]
-        l_hip = landmarks[self.mp_holistic.PoseLandmark.LEFT_HIP]
-        r_hip = landmarks[self.mp_holistic.PoseLandmark.RIGHT_HIP]
-        
-        # 1. LOGIC PHÁT HIỆN NGÃ (FALL) - Dựa trên góc nghiêng
-        # Tính điểm giữa vai và điểm giữa hông
-        mid_shoulder_x = (l_shoulder.x + r_shoulder.x) / 2
-        mid_shoulder_y = (l_shoulder.y + r_shoulder.y) / 2
-        
-        mid_hip_x = (l_hip.x + r_hip.x) / 2
-        mid_hip_y = (l_hip.y + r_hip.y) / 2
-        
-        # Tính vector trục cơ thể (từ vai xuống hông)
-        dx = mid_hip_x - mid_shoulder_x
-        dy = mid_hip_y - mid_shoulder_y # Y tăng dần từ trên xuống dưới
-        
-        # Nếu cam quá mờ, MediaPipe có thể bắt sai khiến dy ~ 0 hoặc âm (đầu dưới chân)
-        # Chỉ xét khi độ tin cậy của các điểm này > 0.5 (visible)
-        confidence_check = (l_shoulder.visibility > 0.5 and r_shoulder.visibility > 0.5 and 
-                            l_hip.visibility > 0.5 and r_hip.visibility > 0.5)
-        
-        if confidence_check:
-            # Tính góc nghiêng so với trục thẳng đứng (độ)
-            # atan2 trả về radian, đổi sang độ. 
-            # 90 độ là đứng thẳng, 0 hoặc 180 là nằm ngang.
-            angle_rad = math.atan2(dy, dx) 
-            angle_deg = abs(math.degrees(angle_rad))
-            
-            # Chuẩn hóa góc: 90 là đứng, về gần 0 hoặc 180 là nằm
-            # Nếu góc lệch khỏi phương thẳng đứng quá nhiều -> NGÃ
-            # Bình thường đứng: góc khoảng 80-100 độ (so với trục hoành) hoặc -80 đến -100
-            # Nằm: góc < 45 hoặc > 135
-            
-            is_horizontal = angle_deg < 45 or angle_deg > 135
-            
-            # Bổ sung: Kiểm tra độ bẹt của thân người (Torso)
-            # Khi nằm, khoảng cách dọc (dy) sẽ rất nhỏ so với khoảng cách ngang vai
-            shoulder_width = abs(l_shoulder.x - r_shoulder.x)
-            torso_compressed = abs(dy) < shoulder_width * 0.8
-            
-            if is_horizontal or torso_compressed:
-                return "FALL"
-        else:
-            # Fallback cho trường hợp cam quá mờ không thấy hông:
-            # Dùng bounding box nhưng chỉ so sánh chiều rộng vai và chiều cao đầu-ngực
-            # (Logic cũ nhưng gắt hơn)
-            h_list = [lm.y for lm in landmarks]
-            w_list = [lm.x for lm in landmarks]
-            height = max(h_list) - min(h_list)
-            width = max(w_list) - min(w_list)
-            if width > height * 1.5: # Tăng ngưỡng lên 1.5 để tránh báo ảo
-                return "FALL"
-
-        # 2. LOGIC PHÁT HIỆN LEO TƯỜNG (CLIMB) - Giữ nguyên logic cũ
-        has_wall, wall_y = self.detect_wall_region(frame)
-        
-        if has_wall and wall_y:
-            upper_body_y = min(l_shoulder.y, r_shoulder.y, l_hip.y, r_hip.y)
-            # Nếu thân trên cao hơn tường
-            if upper_body_y < wall_y:
-                return "CLIMB"
-        
-        return "NORMAL"
-    
-    def is_waving(self, landmarks):
-        """Kiểm tra vẫy tay"""
-        l_wrist = landmarks[self.mp_holistic.PoseLandmark.LEFT_WRIST]
-        r_wrist = landmarks[self.mp_holistic.PoseLandmark.RIGHT_WRIST]
-        l_shoulder = landmarks[self.mp_holistic.PoseLandmark.LEFT_SHOULDER]
-        r_shoulder = landmarks[self.mp_holistic.PoseLandmark.RIGHT_SHOULDER]
-        
-        is_raised = l_wrist.y < l_shoulder.y or r_wrist.y < r_shoulder.y
-        
-        if not is_raised:
-            self.wave_counter = 0
-            self.prev_wrist_x = 0
-            self.prev_direction = 0
-            return False
-
-        current_x = r_wrist.x if r_wrist.y < r_shoulder.y else l_wrist.x
-
-        if self.prev_wrist_x == 0:
-            self.prev_wrist_x = current_x
-            return False
+        if pose_rules.fall(keypoints):
+            return "FALL"
 
-        dx = current_x - self.prev_wrist_x
-        
-        if abs(dx) > self.MIN_MOVE_DIST:
-            current_dir = 1 if dx > 0 else -1
-            if self.prev_direction != 0 and current_dir != self.prev_direction:
-                self.wave_counter += 1
-            self.prev_direction = current_dir
-            self.prev_wrist_x = current_x
-
-        if self.wave_counter >= self.WAVE_THRESHOLD:
-            self.wave_counter = 0
-            return True
+        if wall_y is not None and pose_rules.climb(keypoints, wall_y):
+            return "CLIMB"
 
-        return False
+        return "NORMAL"
+    
+    def is_waving(self, keypoints, session):
+        """Kiểm tra vẫy tay (bộ đếm lưu theo session của camera)"""
+        raised, wrist_x = pose_rules.wrist_signal(keypoints)
+        return pose_rules.wave_step(session, raised, wrist_x, self.MIN_MOVE_DIST, self.WAVE_THRESHOLD)
 
-    def check_face_status(self, face_landmarks, frame):
+    def check_face_status(self, face_landmarks, ctx):
             """
             Kiểm tra trạng thái khuôn mặt:
             1. Bỏ qua góc nghiêng (Nghiêng cũng được, miễn là có mặt).
@@ -232,7 +210,7 @@ class AIProcessor:
             # Nếu MediaPipe đã trả về face_landmarks thì tức là KHÔNG quay lưng.
             # (Vì quay lưng MediaPipe sẽ không bắt được điểm nào -> rơi vào case NO_FACE ở ngoài)
             
-            h, w = frame.shape[:2]
+            h, w = ctx.h, ctx.w
             lm = face_landmarks.landmark
 
             # --- KIỂM TRA KHẨU TRANG (Heuristic) ---
@@ -252,11 +230,10 @@ class AIProcessor:
                 x1 = max(0, mouth_x - crop_size)
                 x2 = min(w, mouth_x + crop_size)
                 
-                mouth_roi = frame[y1:y2, x1:x2]
+                # Ảnh xám dùng chung của frame -> Tính độ bén (Laplacian)
+                gray_roi = ctx.gray[y1:y2, x1:x2]
                 
-                if mouth_roi.size > 0:
-                    # Chuyển ảnh xám -> Tính độ bén (Laplacian)
-                    gray_roi = cv2.cvtColor(mouth_roi, cv2.COLOR_BGR2GRAY)
+                if gray_roi.size > 0:
                     laplacian_var = cv2.Laplacian(gray_roi, cv2.CV_64F).var()
                     
                     # NGƯỠNG (Threshold):
@@ -270,136 +247,258 @@ class AIProcessor:
                 
             return "OK"
 
-    def process_frame(self, frame):
-        """Xử lý 1 frame (Đã update logic check mặt)"""
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.holistic.process(image)
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-        
-        status = "YELLOW"
-        message = "Dang quet khu vuc..."
-        status_color = (0, 255, 255)
+    def evaluate_person(self, state, results, ctx, now, present=True, wall_y=None):
+        """
+        Chạy luật cho 1 người (camera ở chế độ 1 người, hoặc 1 track ở chế độ nhiều người)
+        state: PersonState (bộ đếm vẫy tay, safe mode, bộ lọc thời gian)
+        results: kết quả Pose/Holistic của người đó; None = frame này không chạy Pose
+                 (track vẫn thấy -> present=True: giữ nguyên điểm các luật khác "person")
+        wall_y: vạch tường của frame (đã tính 1 lần trong analyze), None = chưa có tường
+        Trả về (status, message, color, trigger, keypoints)
+        """
+        timer = self.timer
+        observed = results is not None
+        has_person = results.pose_landmarks is not None if observed else present
+        keypoints = None
+        pose_status = "NORMAL"
+        face_status = None      # None = không kiểm tra mặt ở frame này
 
-        h, w = image.shape[:2]
-        
-        # Phát hiện tường (không log)
-        has_wall, wall_y = self.detect_wall_region(frame)
-        
-        # VẼ TƯỜNG
-        if has_wall and wall_y:
-            wall_pixel_y = int(wall_y * h)
-            cv2.line(image, (0, wall_pixel_y), (w, wall_pixel_y), (0, 255, 0), 3)
-            cv2.putText(image, f"WALL", (10, wall_pixel_y - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-        if results.pose_landmarks:
-            # Vẽ skeleton
-            self.mp_drawing.draw_landmarks(
-                image, results.pose_landmarks, self.mp_holistic.POSE_CONNECTIONS)
+        if observed and has_person:
+            with timer.stage("pose_rules"):
+                # Đọc landmark protobuf 1 lần -> mảng (33, 4) dùng cho mọi luật
+                keypoints = lmk.to_array(results.pose_landmarks)
+                pose_status = self.check_pose_logic(keypoints, wall_y)
             
-            landmarks = results.pose_landmarks.landmark
-            pose_status = self.check_pose_logic(landmarks, frame)
-            
-            face_status = "UNKNOWN"
-            if results.face_landmarks:
-                # Có landmark -> Mặt đang nhìn (dù nghiêng hay thẳng)
-                face_status = self.check_face_status(results.face_landmarks, frame)
-            else:
-                # Không có landmark -> Quay lưng hoặc Không có mặt
-                face_status = "NO_FACE"
+            # Chỉ kiểm tra mặt khi chưa kết luận NGÃ / LEO TƯỜNG
+            # (backend cascade chỉ chạy Face Mesh khi face_landmarks được truy cập)
+            with timer.stage("face"):
+                if pose_status in ("FALL", "CLIMB"):
+                    pass
+                elif results.face_landmarks:
+                    # Có landmark -> Mặt đang nhìn (dù nghiêng hay thẳng)
+                    face_status = self.check_face_status(results.face_landmarks, ctx)
+                else:
+                    # Không có landmark -> Quay lưng hoặc Không có mặt
+                    face_status = "NO_FACE"
 
-            # --- TỔNG HỢP CẢNH BÁO ---
-            if pose_status == "FALL":
-                status = "RED"
-                message = "NGUY HIEM: Phat hien nguoi NGA!"
-                status_color = (0, 0, 255)
-            elif pose_status == "CLIMB":
-                status = "RED"
-                message = "NGUY HIEM: Phat hien LEO TUONG!"
-                status_color = (0, 0, 255)
-            
+        # --- LỌC THEO THỜI GIAN ---
+        # Tín hiệu thô của frame -> bỏ phiếu giảm dần + ngưỡng bật/tắt + thời gian giữ tối thiểu
+        # (1 frame nhiễu không còn làm đổi trạng thái / gửi cảnh báo)
+        if face_status not in (None, "OK"):
+            state.face_issue = face_status
+        unknown = None if has_person else False
+        active = state.temporal.update({
+            "person": has_person,
+            "fall": pose_status == "FALL" if observed else unknown,
+            "climb": pose_status == "CLIMB" if observed else unknown,
+            "face": (face_status != "OK") if face_status is not None else unknown,
+        }, now)
+        if observed:
+            state.raw_status = (pose_status if pose_status != "NORMAL"
+                                else face_status if face_status not in (None, "OK")
+                                else "PERSON" if has_person else "NO_PERSON")
+
+        # --- TỔNG HỢP CẢNH BÁO (trên tín hiệu đã lọc) ---
+        trigger = None      # Luật sinh ra cảnh báo (fall | climb | face)
+        if active["fall"]:
+            status = "RED"
+            message = "NGUY HIEM: Phat hien nguoi NGA!"
+            status_color = (0, 0, 255)
+            trigger = "fall"
+        elif active["climb"]:
+            status = "RED"
+            message = "NGUY HIEM: Phat hien LEO TUONG!"
+            status_color = (0, 0, 255)
+            trigger = "climb"
+        elif active["person"]:
             # Logic check mặt:
-            elif face_status != "OK":
+            if active["face"]:
                 status = "RED"
                 status_color = (0, 0, 255)
+                trigger = "face"
                 
-                if face_status == "NO_FACE":
-                    # Đây là trường hợp: Quay đầu về cam (mất landmark) hoặc che kín mít
-                    message = "CANH BAO: Khong thay mat / Quay lung"
-                elif face_status == "MASK":
+                if state.face_issue == "MASK":
                     # Đây là trường hợp: Có mặt nhưng vùng mồm quá phẳng
                     message = "CANH BAO: Phat hien KHAU TRANG!"
+                else:
+                    # Đây là trường hợp: Quay đầu về cam (mất landmark) hoặc che kín mít
+                    message = "CANH BAO: Khong thay mat / Quay lung"
             
+            # Mặt OK (có chi tiết miệng) + Dáng OK -> Check Safe Mode
+            elif now < state.safe_mode_until:
+                status = "GREEN"
+                remaining_time = int(state.safe_mode_until - now)
+                message = f"XAC NHAN: An toan ({remaining_time}s)"
+                status_color = (0, 255, 0)
+            elif keypoints is not None and self.is_waving(keypoints, state):
+                state.safe_mode_until = now + SAFE_DURATION
+                status = "YELLOW"
+                message = "DA KICH HOAT CHE DO AN TOAN!"
+                status_color = (0, 255, 0)
+                print(message)
             else:
-                # Mặt OK (có chi tiết miệng) + Dáng OK -> Check Safe Mode
-                if time.time() < self.safe_mode_until:
-                    status = "GREEN"
-                    remaining_time = int(self.safe_mode_until - time.time())
-                    message = f"XAC NHAN: An toan ({remaining_time}s)"
-                    status_color = (0, 255, 0)
-                else:
-                    if self.is_waving(landmarks):
-                        self.safe_mode_until = time.time() + SAFE_DURATION
-                        message = "DA KICH HOAT CHE DO AN TOAN!"
-                        status_color = (0, 255, 0)
-                        print(message)
-                    else:
-                        status = "YELLOW"
-                        message = "Phat hien nguoi - Chua xac minh"
-                        status_color = (0, 255, 255)
+                status = "YELLOW"
+                message = "Phat hien nguoi - Chua xac minh"
+                status_color = (0, 255, 255)
         else:
             status = "NORMAL"
             message = "Khong co nguoi"
             status_color = (128, 128, 128)
 
-        # Gửi cảnh báo
-        if status != self.current_status:
-            if time.time() - self.last_sent_time > self.send_cooldown:
-                t = threading.Thread(target=self.send_alert_thread, args=(status, message, image))
-                t.start()
-                self.last_sent_time = time.time()
-            self.current_status = status
-
-        # Vẽ status
-        cv2.rectangle(image, (10, 10), (630, 80), (0, 0, 0), -1)
-        cv2.putText(image, f"Status: {status}", (20, 40), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
-        cv2.putText(image, message, (20, 65), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-
-        return image
-
-def main():
-    print("\n🤖 AI Surveillance System - Webcam Version")
+        return status, message, status_color, trigger, keypoints
+
+    def process_people(self, analysis, results, ctx, now, wall_y=None):
+        """
+        Chế độ nhiều người: chạy luật cho từng track, ghi khung + ID theo màu trạng thái vào analysis
+        Trả về trạng thái của người nặng nhất (RED > YELLOW > GREEN > NORMAL) + track đó
+        """
+        worst, worst_outcome = None, None
+        for track, person in results.people:
+            outcome = self.evaluate_person(track, person, ctx, now, present=track.visible, wall_y=wall_y)
+            track.status, track.message, track.color, track.trigger, _ = outcome
+            landmarks = person.pose_landmarks if person is not None else None
+            if not (track.confirmed and track.visible):
+                if landmarks is not None:
+                    analysis.add_person(landmarks)
+                continue
+
+            analysis.add_person(landmarks, track.bbox, f"#{track.id} {track.status}", track.color)
+            if worst is None or STATUS_PRIORITY[track.status] > STATUS_PRIORITY[worst.status]:
+                worst, worst_outcome = track, outcome
+
+        if worst is None:
+            return "NORMAL", "Khong co nguoi", (128, 128, 128), None, None, None
+        status, message, status_color, trigger, keypoints = worst_outcome
+        if keypoints is None:
+            keypoints = worst.keypoints     # Frame này track không chạy Pose -> dùng keypoints gần nhất
+        return status, message, status_color, trigger, keypoints, worst
+
+    def analyze(self, frame, camera_id=DEFAULT_CAMERA_ID, jpeg=None):
+        """
+        Phân tích 1 frame của camera camera_id -> FrameAnalysis (không copy / không vẽ ảnh)
+        Ảnh cảnh báo được vẽ lớp phủ lười trên luồng gửi (overlay.renderer)
+        jpeg: JPEG gốc của frame (nếu có) -> lưu thẳng vào vòng đệm bằng chứng, không encode lại
+        """
+        timer = self.timer
+        timer.reset()
+        session = self.sessions.get(camera_id)
+        graph = self.sessions.get_graph(camera_id)
+        ctx = FrameContext(frame, self.buffers)
+        with timer.stage("evidence"):
+            self.record_frame(camera_id, frame, jpeg, session)
+
+        with timer.stage("color"):
+            # Chế độ ROI: graph tự đổi màu riêng vùng cắt (không đổi cả khung)
+            rgb = ctx if getattr(graph, "roi", False) else ctx.rgb
+        with timer.stage("inference"):
+            results = graph.process(rgb)
+
+        # Tường lấy từ WallTracker (không dò lại mỗi frame) - truyền thẳng vào check_pose_logic
+        tracker = self.wall_tracker(session)
+        with timer.stage("wall"):
+            has_wall, wall_y = self.get_wall(ctx, tracker)
+        frame_wall = wall_y if has_wall else None
+
+        analysis = FrameAnalysis(camera_id, "YELLOW", "Dang quet khu vuc...", (0, 255, 255))
+        if has_wall and wall_y:
+            label = "WALL (pin)" if tracker.pinned_y is not None else f"WALL {tracker.confidence:.0%}"
+            analysis.set_wall(wall_y, label)
+
+        now = self.clock()
+        if isinstance(results, MultiResults):
+            # Chế độ nhiều người: mỗi track một bộ luật, camera lấy trạng thái nặng nhất
+            status, message, status_color, trigger, keypoints, worst = \
+                self.process_people(analysis, results, ctx, now, frame_wall)
+            session.raw_status = worst.raw_status if worst is not None else "NO_PERSON"
+            track_id = worst.id if worst is not None else None
+        else:
+            if results.pose_landmarks is not None:
+                analysis.add_person(results.pose_landmarks)
+            status, message, status_color, trigger, keypoints = \
+                self.evaluate_person(session, results, ctx, now, wall_y=frame_wall)
+            track_id = None
+
+        # Kết quả gọn (keypoints float32, confidence, bbox, tường) gửi kèm cảnh báo
+        with timer.stage("pose_rules"):
+            result = DetectionResult.from_keypoints(
+                camera_id, status, message,
+                keypoints,
+                frame_wall, trigger, track_id)
+        session.last_result = result
+        analysis.status, analysis.message, analysis.color = status, message, status_color
+        analysis.result = result
+
+        if status != session.current_status and status == "RED" and self.evidence is not None:
+            # Clip PRE_EVENT_SECONDS trước + POST_EVENT_SECONDS sau, ghi trên luồng nền
+            self.evidence.trigger(camera_id, session.evidence, now,
+                                  {"status": status, "message": message, "trigger": trigger,
+                                   "detection": result.to_dict()})
+        session.current_status = status
+
+        # Gửi cảnh báo (ảnh gốc + lớp phủ vẽ lúc encode): RED gửi ngay, trạng thái khác đổi trong
+        # cooldown thì gửi trạng thái hiện tại khi hết cooldown (không mất thay đổi nào)
+        if status != session.sent_status and (
+                status == "RED" or now - session.last_sent_time > self.send_cooldown):
+            self.alerts.submit(status, message, frame, camera_id, result,
+                               render=overlay.renderer(analysis))
+            session.sent_status = status
+            session.last_sent_time = now
+        session.current_message = message
+        session.current_color = status_color
+
+        return analysis
+
+    def process_frame(self, frame, camera_id=DEFAULT_CAMERA_ID):
+        """analyze() + vẽ lớp phủ lên bản sao frame (dùng khi có người xem)"""
+        analysis = self.analyze(frame, camera_id)
+        with self.timer.stage("draw"):
+            return overlay.render(frame.copy(), analysis)
+
+def main(headless=HEADLESS):
+    print("\n🤖 AI Surveillance System - Webcam Version" + (" (headless)" if headless else ""))
     print("📹 Khởi động camera...")
     
-    cap = cv2.VideoCapture(CAMERA_ID)
+    # Đọc camera trên luồng riêng, luôn lấy frame mới nhất
+    reader = open_frame_source(CAMERA_ID, width=640, height=480, name="webcam")
     
-    if not cap.isOpened():
+    ret, frame = reader.read(timeout=5)
+    if not ret:
         print("❌ Không thể mở camera!")
+        reader.stop()
         return
     
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-    
     processor = AIProcessor()
+    scheduler = InferenceScheduler(processor)
     print("✅ Hệ thống sẵn sàng!")
     print("📋 Hướng dẫn:")
     print("   - Vẫy tay để kích hoạt chế độ an toàn")
-    print("   - Nhấn 'q' để thoát")
+    print("   - Nhấn Ctrl+C để thoát" if headless else "   - Nhấn 'q' để thoát")
     print("-" * 50)
     
     fps_time = time.time()
     fps_counter = 0
     
+    last_status = None
+
     try:
         while True:
-            ret, frame = cap.read()
             if not ret:
-                print("❌ Không đọc được frame!")
-                break
-            
-            processed_frame = processor.process_frame(frame)
+                # Chưa có frame mới (camera đang kết nối lại) - giữ cửa sổ phản hồi
+                if not headless and cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+                ret, frame = reader.read(timeout=0.5)
+                continue
+
+            if headless:
+                # Chỉ phân tích: không copy, không vẽ, chỉ in khi trạng thái đổi
+                analysis, _ = scheduler.analyze(frame, DEFAULT_CAMERA_ID)
+                if analysis.status != last_status:
+                    last_status = analysis.status
+                    print(f"[{time.strftime('%H:%M:%S')}] {analysis.status}: {analysis.message}")
+                ret, frame = reader.read(timeout=0.5)
+                continue
+
+            processed_frame, _ = scheduler.process_frame(frame, DEFAULT_CAMERA_ID)
             
             # Tính FPS
             fps_counter += 1
@@ -415,13 +514,29 @@ def main():
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 print("\n👋 Đang thoát...")
                 break
+
+            ret, frame = reader.read(timeout=0.5)
                 
     except KeyboardInterrupt:
         print("\n⚠️ Đã dừng bởi người dùng")
     finally:
-        cap.release()
-        cv2.destroyAllWindows()
+        stats = reader.stats()
+        reader.stop()
+        processor.alerts.close()
+        if processor.evidence is not None:
+            processor.evidence.close()
+        if processor.recording is not None:
+            processor.recording.close()
+        if not headless:
+            cv2.destroyAllWindows()
+        print(f"📊 Đã đọc {stats['frames_read']} frame, bỏ {stats['frames_dropped']} frame cũ")
         print("✅ Đã đóng camera và cửa sổ")
 
 if __name__ == '__main__':
-    main()
+    import sys
+    if '--webcam' in sys.argv:
+        main(headless=HEADLESS or '--headless' in sys.argv)
+    else:
+        # Mặc định: chạy dịch vụ nhận frame từ Node.js (port 5001)
+        from inference_service import run_server
+        run_server()
@@ -0,0 +1,262 @@
+"""
+Gửi cảnh báo sang server Node.js trên MỘT luồng nền duy nhất
+(thay cho việc tạo 1 thread mới cho mỗi cảnh báo)
+- Hàng chờ có giới hạn, không bao giờ chặn vòng lặp xử lý camera
+- Gộp cảnh báo: trạng thái mới của cùng camera thay thế trạng thái cũ chưa gửi
+  (cảnh báo RED chỉ bị thay bởi một RED mới hơn)
+- Dùng lại kết nối HTTP (requests.Session keep-alive), thử lại với backoff
+- Thống kê: độ sâu hàng chờ, số đã gửi / lỗi / bỏ, độ trễ gửi
+- Hai kiểu gửi ảnh:
+  + "binary": [4 byte độ dài JSON (big-endian)][JSON metadata][JPEG thô]
+    (application/octet-stream, không tốn thêm 33% base64)
+  + "json":   JSON kèm image_base64 (kiểu cũ)
+- Metadata kèm "detection" (DetectionResult: keypoints float32, confidence, bbox, tường)
+  -> server lưu / tìm kiếm không cần giải mã ảnh; ảnh có thể là thumbnail hoặc bỏ hẳn
+- Lớp phủ (skeleton, trạng thái) chỉ được vẽ lúc encode, trên luồng gửi (render=..., xem overlay.py)
+"""
+import base64
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import cv2
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# --- CẤU HÌNH ---
+SERVER_URL = "http://localhost:3000/api/alert"
+MAX_QUEUE = 16            # Số cảnh báo chờ tối đa
+MAX_RETRIES = 3           # Số lần thử lại khi lỗi mạng / lỗi 5xx
+RETRY_BACKOFF = 0.5       # Backoff ban đầu (giây), nhân đôi mỗi lần thử
+MAX_BACKOFF = 4.0
+REQUEST_TIMEOUT = 2.0
+ALERT_TRANSPORT = os.environ.get("ALERT_TRANSPORT", "binary")   # "binary" | "json"
+SNAPSHOT_MAX_WIDTH = 640      # Thu nhỏ ảnh bằng chứng nếu rộng hơn (0 = giữ nguyên)
+SNAPSHOT_JPEG_QUALITY = 80
+ALERT_SNAPSHOT = os.environ.get("ALERT_SNAPSHOT", "full")     # "full" | "thumb" | "none"
+THUMBNAIL_WIDTH = 160
+
+
+class Alert:
+    def __init__(self, status, message, frame, camera_id, result=None, render=None):
+        self.status = status
+        self.message = message
+        self.frame = frame              # Ảnh BGR, chỉ encode JPEG khi thực sự gửi (None = không ảnh)
+        self.camera_id = camera_id
+        self.result = result            # DetectionResult của frame (nếu có)
+        self.render = render            # Hàm vẽ lớp phủ lên bản sao frame (gọi lúc encode)
+        self.timestamp = result.timestamp if result is not None else time.time()
+
+
+class AlertDispatcher:
+    def __init__(self, server_url=SERVER_URL, max_queue=MAX_QUEUE, max_retries=MAX_RETRIES,
+                 timeout=REQUEST_TIMEOUT, enabled=True, transport=ALERT_TRANSPORT,
+                 snapshot_max_width=SNAPSHOT_MAX_WIDTH, jpeg_quality=SNAPSHOT_JPEG_QUALITY,
+                 snapshot=ALERT_SNAPSHOT):
+        self.server_url = server_url
+        self.transport = transport
+        self.snapshot = snapshot
+        self.snapshot_max_width = snapshot_max_width
+        self.jpeg_quality = jpeg_quality
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.enabled = enabled
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        self._http = requests.Session()
+        self._http.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self._http.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        # Thống kê
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.rejected = 0               # Server trả 4xx (body / dữ liệu không hợp lệ): không gửi lại
+        self.dropped = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.last_latency_ms = 0.0
+        self.max_latency_ms = 0.0
+        self._total_latency_ms = 0.0
+        self._latency_samples = deque(maxlen=256)  # Độ trễ chưa được lấy đi (histogram /metrics)
+
+    def submit(self, status, message, frame, camera_id=None, result=None, render=None):
+        """
+        Đưa cảnh báo vào hàng chờ (trả về ngay, không chặn)
+        frame: ảnh gốc (không bị sửa); render: vẽ lớp phủ lên bản sao lúc encode (None = gửi ảnh gốc)
+        """
+        if not self.enabled:
+            return
+
+        if self.snapshot == "none":
+            frame = None            # Không giữ ảnh trong hàng chờ khi không gửi ảnh
+        elif frame is not None:
+            # Ảnh được encode sau trên luồng gửi (có thể vài giây khi thử lại): copy ngay vì
+            # nguồn frame (ring shm, bộ đệm dùng lại) có thể ghi đè mảng trước lúc đó
+            frame = frame.copy()
+        alert = Alert(status, message, frame, camera_id, result, render)
+        with self._cond:
+            self.submitted += 1
+
+            # Gộp: bỏ cảnh báo cũ chưa gửi của cùng camera (RED chỉ bị thay bởi RED)
+            for old in list(self._queue):
+                if old.camera_id == camera_id and (old.status != "RED" or status == "RED"):
+                    self._queue.remove(old)
+                    self.coalesced += 1
+
+            # Hàng chờ đầy: bỏ cảnh báo cũ nhất, ưu tiên giữ lại RED
+            while len(self._queue) >= self.max_queue:
+                victim = next((a for a in self._queue if a.status != "RED"), self._queue[0])
+                self._queue.remove(victim)
+                self.dropped += 1
+
+            self._queue.append(alert)
+            self._ensure_thread()
+            self._cond.notify()
+
+    def queue_depth(self):
+        return len(self._queue)
+
+    def take_latencies(self):
+        """Lấy (và xóa) các độ trễ gửi (ms) từ lần gọi trước"""
+        samples = []
+        while self._latency_samples:
+            samples.append(self._latency_samples.popleft())
+        return samples
+
+    def stats(self):
+        return {
+            "queue_depth": len(self._queue),
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "last_latency_ms": round(self.last_latency_ms, 1),
+            "avg_latency_ms": round(self._total_latency_ms / self.sent, 1) if self.sent else 0.0,
+            "max_latency_ms": round(self.max_latency_ms, 1),
+        }
+
+    def close(self, timeout=2.0):
+        """Dừng luồng gửi (đợi gửi nốt hàng chờ tối đa timeout giây)"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._queue and time.time() < deadline:
+                self._cond.wait(timeout=0.1)
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=max(0.0, deadline - time.time()))
+        self._http.close()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="AlertDispatcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                alert = self._queue.popleft()
+                self._cond.notify_all()
+
+            self._deliver(alert)
+
+    def encode_snapshot(self, frame):
+        """Thu nhỏ (nếu cần) rồi encode JPEG với chất lượng cấu hình"""
+        h, w = frame.shape[:2]
+        max_width = THUMBNAIL_WIDTH if self.snapshot == "thumb" else self.snapshot_max_width
+        if max_width and w > max_width:
+            scale = max_width / w
+            frame = cv2.resize(frame, (max_width, int(h * scale)),
+                               interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("Khong encode duoc JPEG")
+        return buffer.tobytes()
+
+    def build_request(self, alert):
+        """Tạo body gửi server theo kiểu transport đã chọn"""
+        jpeg = None
+        if alert.frame is not None and self.snapshot != "none":
+            frame = alert.frame
+            if alert.render is not None:
+                frame = alert.render(frame.copy())
+            jpeg = self.encode_snapshot(frame)
+        payload = {
+            "status": alert.status,
+            "message": alert.message,
+            "timestamp": alert.timestamp,
+            "camera_id": alert.camera_id,
+        }
+        if alert.result is not None:
+            payload["detection"] = alert.result.to_dict()
+
+        if self.transport == "json":
+            if jpeg is not None:
+                payload["image_base64"] = base64.b64encode(jpeg).decode('utf-8')
+            return {"json": payload}
+
+        meta = json.dumps(payload).encode('utf-8')
+        return {
+            "data": struct.pack(">I", len(meta)) + meta + (jpeg or b""),
+            "headers": {"Content-Type": "application/octet-stream"},
+        }
+
+    def _deliver(self, alert):
+        try:
+            request_kwargs = self.build_request(alert)
+        except Exception as e:
+            self.failed += 1
+            print(f"[LỖI] Không tạo được cảnh báo: {e}")
+            return
+        alert.frame = None      # Giải phóng ảnh sớm
+
+        backoff = RETRY_BACKOFF
+        for attempt in range(self.max_retries + 1):
+            t0 = time.perf_counter()
+            try:
+                response = self._http.post(self.server_url, timeout=self.timeout, **request_kwargs)
+                if response.status_code < 400:
+                    self._record_latency((time.perf_counter() - t0) * 1000)
+                    self.sent += 1
+                    print(f">>> [GỬI SERVER] {alert.status}: {alert.message} ({response.status_code})")
+                    return
+                if response.status_code < 500:
+                    # Gửi lại cũng bị từ chối y như vậy -> không thử lại, không tính là đã gửi
+                    self.rejected += 1
+                    print(f"[BỊ TỪ CHỐI] {alert.status}: {alert.message} (HTTP {response.status_code})")
+                    return
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = e
+
+            if attempt == self.max_retries or self._stopping:
+                break
+            self.retries += 1
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+        self.failed += 1
+        print(f"[LỖI] Không gửi được: {error}")
+
+    def _record_latency(self, latency_ms):
+        self.last_latency_ms = latency_ms
+        self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+        self._total_latency_ms += latency_ms
+        self._latency_samples.append(latency_ms)
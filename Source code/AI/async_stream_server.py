@@ -0,0 +1,423 @@
+"""
+Server stream MJPEG dùng asyncio (thay cho Flask + 1 luồng / người xem)
+- Mỗi người xem chỉ là 1 coroutine -> giữ được hàng nghìn kết nối rảnh / chậm
+- Backpressure theo từng kết nối: chờ drain() xong mới gửi tiếp, luôn gửi
+  frame MỚI NHẤT (frame ở giữa bị bỏ), client treo quá lâu bị ngắt
+- Cùng route với webcam_stream.py: /stream (?fps=&width=&quality=) và /test
+- Nguồn: webcam máy tính (encode 1 lần qua StreamHub, ghi shared memory ring)
+  hoặc proxy stream MJPEG của ESP32-CAM (chuyển tiếp JPEG gốc, không encode lại)
+- Ctrl+C / SIGTERM: đóng kết nối, dừng luồng camera, giải phóng webcam
+
+Cách chạy:
+    python async_stream_server.py                                  # webcam 0
+    python async_stream_server.py --source http://192.168.1.50:81/stream
+Nhiều kết nối: tăng giới hạn file mở (ulimit -n) trên Linux.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+
+from stream_hub import StreamHub, DEFAULT_QUALITY
+
+
+# --- CẤU HÌNH ---
+STREAM_HOST = "0.0.0.0"
+STREAM_PORT = 5000
+MAX_CLIENTS = 5000            # Quá số này trả 503
+WRITE_BUFFER_HIGH = 256 * 1024  # Byte chờ gửi tối đa mỗi kết nối trước khi drain() chặn
+SLOW_CLIENT_TIMEOUT = 10.0    # drain() không xong sau chừng này giây -> ngắt client
+FRAME_WAIT_TIMEOUT = 2.0      # Không có frame mới -> cảnh báo
+HEADER_TIMEOUT = 5.0          # Thời gian tối đa nhận request line + header
+PROXY_RECONNECT_DELAY = 0.5
+PROXY_MAX_RECONNECT_DELAY = 5.0
+PROXY_MAX_FRAME = 4 * 1024 * 1024   # JPEG lớn nhất nhận từ nguồn (cũng là giới hạn bộ đọc asyncio)
+
+# Tên shared memory ring cho AI chạy cùng máy (giống webcam_stream.py), "" để tắt
+FRAME_RING_NAME = os.environ.get("FRAME_RING_NAME", "iot_webcam")
+
+BOUNDARY = b"frame"
+
+
+class FrameFeed:
+    """JPEG mới nhất + seq; mọi client cùng đọc 1 bytes object, chờ bằng future"""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._next = loop.create_future()
+        self.jpeg = None
+        self.seq = 0
+        self.clients = 0
+
+    def publish(self, jpeg):
+        self.jpeg = jpeg
+        self.seq += 1
+        future, self._next = self._next, self._loop.create_future()
+        future.set_result(None)
+
+    async def wait_newer(self, seq, timeout):
+        if self.seq != seq:
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(self._next), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class WebcamSource:
+    """
+    Webcam máy tính: luồng capture -> StreamHub (encode 1 lần / biến thể)
+    Mỗi biến thể (width, quality) là 1 subscriber của hub, chia cho mọi client cùng biến thể.
+    """
+
+    def __init__(self, loop, camera_index=0, width=640, height=480):
+        self.loop = loop
+        self.camera_index = camera_index
+        self.width = width
+        self.height = height
+        self.hub = StreamHub()
+        self.camera = None
+        self.ring = None
+        self._feeds = {}
+        self._running = False
+        self._thread = None
+
+    def open(self):
+        print('🔍 Đang tìm webcam...')
+        backend = cv2.CAP_DSHOW if sys.platform == "win32" else cv2.CAP_ANY
+        self.camera = cv2.VideoCapture(self.camera_index, backend)
+        if not self.camera.isOpened():
+            raise RuntimeError('KHÔNG THỂ MỞ WEBCAM!')
+        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        success, test_frame = self.camera.read()
+        if not success:
+            self.camera.release()
+            raise RuntimeError('KHÔNG THỂ ĐỌC FRAME TỪ WEBCAM!')
+
+        print(f'✅ Webcam đã sẵn sàng! ({test_frame.shape[1]}x{test_frame.shape[0]})')
+        if FRAME_RING_NAME:
+            from frame_ring import FrameRingWriter
+            self.ring = FrameRingWriter(FRAME_RING_NAME, test_frame.shape)
+            print(f'🧠 Shared memory ring: shm://{FRAME_RING_NAME}')
+
+        self.hub.start()
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name="WebcamCapture", daemon=True)
+        self._thread.start()
+
+    def _capture_loop(self):
+        while self._running:
+            success, frame = self.camera.read()
+            if not success:
+                print('⚠️ Lỗi đọc frame từ webcam')
+                time.sleep(0.1)
+                continue
+            if self.ring is not None:
+                self.ring.publish(frame)
+            self.hub.publish(frame)
+
+    def acquire(self, width=None, quality=DEFAULT_QUALITY):
+        key = (width, quality)
+        entry = self._feeds.get(key)
+        if entry is None:
+            feed = FrameFeed(self.loop)
+            sub = self.hub.subscribe(width=width, quality=quality, queue_size=1)
+            # Hub gọi on_frame từ luồng fan-out -> chuyển về event loop
+            sub.on_frame = lambda: self.loop.call_soon_threadsafe(self._forward, sub, feed)
+            entry = self._feeds[key] = (feed, sub)
+        entry[0].clients += 1
+        return entry[0]
+
+    def release(self, feed):
+        feed.clients -= 1
+        if feed.clients > 0:
+            return
+        for key, (f, sub) in list(self._feeds.items()):
+            if f is feed:
+                del self._feeds[key]
+                self.hub.unsubscribe(sub)
+
+    @staticmethod
+    def _forward(sub, feed):
+        jpeg = sub.pop()
+        if jpeg is not None:
+            feed.publish(jpeg)
+
+    async def close(self):
+        self._running = False
+        if self._thread is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._thread.join, 2)
+        self.hub.stop()
+        if self.camera is not None:
+            self.camera.release()
+        if self.ring is not None:
+            self.ring.close()
+        print('✅ Đã tắt webcam')
+
+
+class MjpegProxySource:
+    """
+    Proxy stream MJPEG (ESP32-CAM): đọc multipart, tách từng JPEG và phát lại nguyên bản.
+    width/quality của client bị bỏ qua (không decode / encode lại).
+    Part không có Content-Length: cắt theo boundary của multipart (JPEG có thể chứa FF D9 của
+    ảnh thu nhỏ EXIF), nguồn không khai báo boundary mới cắt theo marker kết thúc JPEG.
+    """
+
+    def __init__(self, loop, url):
+        self.loop = loop
+        self.url = url
+        self.feed = FrameFeed(loop)
+        self._task = None
+
+    def open(self):
+        self._task = self.loop.create_task(self._run())
+
+    def acquire(self, width=None, quality=DEFAULT_QUALITY):
+        self.feed.clients += 1
+        return self.feed
+
+    def release(self, feed):
+        feed.clients -= 1
+
+    async def _run(self):
+        delay = PROXY_RECONNECT_DELAY
+        while True:
+            try:
+                await self._read_stream()
+                delay = PROXY_RECONNECT_DELAY
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f'⚠️ Mất kết nối nguồn {self.url}: {e}')
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, PROXY_MAX_RECONNECT_DELAY)
+
+    async def _read_stream(self):
+        parts = urlsplit(self.url)
+        port = parts.port or 80
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        # Giới hạn mặc định của StreamReader là 64 KiB: readuntil() với JPEG lớn hơn sẽ lỗi
+        reader, writer = await asyncio.open_connection(parts.hostname, port, limit=PROXY_MAX_FRAME)
+        try:
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {parts.hostname}\r\n"
+                         f"Connection: close\r\n\r\n".encode())
+            await writer.drain()
+            status = await reader.readline()
+            if b" 200 " not in status:
+                raise ConnectionError(status.decode(errors="replace").strip())
+            response_headers = await reader.readuntil(b"\r\n\r\n")
+            delimiter = None
+            for line in response_headers.split(b"\r\n"):
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-type" and b"boundary=" in value:
+                    boundary = value.split(b"boundary=", 1)[1].split(b";")[0].strip().strip(b'"')
+                    if boundary.startswith(b"--"):
+                        boundary = boundary[2:]      # Một số nguồn khai báo kèm "--"
+                    delimiter = b"\r\n--" + boundary
+            print(f'✅ Đã kết nối nguồn {self.url}')
+
+            while True:
+                headers = await reader.readuntil(b"\r\n\r\n")
+                length = None
+                for line in headers.split(b"\r\n"):
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        length = int(value)
+                if length is not None:
+                    if length > PROXY_MAX_FRAME:
+                        raise ValueError(f"Frame {length} byte vượt PROXY_MAX_FRAME")
+                    jpeg = await reader.readexactly(length)
+                elif delimiter is not None:
+                    # Không có Content-Length -> dữ liệu tới dòng boundary kế tiếp
+                    jpeg = (await reader.readuntil(delimiter))[:-len(delimiter)]
+                else:
+                    jpeg = await reader.readuntil(b"\xff\xd9")
+                self.feed.publish(jpeg)
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def _query_number(query, name, cast, default=None):
+    try:
+        value = cast(query.get(name, [default])[0])
+    except (TypeError, ValueError):
+        return default
+    return value if value and value > 0 else default
+
+
+class StreamServer:
+    def __init__(self, source, host=STREAM_HOST, port=STREAM_PORT, max_clients=MAX_CLIENTS):
+        self.source = source
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self._server = None
+        self._clients = set()
+
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.slow_disconnects = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                  backlog=1024)
+        print(f'🎥 Stream đang chạy tại http://localhost:{self.port}/stream')
+        print(f'🔗 Test endpoint: http://localhost:{self.port}/test')
+
+    async def shutdown(self):
+        print('\n⏹️  Đang tắt server stream...')
+        if self._server is not None:
+            self._server.close()
+        for task in list(self._clients):
+            task.cancel()
+        if self._clients:
+            await asyncio.gather(*self._clients, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+        await self.source.close()
+        print(f'📊 Đã gửi {self.frames_sent} frame, bỏ {self.frames_skipped} frame '
+              f'cho client chậm, ngắt {self.slow_disconnects} client treo')
+
+    async def _handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            try:
+                request_line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+                await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEADER_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+
+            method, _, rest = request_line.decode("latin-1").partition(" ")
+            target = rest.split(" ", 1)[0]
+            url = urlsplit(target)
+
+            if method != "GET":
+                await self._respond(writer, "405 Method Not Allowed", b"")
+            elif url.path == "/test":
+                await self._respond(writer, "200 OK", '✅ Webcam server đang hoạt động'.encode())
+            elif url.path == "/stream":
+                if len(self._clients) > self.max_clients:
+                    await self._respond(writer, "503 Service Unavailable", b"Too many clients")
+                else:
+                    await self._stream(writer, parse_qs(url.query))
+            else:
+                await self._respond(writer, "404 Not Found", b"Not found")
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def _stream(self, writer, query):
+        fps = _query_number(query, "fps", float)
+        width = _query_number(query, "width", int)
+        quality = min(_query_number(query, "quality", int, DEFAULT_QUALITY), 100)
+        interval = 1.0 / fps if fps else 0.0
+
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: multipart/x-mixed-replace; boundary=" + BOUNDARY + b"\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+
+        feed = self.source.acquire(width, quality)
+        last_seq = 0
+        last_sent = 0.0
+        try:
+            while True:
+                if interval:
+                    wait = last_sent + interval - time.monotonic()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                if not await feed.wait_newer(last_seq, FRAME_WAIT_TIMEOUT):
+                    continue
+
+                # Luôn lấy frame mới nhất: các frame đến trong lúc client bận bị bỏ
+                if last_seq:
+                    self.frames_skipped += feed.seq - last_seq - 1
+                last_seq, jpeg = feed.seq, feed.jpeg
+                last_sent = time.monotonic()
+
+                writer.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n"
+                             b"Content-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n")
+                writer.write(jpeg)
+                writer.write(b"\r\n")
+                try:
+                    await asyncio.wait_for(writer.drain(), SLOW_CLIENT_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self.slow_disconnects += 1
+                    return
+                self.frames_sent += 1
+        finally:
+            self.source.release(feed)
+
+
+async def serve(args):
+    loop = asyncio.get_running_loop()
+    if args.source:
+        source = MjpegProxySource(loop, args.source)
+        print(f'🔁 Proxy stream từ {args.source}')
+    else:
+        source = WebcamSource(loop, args.camera)
+    source.open()
+
+    server = StreamServer(source, args.host, args.port)
+    await server.start()
+
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            pass        # Windows: Ctrl+C đi qua KeyboardInterrupt
+    print('\n⌨️  Nhấn Ctrl+C để dừng server\n')
+    try:
+        await stop.wait()
+    finally:
+        await server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server stream MJPEG asyncio")
+    parser.add_argument("--source", default=os.environ.get("STREAM_SOURCE"),
+                        help="URL stream MJPEG để proxy (ESP32-CAM). Bỏ trống = webcam máy tính")
+    parser.add_argument("--camera", type=int, default=0, help="Chỉ số webcam")
+    parser.add_argument("--host", default=STREAM_HOST)
+    parser.add_argument("--port", type=int, default=STREAM_PORT)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(f'❌ {e}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
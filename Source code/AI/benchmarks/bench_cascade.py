@@ -0,0 +1,68 @@
+"""
+Benchmark: Holistic đầy đủ vs Cascade (Pose + Face Mesh vùng đầu khi cần)
+In ra độ trễ mỗi frame (wall-clock) và thời gian CPU mỗi frame (mọi luồng của process)
+
+Cách chạy:
+    python benchmarks/bench_cascade.py video_ghi_lai.mp4 [--frames 300] [--complexity 0]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_processor import AIProcessor  # noqa: E402
+from bench_frame_context import load_frames  # noqa: E402
+
+
+def run(frames, backend, complexity):
+    processor = AIProcessor(backend=backend, pose_model_complexity=complexity)
+    processor.alerts.enabled = False   # Không gửi server khi benchmark
+    processor.process_frame(frames[0], camera_id=backend)   # Warm-up
+
+    latencies, cpu = [], []
+    for frame in frames:
+        t0, c0 = time.perf_counter(), time.process_time()
+        processor.process_frame(frame, camera_id=backend)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        cpu.append((time.process_time() - c0) * 1000)
+
+    graph = processor.sessions.get_graph(backend)
+    face_runs = getattr(graph, "face_runs", None)
+    processor.sessions.close()
+    return np.array(latencies), np.array(cpu), face_runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Holistic vs Cascade")
+    parser.add_argument("video", help="Video ghi lại (mp4/avi...)")
+    parser.add_argument("--frames", type=int, default=300, help="Số frame tối đa")
+    parser.add_argument("--complexity", type=int, default=1, help="model_complexity của Pose (0/1/2)")
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.frames)
+    if not frames:
+        print(f"❌ Không đọc được frame nào từ {args.video}")
+        sys.exit(1)
+
+    print(f"🎞️  {len(frames)} frame từ {args.video}\n")
+    results = {}
+    for backend in ("holistic", "cascade"):
+        results[backend] = run(frames, backend, args.complexity)
+
+    for backend, (latencies, cpu, face_runs) in results.items():
+        extra = f"  face_mesh={face_runs}/{len(frames)}" if face_runs is not None else ""
+        print(f"{backend:<9} mean={latencies.mean():7.2f} ms  "
+              f"p95={np.percentile(latencies, 95):7.2f} ms  "
+              f"cpu={cpu.mean():7.2f} ms/frame  "
+              f"fps={1000 / latencies.mean():6.1f}{extra}")
+
+    before, after = results["holistic"][0].mean(), results["cascade"][0].mean()
+    print(f"\n⚡ Cascade nhanh hơn {before / after:.2f}x ({before - after:.2f} ms/frame)")
+
+
+if __name__ == "__main__":
+    main()
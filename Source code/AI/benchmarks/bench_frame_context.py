@@ -0,0 +1,110 @@
+"""
+Benchmark: độ trễ mỗi frame TRƯỚC / SAU khi dùng FrameContext
+- Trước: mỗi lần truy cập đều tính lại (RGB, grayscale), dò tường đầy đủ (Canny + Hough)
+          mỗi frame + thêm 1 lần trong check_pose_logic khi có người, không WallTracker
+- Sau:   mỗi ảnh dẫn xuất chỉ tính 1 lần / frame, tường lấy từ WallTracker và truyền vào
+          check_pose_logic
+
+Cách chạy:
+    python benchmarks/bench_frame_context.py video_ghi_lai.mp4 [--frames 300]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_processor  # noqa: E402
+from frame_context import FrameContext  # noqa: E402
+
+
+class UncachedFrameContext(FrameContext):
+    """Mô phỏng đường xử lý cũ: không lưu lại kết quả nào"""
+
+    @property
+    def rgb(self):
+        return cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB)
+
+    @property
+    def gray(self):
+        return cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+
+    def cached(self, key, compute):
+        return compute()
+
+
+class UncachedProcessor(ai_processor.AIProcessor):
+    """Mô phỏng đường xử lý cũ: dò tường lại mỗi lần cần, không qua WallTracker"""
+
+    def get_wall(self, ctx, tracker=None):
+        self._ctx = ctx
+        return self.detect_wall_region(ctx.frame, ctx)
+
+    def check_pose_logic(self, keypoints, wall_y):
+        has_wall, wall_y = self.detect_wall_region(self._ctx.frame, self._ctx)
+        return super().check_pose_logic(keypoints, wall_y if has_wall else None)
+
+
+def load_frames(path, max_frames):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run(frames, context_cls, processor_cls, label):
+    ai_processor.FrameContext = context_cls
+    processor = processor_cls()
+    processor.alerts.enabled = False   # Không gửi server khi benchmark
+
+    # Warm-up (load model MediaPipe)
+    processor.process_frame(frames[0], camera_id=label)
+
+    latencies = []
+    for frame in frames:
+        t0 = time.perf_counter()
+        processor.process_frame(frame, camera_id=label)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    processor.sessions.close()
+    return np.array(latencies)
+
+
+def report(label, latencies):
+    print(f"{label:<8} mean={latencies.mean():7.2f} ms  "
+          f"p50={np.percentile(latencies, 50):7.2f} ms  "
+          f"p95={np.percentile(latencies, 95):7.2f} ms  "
+          f"fps={1000 / latencies.mean():6.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FrameContext")
+    parser.add_argument("video", help="Video ghi lại (mp4/avi...)")
+    parser.add_argument("--frames", type=int, default=300, help="Số frame tối đa")
+    args = parser.parse_args()
+
+    frames = load_frames(args.video, args.frames)
+    if not frames:
+        print(f"❌ Không đọc được frame nào từ {args.video}")
+        sys.exit(1)
+
+    print(f"🎞️  {len(frames)} frame từ {args.video}\n")
+    before = run(frames, UncachedFrameContext, UncachedProcessor, "before")
+    after = run(frames, FrameContext, ai_processor.AIProcessor, "after")
+
+    report("TRƯỚC", before)
+    report("SAU", after)
+    print(f"\n⚡ Giảm {before.mean() - after.mean():.2f} ms/frame "
+          f"({(1 - after.mean() / before.mean()) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
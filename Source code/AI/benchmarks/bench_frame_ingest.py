@@ -0,0 +1,153 @@
+"""
+Benchmark: giải mã JPEG đầu vào TRƯỚC / SAU khi dùng frame_ingest
+- Trước: imdecode BGR đầy đủ + cvtColor RGB + cvtColor xám (mảng mới mỗi frame),
+         điểm chuyển động tính từ ảnh BGR đầy đủ
+- Sau, frame suy luận (đường của inference_worker): BGR giải mã thu nhỏ (nếu ảnh lớn hơn
+         INFERENCE_WIDTH), RGB / xám ghi vào bộ đệm dùng lại (BufferPool)
+- Sau, frame bỏ qua (cảnh tĩnh): chỉ giải mã ảnh xám 1/8 để tính điểm chuyển động
+- Tham khảo (worker KHÔNG dùng): giải mã thẳng ra RGB (IMREAD_COLOR_RGB), không có ảnh BGR
+Đo thời gian giải mã + chuyển màu và số lần cấp phát mảng NumPy mỗi frame (tracemalloc),
+tách riêng phần của imdecode (luôn là mảng mới: cv2.imdecode của Python không nhận dst).
+
+Cách chạy:
+    python benchmarks/bench_frame_ingest.py video.mp4 [--width 1280] [--frames 200] [--quality 80]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_context import FrameContext  # noqa: E402
+from frame_ingest import BufferPool, FrameIngest, jpeg_size, reduction_for  # noqa: E402
+from scheduler import THUMB_SIZE  # noqa: E402
+
+
+def load_jpegs(path, width, quality, max_frames):
+    """Đọc video, đổi kích thước, encode lại thành JPEG như camera gửi lên"""
+    cap = cv2.VideoCapture(path)
+    jpegs = []
+    while len(jpegs) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        h, w = frame.shape[:2]
+        frame = cv2.resize(frame, (width, int(h * width / w)))
+        jpegs.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    cap.release()
+    return jpegs
+
+
+def before(jpeg, state):
+    frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    thumb = cv2.cvtColor(cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA),
+                         cv2.COLOR_BGR2GRAY)
+    ctx = FrameContext(frame)
+    return frame, thumb, ctx.rgb, ctx.gray
+
+
+def after_inferred(jpeg, state):
+    ingest, pool = state
+    ingest.begin_frame()
+    frame = ingest.decode(jpeg)
+    thumb = cv2.cvtColor(cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA),
+                         cv2.COLOR_BGR2GRAY)
+    ctx = FrameContext(frame, pool)
+    return frame, thumb, ctx.rgb, ctx.gray
+
+
+def decode_only(jpeg, state):
+    """Chỉ phần giải mã của đường worker (BGR)"""
+    ingest, _ = state
+    ingest.begin_frame()
+    return ingest.decode(jpeg)
+
+
+def rgb_decode(jpeg, state):
+    ingest, _ = state
+    ingest.begin_frame()
+    return ingest.decode(jpeg, color="rgb")
+
+
+def after_skipped(jpeg, state):
+    ingest, _ = state
+    ingest.begin_frame()
+    gray_small = ingest.motion_gray(jpeg)
+    return gray_small, cv2.resize(gray_small, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+
+
+def count_allocations(path_fn, jpegs, state):
+    """Số mảng NumPy được cấp phát mới mỗi frame (vết tracemalloc trong domain của NumPy)"""
+    domain = tracemalloc.DomainFilter(True, np.lib.tracemalloc_domain)
+    tracemalloc.start()
+    path_fn(jpegs[0], state)     # Warm-up: bộ đệm được cấp phát lần đầu
+    total = 0
+    outputs = None
+    for jpeg in jpegs[:50]:
+        outputs = None
+        snap_before = tracemalloc.take_snapshot().filter_traces([domain])
+        outputs = path_fn(jpeg, state)
+        snap_after = tracemalloc.take_snapshot().filter_traces([domain])
+        total += sum(max(0, s.count_diff) for s in snap_after.compare_to(snap_before, "traceback"))
+    del outputs
+    tracemalloc.stop()
+    return total / min(50, len(jpegs))
+
+
+def time_path(path_fn, jpegs, state):
+    latencies = []
+    for jpeg in jpegs:
+        t0 = time.perf_counter()
+        path_fn(jpeg, state)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame_ingest")
+    parser.add_argument("video", help="Video ghi lại (mp4/avi...)")
+    parser.add_argument("--width", type=int, default=1280, help="Chiều rộng ảnh JPEG giả lập")
+    parser.add_argument("--quality", type=int, default=80, help="Chất lượng JPEG")
+    parser.add_argument("--frames", type=int, default=200, help="Số frame tối đa")
+    args = parser.parse_args()
+
+    jpegs = load_jpegs(args.video, args.width, args.quality, args.frames)
+    if not jpegs:
+        print(f"❌ Không đọc được frame nào từ {args.video}")
+        sys.exit(1)
+    print(f"🎞️  {len(jpegs)} JPEG {args.width}px (q={args.quality}) từ {args.video}\n")
+
+    state = (FrameIngest(), BufferPool())
+    paths = [("TRƯỚC", before, None),
+             ("SAU - suy luận", after_inferred, state),
+             ("SAU - bỏ qua", after_skipped, state),
+             ("(giải mã RGB)", rgb_decode, state)]
+    results = {}
+    for label, path_fn, state in paths:
+        time_path(path_fn, jpegs[:10], state)    # Warm-up
+        latencies = time_path(path_fn, jpegs, state)
+        allocations = count_allocations(path_fn, jpegs, state)
+        results[label] = latencies
+        print(f"{label:<15} giải mã + màu: mean={latencies.mean():6.2f} ms  "
+              f"p95={np.percentile(latencies, 95):6.2f} ms  | cấp phát: {allocations:.1f} mảng/frame")
+
+    decode_allocations = count_allocations(decode_only, jpegs, state)
+    print(f"\n🧮 Worker (SAU - suy luận): {decode_allocations:.1f} mảng/frame từ imdecode BGR (không có dst),"
+          f" RGB / xám dùng lại BufferPool; dòng (giải mã RGB) chỉ để tham khảo, worker không dùng")
+
+    width, height = jpeg_size(jpegs[0])
+    factor = reduction_for(width)
+    print(f"📐 Ảnh suy luận: {width // factor}x{height // factor} (giải mã thu nhỏ 1/{factor})")
+    base = results["TRƯỚC"].mean()
+    for label in ("SAU - suy luận", "SAU - bỏ qua"):
+        print(f"⚡ {label}: giảm {base - results[label].mean():.2f} ms/frame "
+              f"({(1 - results[label].mean() / base) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
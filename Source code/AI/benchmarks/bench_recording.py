@@ -0,0 +1,166 @@
+"""
+Benchmark: kho ghi hình recording.py - ghi liên tục + lấy frame quanh 1 thời điểm cảnh báo
+- Ghi: thời gian append() trên luồng suy luận (µs / frame) và tốc độ luồng nền ghi đĩa
+- Tìm: frames_around(ts, 5 s trước, 5 s sau) tại thời điểm ngẫu nhiên
+  so với cách thường gặp: 1 file MJPEG .avi mỗi phút, VideoCapture tua tới frame rồi đọc (giải mã)
+  100 frame
+- Kích thước chỉ mục so với dữ liệu
+
+Cách chạy:
+    python benchmarks/bench_recording.py video.mp4 [--minutes 10] [--fps 10] [--width 640] [--lookups 50]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recording import INDEX_RECORD, Recorder  # noqa: E402
+
+
+CAMERA_ID = "bench"
+START_TIME = 1_700_000_000.0
+
+
+def load_frames(path, width, count=100):
+    """Vài frame thật (JPEG + BGR đã giải mã) để lặp lại -> kích thước JPEG giống camera"""
+    cap = cv2.VideoCapture(path)
+    jpegs, images = [], []
+    while len(jpegs) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        h, w = frame.shape[:2]
+        frame = cv2.resize(frame, (width, int(h * width / w)))
+        jpegs.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes())
+        images.append(frame)
+    cap.release()
+    return jpegs, images
+
+
+def write_archive(directory, jpegs, total, fps):
+    recorder = Recorder(directory, fps=fps)
+    append_times = []
+    t_start = time.perf_counter()
+    for i in range(total):
+        t0 = time.perf_counter()
+        recorder.append(CAMERA_ID, START_TIME + i / fps, jpeg=jpegs[i % len(jpegs)])
+        append_times.append(time.perf_counter() - t0)
+        if recorder._queue_bytes > recorder.max_queue_bytes // 2:
+            time.sleep(0.001)         # Nhường luồng ghi (camera thật không gửi dồn như vậy)
+    recorder.close(timeout=600)
+    elapsed = time.perf_counter() - t_start
+    return recorder, np.array(append_times) * 1e6, elapsed
+
+
+def write_avi(directory, images, total, fps):
+    """Cách so sánh: 1 file MJPEG .avi mỗi phút"""
+    per_file = int(60 * fps)
+    size = (images[0].shape[1], images[0].shape[0])
+    writer = None
+    for i in range(total):
+        if i % per_file == 0:
+            if writer is not None:
+                writer.release()
+            path = os.path.join(directory, f"{i // per_file:05d}.avi")
+            writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+        writer.write(images[i % len(images)])
+    writer.release()
+    return per_file
+
+
+def lookup_avi(directory, per_file, fps, ts, before, after):
+    first = max(0, int((ts - before - START_TIME) * fps))
+    last = int((ts + after - START_TIME) * fps)
+    frames = []
+    cap, current = None, None
+    for index in range(first, last + 1):
+        file_no, position = divmod(index, per_file)
+        if file_no != current:
+            if cap is not None:
+                cap.release()
+            cap, current = cv2.VideoCapture(os.path.join(directory, f"{file_no:05d}.avi")), file_no
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    if cap is not None:
+        cap.release()
+    return frames
+
+
+def percentiles(values):
+    return f"p50={np.percentile(values, 50):7.2f}  p95={np.percentile(values, 95):7.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark kho ghi hình recording.py")
+    parser.add_argument("video", help="Video mẫu (mp4/avi...)")
+    parser.add_argument("--minutes", type=float, default=10, help="Số phút ghi giả lập")
+    parser.add_argument("--fps", type=float, default=10, help="Số frame ghi mỗi giây")
+    parser.add_argument("--width", type=int, default=640, help="Chiều rộng frame")
+    parser.add_argument("--lookups", type=int, default=50, help="Số lần tìm ngẫu nhiên")
+    parser.add_argument("--dir", help="Thư mục tạm (mặc định: thư mục tạm của hệ thống)")
+    args = parser.parse_args()
+
+    jpegs, images = load_frames(args.video, args.width)
+    if not jpegs:
+        print(f"❌ Không đọc được frame nào từ {args.video}")
+        sys.exit(1)
+    total = int(args.minutes * 60 * args.fps)
+    workdir = tempfile.mkdtemp(prefix="bench_recording_", dir=args.dir)
+    archive_dir = os.path.join(workdir, "segments")
+    avi_dir = os.path.join(workdir, "avi")
+    os.makedirs(avi_dir)
+    print(f"🎞️  {total} frame {args.width}px ({args.minutes:g} phút, {args.fps:g} fps), "
+          f"JPEG trung bình {np.mean([len(j) for j in jpegs]) / 1024:.1f} KB\n")
+
+    try:
+        recorder, append_us, elapsed = write_archive(archive_dir, jpegs, total, args.fps)
+        data_bytes = recorder.stats()["bytes"]
+        index_bytes = recorder.stats()["written"] * INDEX_RECORD.size
+        segments = len(recorder.archive.segments(CAMERA_ID))
+        print(f"✍️  Ghi: append() {percentiles(append_us)} µs | luồng ghi {total / elapsed:,.0f} frame/s "
+              f"({data_bytes / elapsed / 1024 / 1024:.0f} MB/s), bỏ {recorder.stats()['dropped']} frame")
+        print(f"📦 {segments} segment, dữ liệu {data_bytes / 1024 / 1024:.1f} MB, "
+              f"chỉ mục {index_bytes / 1024:.1f} KB ({INDEX_RECORD.size} byte / frame)")
+
+        per_file = write_avi(avi_dir, images, total, args.fps)
+
+        rng = random.Random(0)
+        duration = total / args.fps
+        times = [START_TIME + rng.uniform(5, duration - 5) for _ in range(args.lookups)]
+        archive = recorder.archive
+        archive.frames_around(CAMERA_ID, times[0])          # Warm-up
+        lookup_avi(avi_dir, per_file, args.fps, times[0], 5, 5)
+
+        seg_ms, avi_ms = [], []
+        seg_count = avi_count = 0
+        for ts in times:
+            t0 = time.perf_counter()
+            seg_count += len(archive.frames_around(CAMERA_ID, ts, 5, 5))
+            seg_ms.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            avi_count += len(lookup_avi(avi_dir, per_file, args.fps, ts, 5, 5))
+            avi_ms.append((time.perf_counter() - t0) * 1000)
+
+        print(f"\n🔎 Lấy frame ±5 s quanh thời điểm ngẫu nhiên ({args.lookups} lần):")
+        print(f"   {'Segment + chỉ mục (mmap)':<26} {percentiles(seg_ms)} ms  "
+              f"[{seg_count / args.lookups:.0f} JPEG / lần]")
+        print(f"   {'MJPEG .avi mỗi phút + tua':<26} {percentiles(avi_ms)} ms  "
+              f"[{avi_count / args.lookups:.0f} ảnh giải mã / lần]")
+        print(f"⚡ Nhanh hơn {np.median(avi_ms) / np.median(seg_ms):.0f} lần (trung vị)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
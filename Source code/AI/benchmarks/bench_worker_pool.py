@@ -0,0 +1,114 @@
+"""
+Benchmark: khởi động pool worker của dịch vụ AI - spawn vs forkserver (process mẫu nạp sẵn)
+- Khởi động: thời gian từ start tới khi cả N worker báo "ready" (forkserver: gồm cả dựng process mẫu)
+- Frame đầu: thời gian xử lý frame đầu tiên của mỗi camera (gồm tạo graph MediaPipe của camera)
+- Thêm worker: scale_to(N + 1) tới khi worker mới sẵn sàng (camera mới)
+- Bộ nhớ worker: tổng RSS (đếm trùng trang dùng chung) và tổng PSS (chia đều trang dùng chung, Linux),
+  forkserver: thêm PSS của process mẫu để so sánh công bằng
+
+Cách chạy:
+    python benchmarks/bench_worker_pool.py [--workers 4] [--methods spawn,forkserver] [--image anh.jpg]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def read_memory_kb(pid):
+    """(RSS, PSS) của process theo kB từ /proc; PSS = None nếu không đọc được (không phải Linux)"""
+    rss = pss = None
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    rss = int(line.split()[1])
+                elif line.startswith("Pss:"):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+def load_jpeg(path):
+    if path:
+        with open(path, "rb") as f:
+            return f.read()
+    frame = np.full((480, 640, 3), 90, dtype=np.uint8)
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+def wait_ready(pool, count, timeout=120.0):
+    deadline = time.perf_counter() + timeout
+    while pool.ready_count() < count:
+        if time.perf_counter() > deadline:
+            raise TimeoutError(f"Chỉ {pool.ready_count()}/{count} worker sẵn sàng sau {timeout:.0f}s")
+        time.sleep(0.001)
+
+
+def run(method, workers, jpeg):
+    # Import trong hàm như ai_processor.py: worker chạy lại thân script chính, không tạo app Flask ở đó
+    from inference_service import InferencePool
+
+    pool = InferencePool(num_workers=workers, start_method=method, max_workers=workers + 1)
+    t0 = time.perf_counter()
+    pool.start()
+    wait_ready(pool, workers)
+    startup = time.perf_counter() - t0
+
+    # 1 camera mỗi worker: frame đầu tiên gồm cả tạo graph của camera
+    t0 = time.perf_counter()
+    futures = [pool.submit(f"cam{i}", jpeg) for i in range(workers)]
+    for future in futures:
+        future.result(timeout=60)
+    first_frame = time.perf_counter() - t0
+
+    memory = [read_memory_kb(pid) for pid in pool.worker_pids()]
+    template_pss = None
+    if pool.start_method == "forkserver":
+        from multiprocessing import forkserver
+        template_pss = read_memory_kb(forkserver._forkserver._forkserver_pid)[1]
+
+    t0 = time.perf_counter()
+    pool.scale_to(workers + 1)
+    wait_ready(pool, workers + 1)
+    scale_up = time.perf_counter() - t0
+
+    pool.stop()
+    rss = sum(m[0] or 0 for m in memory)
+    pss = sum(m[1] or 0 for m in memory) if all(m[1] is not None for m in memory) else None
+    if pss is not None and template_pss is not None:
+        pss += template_pss
+    return {"method": pool.start_method, "startup": startup, "first_frame": first_frame,
+            "scale_up": scale_up, "rss_mb": rss / 1024, "pss_mb": pss / 1024 if pss is not None else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pool worker spawn / forkserver")
+    parser.add_argument("--workers", type=int, default=4, help="Số worker")
+    parser.add_argument("--methods", default="spawn,forkserver", help="Các cách start, cách nhau bởi dấu phẩy")
+    parser.add_argument("--image", help="Ảnh JPEG gửi thử (mặc định: ảnh xám 640x480)")
+    args = parser.parse_args()
+
+    jpeg = load_jpeg(args.image)
+    print(f"🧪 {args.workers} worker, CPU: {os.cpu_count()}, "
+          f"hỗ trợ: {', '.join(multiprocessing.get_all_start_methods())}\n")
+
+    rows = [run(m.strip(), args.workers, jpeg) for m in args.methods.split(",") if m.strip()]
+
+    print(f"\n{'Cách start':<12} {'Khởi động':>10} {'Frame đầu':>10} {'Thêm 1 worker':>14} "
+          f"{'RSS worker':>11} {'PSS (+mẫu)':>11}")
+    for r in rows:
+        pss = f"{r['pss_mb']:8.0f} MB" if r["pss_mb"] is not None else f"{'-':>11}"
+        print(f"{r['method']:<12} {r['startup'] * 1000:8.0f} ms {r['first_frame'] * 1000:7.0f} ms "
+              f"{r['scale_up'] * 1000:11.0f} ms {r['rss_mb']:8.0f} MB {pss}")
+
+
+if __name__ == "__main__":
+    main()
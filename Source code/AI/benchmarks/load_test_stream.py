@@ -0,0 +1,124 @@
+"""
+Load test server stream MJPEG: FPS nhận được mỗi client khi số kết nối tăng dần
+- Mở N kết nối đồng thời tới /stream, đếm frame mỗi kết nối trong D giây
+- Một phần client có thể đọc chậm (--slow) để kiểm tra backpressure:
+  client chậm không được kéo FPS của client nhanh xuống
+
+Cách chạy:
+    python benchmarks/load_test_stream.py http://localhost:5000/stream --clients 1,10,100,500
+    python benchmarks/load_test_stream.py http://localhost:5000/stream?fps=5&width=320 --slow 0.2
+Nhiều kết nối: tăng giới hạn file mở (ulimit -n) ở cả máy chạy test và máy server.
+"""
+import argparse
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+MARKER = b"Content-Type: image/jpeg"
+READ_SIZE = 64 * 1024
+
+
+async def run_client(url, duration, slow_delay, ready):
+    """Trả về số frame nhận được trong duration giây (None nếu lỗi kết nối)"""
+    parts = urlsplit(url)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    try:
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80,
+                                                       limit=READ_SIZE)
+    except OSError:
+        ready.release()
+        return None
+    ready.release()
+
+    frames = 0
+    tail = b""
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {parts.hostname}\r\n\r\n".encode())
+        status = await reader.readline()
+        if b" 200 " not in status:
+            return None
+        deadline = time.monotonic() + duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                chunk = await asyncio.wait_for(reader.read(READ_SIZE), remaining)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data = tail + chunk
+            frames += data.count(MARKER)
+            tail = data[-(len(MARKER) - 1):]
+            if slow_delay:
+                await asyncio.sleep(slow_delay)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+    return frames
+
+
+async def run_level(url, clients, duration, slow_fraction, slow_delay):
+    ready = asyncio.Semaphore(0)
+    n_slow = int(clients * slow_fraction)
+    tasks = [
+        asyncio.create_task(run_client(url, duration, slow_delay if i < n_slow else 0, ready))
+        for i in range(clients)
+    ]
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - t0
+
+    failed = sum(r is None for r in results)
+    fast = np.array([r for i, r in enumerate(results) if r is not None and i >= n_slow], dtype=float)
+    slow = np.array([r for i, r in enumerate(results) if r is not None and i < n_slow], dtype=float)
+    return {
+        "clients": clients,
+        "failed": failed,
+        "fast_fps": fast / duration if len(fast) else fast,
+        "slow_fps": slow / duration if len(slow) else slow,
+        "elapsed": elapsed,
+    }
+
+
+def print_level(result):
+    fast = result["fast_fps"]
+    line = f"{result['clients']:>6}  lỗi={result['failed']:<4}"
+    if len(fast):
+        line += (f"  FPS/client: mean={fast.mean():6.2f}  min={fast.min():6.2f}  "
+                 f"p5={np.percentile(fast, 5):6.2f}  tổng={fast.sum():8.1f}")
+    if len(result["slow_fps"]):
+        line += f"  | chậm: mean={result['slow_fps'].mean():5.2f}"
+    print(line)
+
+
+async def main_async(args):
+    levels = [int(x) for x in args.clients.split(",")]
+    print(f"🎯 {args.url} - {args.duration}s mỗi mức, {args.slow * 100:.0f}% client chậm\n")
+    print("Client  kết quả")
+    for clients in levels:
+        result = await run_level(args.url, clients, args.duration, args.slow, args.slow_delay)
+        print_level(result)
+        await asyncio.sleep(1.0)   # Cho server dọn kết nối cũ
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test stream MJPEG")
+    parser.add_argument("url", help="VD: http://localhost:5000/stream")
+    parser.add_argument("--clients", default="1,10,50,100,250,500",
+                        help="Các mức số kết nối, cách nhau bởi dấu phẩy")
+    parser.add_argument("--duration", type=float, default=10.0, help="Số giây đo mỗi mức")
+    parser.add_argument("--slow", type=float, default=0.0, help="Tỉ lệ client đọc chậm (0-1)")
+    parser.add_argument("--slow-delay", type=float, default=0.5,
+                        help="Client chậm nghỉ bao lâu sau mỗi lần đọc (giây)")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Đọc camera trên luồng riêng, luôn trả về frame MỚI NHẤT
+- Vòng lặp AI chậm hơn camera -> frame cũ bị bỏ (có đếm), không bị dồn buffer
+- Mất kết nối -> tự kết nối lại trong luồng nền (backoff), không chặn vòng lặp AI
+- Dùng được cho cả webcam (CAMERA_ID) và stream URL (VIDEO_STREAM_URL)
+- Nguồn "shm://<tên>" đọc thẳng từ shared memory ring (xem frame_ring.py)
+"""
+import threading
+import time
+
+import cv2
+
+
+# --- CẤU HÌNH ---
+RECONNECT_DELAY = 0.5       # Chờ trước lần kết nối lại đầu tiên (giây)
+MAX_RECONNECT_DELAY = 5.0   # Chờ tối đa giữa các lần kết nối lại
+
+
+def parse_source(source):
+    """Giá trị từ biến môi trường / dòng lệnh: "1" -> webcam số 1 (không phải file tên "1")"""
+    if isinstance(source, str) and source.strip().isdigit():
+        return int(source.strip())
+    return source
+
+
+def open_frame_source(source, width=None, height=None, backend=None, name="camera"):
+    """
+    Tạo nguồn frame phù hợp:
+    - "shm://<tên ring>": đọc từ webcam_stream.py chạy cùng máy (1 lần copy: frame bị giữ lại
+      trong hàng chờ cảnh báo / clip bằng chứng, slot của ring sẽ bị ghi đè sau vài frame)
+    - số (webcam, nhận cả chuỗi "0", "1"...) hoặc URL: LatestFrameReader
+    """
+    source = parse_source(source)
+    if isinstance(source, str) and source.startswith("shm://"):
+        from frame_ring import RingFrameSource
+        return RingFrameSource(source[len("shm://"):], copy=True).start()
+    return LatestFrameReader(source, width=width, height=height, backend=backend, name=name).start()
+
+
+class LatestFrameReader:
+    def __init__(self, source, width=None, height=None, backend=None, name="camera"):
+        self.source = source
+        self.width = width
+        self.height = height
+        self.backend = backend
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._cap = None
+        self._frame = None
+        self._seq = 0
+        self._last_returned_seq = 0
+
+        self.connected = False
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"Capture-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        self._release()
+
+    def read(self, timeout=1.0):
+        """
+        Đợi frame mới hơn frame đã trả lần trước (tối đa timeout giây).
+        Trả về (True, frame) hoặc (False, None) nếu chưa có frame mới.
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._seq == self._last_returned_seq and not self._stop_event.is_set():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False, None
+                self._cond.wait(remaining)
+            if self._seq == self._last_returned_seq:
+                return False, None
+            self._last_returned_seq = self._seq
+            return True, self._frame
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "frames_read": self.frames_read,
+            "frames_dropped": self.frames_dropped,
+            "reconnects": self.reconnects,
+        }
+
+    def _open(self):
+        if self.backend is not None:
+            cap = cv2.VideoCapture(self.source, self.backend)
+        else:
+            cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        if self.width:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height:
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        # Giữ buffer của OpenCV nhỏ nhất có thể (không phải backend nào cũng hỗ trợ)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def _release(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        self.connected = False
+
+    def _run(self):
+        delay = RECONNECT_DELAY
+        while not self._stop_event.is_set():
+            if self._cap is None:
+                self._cap = self._open()
+                if self._cap is None:
+                    print(f"⚠️  [{self.name}] Không mở được {self.source}, thử lại sau {delay:.1f}s")
+                    self._stop_event.wait(delay)
+                    delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                    continue
+                if self.frames_read:
+                    self.reconnects += 1
+                    print(f"✅ [{self.name}] Đã kết nối lại {self.source}")
+                self.connected = True
+                delay = RECONNECT_DELAY
+
+            ret, frame = self._cap.read()
+            if not ret:
+                print(f"⚠️  [{self.name}] Mất kết nối, đang kết nối lại...")
+                self._release()
+                self._stop_event.wait(delay)
+                continue
+
+            with self._cond:
+                if self._seq != self._last_returned_seq:
+                    self.frames_dropped += 1     # Frame trước chưa ai lấy -> bị bỏ
+                self._frame = frame
+                self._seq += 1
+                self.frames_read += 1
+                self._cond.notify_all()
@@ -0,0 +1,213 @@
+"""
+Suy luận dạng tầng (cascade) thay cho Holistic
+- Mỗi frame chỉ chạy Pose (nhẹ, model_complexity cấu hình được)
+- Face Mesh chỉ chạy trên vùng đầu (ROI) và chỉ khi thực sự cần
+  (có người + chưa kết luận NGÃ/LEO TƯỜNG) -> tính lười khi truy cập face_landmarks
+- Bỏ hẳn 2 model bàn tay (không dùng đến)
+- Chế độ ROI (roi=True): khi đã thấy người, chỉ đưa vùng quanh người (dự đoán từ landmark
+  frame trước, thu về cạnh ROI_SIZE) vào Pose rồi đổi landmark về tọa độ toàn khung;
+  độ tin cậy tụt / mất người -> dò lại trên toàn khung
+"""
+import cv2
+import mediapipe as mp
+import numpy as np
+
+import landmarks as lmk
+import pose_rules
+from frame_context import FrameContext
+
+
+# --- CẤU HÌNH ---
+POSE_MODEL_COMPLEXITY = 1     # 0: nhanh nhất, 1: bằng Pose trong Holistic, 2: chính xác nhất
+HEAD_LANDMARKS = range(0, 11) # Mũi, mắt, tai, miệng trong 33 điểm Pose
+HEAD_PADDING = 0.6            # Nới rộng vùng đầu thêm 60% mỗi phía
+MIN_HEAD_SIZE = 24            # Vùng đầu nhỏ hơn (pixel) -> bỏ qua Face Mesh
+
+ROI_SIZE = 256                # Cạnh dài của vùng cắt đưa vào Pose (pixel, chỉ thu nhỏ)
+ROI_PADDING = 0.25            # Nới khung người mỗi phía (người di chuyển giữa 2 frame)
+ROI_MIN_CONFIDENCE = 0.5      # Visibility trung bình của vai + hông (hoặc đầu) thấp hơn -> dò lại toàn khung
+
+
+def remap_landmarks(landmark_list, roi, w, h):
+    """Đổi landmark tính trên vùng cắt roi=(x1, y1, x2, y2) về tọa độ chuẩn hóa của khung w x h"""
+    x1, y1, x2, y2 = roi
+    cw, ch = x2 - x1, y2 - y1
+    for lm in landmark_list.landmark:
+        lm.x = (x1 + lm.x * cw) / w
+        lm.y = (y1 + lm.y * ch) / h
+        lm.z = lm.z * cw / w
+    return landmark_list
+
+
+def crop_rgb(image, roi):
+    """Vùng cắt RGB liên tục trong bộ nhớ; image là ảnh RGB hoặc FrameContext (đổi màu riêng vùng cắt)"""
+    if isinstance(image, FrameContext):
+        return np.ascontiguousarray(image.rgb_crop(roi))
+    x1, y1, x2, y2 = roi
+    return np.ascontiguousarray(image[y1:y2, x1:x2])
+
+
+def frame_size(image):
+    """(h, w) của ảnh RGB hoặc FrameContext"""
+    if isinstance(image, FrameContext):
+        return image.h, image.w
+    return image.shape[:2]
+
+
+def tracking_confidence(keypoints):
+    """Độ tin cậy bám người: visibility trung bình của thân (vai + hông) hoặc đầu (cận cảnh)"""
+    vis = keypoints[:, lmk.VIS]
+    return max(float(vis[lmk.TORSO].mean()), float(vis[lmk.HEAD_SLICE].mean()))
+
+
+def predict_roi(box, prev_box, padding, w, h):
+    """
+    Vùng cắt (pixel) cho frame sau: khung người frame trước dời theo vận tốc tâm
+    (prev_box -> box), nới padding, vuông để giữ tỉ lệ, cắt theo biên ảnh
+    box, prev_box: (x1, y1, x2, y2) chuẩn hóa
+    """
+    x1, y1, x2, y2 = box
+    cx, cy = (x1 + x2) / 2 * w, (y1 + y2) / 2 * h
+    if prev_box is not None:
+        cx += cx - (prev_box[0] + prev_box[2]) / 2 * w
+        cy += cy - (prev_box[1] + prev_box[3]) / 2 * h
+    size = max((x2 - x1) * w, (y2 - y1) * h) * (1 + 2 * padding)
+    rx1, ry1 = max(0, int(cx - size / 2)), max(0, int(cy - size / 2))
+    rx2, ry2 = min(w, int(cx + size / 2)), min(h, int(cy + size / 2))
+    if rx2 - rx1 < MIN_HEAD_SIZE or ry2 - ry1 < MIN_HEAD_SIZE:
+        return None
+    return rx1, ry1, rx2, ry2
+
+
+class CascadeResults:
+    """Kết quả giống Holistic: pose_landmarks + face_landmarks (face tính khi được hỏi)"""
+
+    def __init__(self, pipeline, rgb, pose_landmarks):
+        self._pipeline = pipeline
+        self._rgb = rgb                 # Ảnh RGB hoặc FrameContext (chế độ ROI)
+        self._face = None
+        self._face_done = False
+        self.pose_landmarks = pose_landmarks
+
+    @property
+    def face_landmarks(self):
+        if not self._face_done:
+            self._face_done = True
+            if self.pose_landmarks is not None:
+                self._face = self._pipeline.detect_face(self._rgb, self.pose_landmarks)
+        return self._face
+
+
+class CascadePipeline:
+    def __init__(self, model_complexity=POSE_MODEL_COMPLEXITY, static_image_mode=False,
+                 roi=False, roi_size=ROI_SIZE):
+        # static_image_mode=True: mỗi ảnh độc lập (dùng cho vùng cắt của từng người, multi_person.py)
+        self.roi = roi
+        self.roi_size = roi_size
+        self.pose = mp.solutions.pose.Pose(
+            static_image_mode=static_image_mode,
+            model_complexity=model_complexity,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5
+        )
+        self.face_mesh = mp.solutions.face_mesh.FaceMesh(
+            static_image_mode=True,       # ROI thay đổi mỗi lần -> không dùng tracking
+            max_num_faces=1,
+            min_detection_confidence=0.5
+        )
+        self.face_runs = 0
+
+        # Chế độ ROI: self.pose (video, tự bám người trong vùng cắt đã căn giữa) chạy trên vùng cắt,
+        # graph ảnh tĩnh riêng chỉ dùng khi phải dò lại trên toàn khung
+        self.detect_pose = None
+        if roi:
+            self.detect_pose = mp.solutions.pose.Pose(
+                static_image_mode=True,
+                model_complexity=model_complexity,
+                min_detection_confidence=0.5
+            )
+        # Trạng thái bám vùng người (chế độ ROI)
+        self._box = None            # Khung người frame trước (chuẩn hóa)
+        self._prev_box = None
+        self.roi_runs = 0
+        self.full_runs = 0
+
+    def process(self, rgb):
+        """rgb: ảnh RGB; chế độ ROI nhận thêm FrameContext (chỉ đổi màu vùng cắt thay vì cả khung)"""
+        if not self.roi:
+            results = self.pose.process(rgb)
+            return CascadeResults(self, rgb, results.pose_landmarks)
+
+        h, w = frame_size(rgb)
+        landmarks = None
+        roi = predict_roi(self._box, self._prev_box, ROI_PADDING, w, h) if self._box is not None else None
+        if roi is not None:
+            landmarks = self._process_roi(rgb, roi)
+        if landmarks is None:
+            # Chưa bám được / mất dấu -> dò lại toàn khung
+            self.full_runs += 1
+            self._prev_box = None
+            full = rgb.rgb if isinstance(rgb, FrameContext) else rgb
+            landmarks = self.detect_pose.process(full).pose_landmarks
+            self._box = None
+
+        if landmarks is not None:
+            keypoints = lmk.to_array(landmarks)
+            box = tuple(pose_rules.bbox(keypoints, pose_rules.VISIBLE_THRESHOLD))
+            self._prev_box, self._box = self._box, box
+        return CascadeResults(self, rgb, landmarks)
+
+    def _process_roi(self, rgb, roi):
+        """Pose trên vùng cắt (thu về cạnh roi_size), None nếu độ tin cậy thấp"""
+        x1, y1, x2, y2 = roi
+        h, w = frame_size(rgb)
+        scale = self.roi_size / max(x2 - x1, y2 - y1)
+        is_context = isinstance(rgb, FrameContext)
+        crop = (rgb.frame if is_context else rgb)[y1:y2, x1:x2]
+        if scale < 1:
+            crop = cv2.resize(crop, (max(1, int((x2 - x1) * scale)), max(1, int((y2 - y1) * scale))),
+                              interpolation=cv2.INTER_LINEAR)
+        # FrameContext: thu nhỏ trước rồi mới đổi màu (ít pixel hơn)
+        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB) if is_context else np.ascontiguousarray(crop)
+        self.roi_runs += 1
+        landmarks = self.pose.process(crop).pose_landmarks
+        if landmarks is None or tracking_confidence(lmk.to_array(landmarks)) < ROI_MIN_CONFIDENCE:
+            return None
+        return remap_landmarks(landmarks, roi, w, h)
+
+    def head_roi(self, pose_landmarks, w, h):
+        """Hộp vuông bao vùng đầu (pixel) từ các điểm mặt của Pose, None nếu quá nhỏ"""
+        lms = pose_landmarks.landmark
+        xs = [lms[i].x * w for i in HEAD_LANDMARKS]
+        ys = [lms[i].y * h for i in HEAD_LANDMARKS]
+        cx, cy = (min(xs) + max(xs)) / 2, (min(ys) + max(ys)) / 2
+        size = max(max(xs) - min(xs), max(ys) - min(ys)) * (1 + 2 * HEAD_PADDING)
+        if size < MIN_HEAD_SIZE:
+            return None
+
+        x1, y1 = max(0, int(cx - size / 2)), max(0, int(cy - size / 2))
+        x2, y2 = min(w, int(cx + size / 2)), min(h, int(cy + size / 2))
+        if x2 - x1 < MIN_HEAD_SIZE or y2 - y1 < MIN_HEAD_SIZE:
+            return None
+        return x1, y1, x2, y2
+
+    def detect_face(self, rgb, pose_landmarks):
+        """Chạy Face Mesh trên vùng đầu, trả về landmark theo tọa độ toàn khung"""
+        h, w = frame_size(rgb)
+        roi = self.head_roi(pose_landmarks, w, h)
+        if roi is None:
+            return None
+
+        crop = crop_rgb(rgb, roi)
+        self.face_runs += 1
+        results = self.face_mesh.process(crop)
+        if not results.multi_face_landmarks:
+            return None
+
+        return remap_landmarks(results.multi_face_landmarks[0], roi, w, h)
+
+    def close(self):
+        self.pose.close()
+        if self.detect_pose is not None:
+            self.detect_pose.close()
+        self.face_mesh.close()
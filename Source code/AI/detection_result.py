@@ -0,0 +1,84 @@
+"""
+Kết quả nhận diện gọn của 1 frame (gửi kèm cảnh báo thay vì chỉ gửi ảnh)
+- keypoints: 33 điểm Pose dạng mảng float32 (33, 4) = x, y, z, visibility (tọa độ chuẩn hóa 0-1)
+- confidence: độ tin cậy từng luật (person, fall, climb, face) trong khoảng 0-1
+- bbox: khung người (x1, y1, x2, y2) chuẩn hóa, tính từ các điểm nhìn thấy
+- wall_y: vạch tường chuẩn hóa (None nếu không có)
+- track_id: ID người trong chế độ nhiều người (None ở chế độ 1 người)
+Khi gửi: keypoints được đóng gói thành base64 của 528 byte float32 little-endian.
+"""
+import base64
+import time
+
+import numpy as np
+
+import pose_rules
+
+
+class DetectionResult:
+    __slots__ = ("camera_id", "timestamp", "status", "message", "trigger", "keypoints",
+                 "confidence", "bbox", "wall_y", "track_id")
+
+    def __init__(self, camera_id, status, message, trigger=None, keypoints=None,
+                 confidence=None, bbox=None, wall_y=None, timestamp=None, track_id=None):
+        self.camera_id = camera_id
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.status = status
+        self.message = message
+        self.trigger = trigger                # Luật sinh ra trạng thái: fall | climb | face | None
+        self.keypoints = keypoints            # np.float32 (33, 4) hoặc None
+        self.confidence = confidence or {}
+        self.bbox = bbox
+        self.wall_y = wall_y
+        self.track_id = track_id
+
+    @classmethod
+    def from_keypoints(cls, camera_id, status, message, keypoints=None, wall_y=None, trigger=None,
+                       track_id=None):
+        """keypoints: float32 (33, 4) từ landmarks.to_array (None nếu không có người)"""
+        if keypoints is None:
+            return cls(camera_id, status, message, trigger, wall_y=wall_y, track_id=track_id)
+        confidence = {rule: round(float(v), 3)
+                      for rule, v in pose_rules.rule_confidence(keypoints, wall_y).items()}
+        box = pose_rules.bbox(keypoints, pose_rules.VISIBLE_THRESHOLD)
+        return cls(camera_id, status, message, trigger, keypoints=keypoints,
+                   confidence=confidence,
+                   bbox=tuple(float(v) for v in np.clip(box, 0.0, 1.0)), wall_y=wall_y,
+                   track_id=track_id)
+
+    @property
+    def center(self):
+        if self.bbox is None:
+            return None
+        x1, y1, x2, y2 = self.bbox
+        return (x1 + x2) / 2, (y1 + y2) / 2
+
+    def overall_confidence(self):
+        """Confidence của luật đã sinh ra trạng thái (mặc định: có người)"""
+        return self.confidence.get(self.trigger or "person", 0.0)
+
+    def to_dict(self):
+        """Dạng JSON gọn để gửi server (không có ảnh)"""
+        data = {
+            "status": self.status,
+            "trigger": self.trigger,
+            "confidence": round(self.overall_confidence(), 3),
+            "rules": self.confidence,
+            "bbox": [round(v, 4) for v in self.bbox] if self.bbox else None,
+            "wall_y": round(float(self.wall_y), 4) if self.wall_y else None,
+        }
+        if self.track_id is not None:
+            data["track_id"] = self.track_id
+        if self.keypoints is not None:
+            data["keypoints_f32"] = base64.b64encode(
+                self.keypoints.astype("<f4", copy=False).tobytes()).decode("ascii")
+            data["keypoints_shape"] = list(self.keypoints.shape)
+        return data
+
+    @staticmethod
+    def unpack_keypoints(data):
+        """Ngược lại của to_dict(): base64 -> mảng float32 (33, 4)"""
+        if not data.get("keypoints_f32"):
+            return None
+        raw = base64.b64decode(data["keypoints_f32"])
+        return np.frombuffer(raw, dtype="<f4").reshape(data.get("keypoints_shape", (-1, 4)))
@@ -0,0 +1,314 @@
+"""
+Clip bằng chứng cho cảnh báo RED: vài giây TRƯỚC và SAU sự kiện (thay vì chỉ 1 ảnh)
+- EvidenceBuffer: vòng đệm JPEG đã nén của 1 camera, giới hạn cứng theo byte, số frame và
+  thời gian -> bộ nhớ mỗi camera không đổi dù hệ thống chạy bao lâu
+  + Frame nhận từ ESP32 / Node.js: giữ nguyên JPEG nhận được (không encode lại)
+  + Frame BGR (webcam, stream): encode JPEG nhỏ, tối đa EVIDENCE_FPS frame / giây
+- EvidenceRecorder: camera chuyển sang RED -> lấy PRE_EVENT_SECONDS giây trong vòng đệm, gom tiếp
+  POST_EVENT_SECONDS giây sau, rồi giao cho luồng ghi nền (giải mã + ghi MJPEG .avi + .json)
+  -> luồng suy luận không bao giờ chờ ghi đĩa
+- Clip đang gom cũng giới hạn byte; hàng chờ ghi đầy -> bỏ clip mới (không chặn)
+- Mỗi camera chỉ giữ MAX_CLIPS_PER_CAMERA clip gần nhất trên đĩa
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+# --- CẤU HÌNH ---
+EVIDENCE_ENABLED = os.environ.get("EVIDENCE_CLIPS", "1") == "1"
+EVIDENCE_DIR = os.environ.get("EVIDENCE_DIR",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "evidence"))
+PRE_EVENT_SECONDS = 5.0
+POST_EVENT_SECONDS = 5.0
+BUFFER_MAX_BYTES = 3 * 1024 * 1024     # Vòng đệm mỗi camera (~5 s JPEG 640x480 ở 10 fps)
+BUFFER_MAX_FRAMES = 150
+CLIP_MAX_BYTES = 2 * BUFFER_MAX_BYTES  # Clip = trước + sau sự kiện
+EVIDENCE_FPS = 10.0                    # Frame dày hơn bị bỏ trước khi encode / lưu
+EVIDENCE_MAX_WIDTH = 640               # Frame BGR rộng hơn được thu nhỏ trước khi encode
+EVIDENCE_JPEG_QUALITY = 70
+MAX_PENDING_CLIPS = 4                  # Hàng chờ ghi đĩa
+MAX_CLIPS_PER_CAMERA = 100
+CLIP_GRACE_SECONDS = 5.0               # Camera ngừng gửi frame -> vẫn ghi clip sau post + grace giây
+
+
+def camera_dirname(camera_id):
+    """
+    Tên thư mục an toàn cho camera_id (camera_id đến từ request, không được thoát khỏi thư mục lưu)
+    Tên đã an toàn giữ nguyên; tên phải sửa thêm "+<hash>" ("+" không có trong tên an toàn)
+    -> 2 camera khác nhau không bao giờ chung thư mục ("cam/1" và "cam_1" tách riêng)
+    """
+    raw = str(camera_id)
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", raw).strip(".")
+    if name == raw and name:
+        return name
+    return f"{name}+{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:10]}"
+
+
+class EvidenceBuffer:
+    """Vòng đệm (timestamp, JPEG) của 1 camera, luôn trong giới hạn byte / frame / thời gian"""
+
+    def __init__(self, window=PRE_EVENT_SECONDS, max_bytes=BUFFER_MAX_BYTES,
+                 max_frames=BUFFER_MAX_FRAMES, fps=EVIDENCE_FPS):
+        self.window = window
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self.min_gap = 1.0 / fps if fps else 0.0
+        self._frames = deque()
+        self.nbytes = 0
+        self.last_timestamp = None
+        self.frames_evicted = 0
+        self.frames_rejected = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+    def wants(self, timestamp):
+        """Frame tại timestamp có cần giữ không (giới hạn EVIDENCE_FPS, kiểm tra TRƯỚC khi encode)"""
+        # Dung sai 10%: camera 10 fps có khoảng cách frame dao động quanh 0.1 s
+        return self.last_timestamp is None or timestamp - self.last_timestamp >= self.min_gap * 0.9
+
+    def push(self, timestamp, jpeg):
+        if len(jpeg) > self.max_bytes:
+            self.frames_rejected += 1
+            return False
+        self._frames.append((timestamp, jpeg))
+        self.nbytes += len(jpeg)
+        self.last_timestamp = timestamp
+
+        frames = self._frames
+        while (self.nbytes > self.max_bytes or len(frames) > self.max_frames
+               or timestamp - frames[0][0] > self.window):
+            _, old = frames.popleft()
+            self.nbytes -= len(old)
+            self.frames_evicted += 1
+        return True
+
+    def since(self, timestamp):
+        """Các frame từ timestamp trở đi (bytes không đổi -> chỉ copy tham chiếu)"""
+        return [item for item in self._frames if item[0] >= timestamp]
+
+
+class EvidenceClip:
+    def __init__(self, camera_id, event_time, frames, end_time, meta, max_bytes=CLIP_MAX_BYTES):
+        self.camera_id = camera_id
+        self.event_time = event_time
+        self.end_time = end_time
+        self.meta = meta
+        self.max_bytes = max_bytes
+        self.frames = list(frames)
+        self.nbytes = sum(len(jpeg) for _, jpeg in self.frames)
+        self.pre_frames = len(self.frames)
+        self.deadline = time.monotonic() + (end_time - event_time) + CLIP_GRACE_SECONDS
+
+    def add(self, timestamp, jpeg):
+        if timestamp <= self.end_time and self.nbytes + len(jpeg) <= self.max_bytes:
+            self.frames.append((timestamp, jpeg))
+            self.nbytes += len(jpeg)
+
+    def complete(self, timestamp):
+        return timestamp >= self.end_time or self.nbytes >= self.max_bytes
+
+
+class EvidenceRecorder:
+    """
+    Gom clip bằng chứng cho nhiều camera + 1 luồng nền ghi đĩa
+    add_frame() / trigger() gọi trên luồng suy luận: chỉ thao tác tham chiếu, encode JPEG nhỏ khi cần
+    """
+
+    def __init__(self, directory=EVIDENCE_DIR, pre_seconds=PRE_EVENT_SECONDS,
+                 post_seconds=POST_EVENT_SECONDS, fps=EVIDENCE_FPS, max_width=EVIDENCE_MAX_WIDTH,
+                 jpeg_quality=EVIDENCE_JPEG_QUALITY, max_pending=MAX_PENDING_CLIPS,
+                 max_clips=MAX_CLIPS_PER_CAMERA):
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.fps = fps
+        self.max_width = max_width
+        self.jpeg_quality = jpeg_quality
+        self.max_pending = max_pending
+        self.max_clips = max_clips
+
+        self._active = {}                 # camera_id -> EvidenceClip đang gom frame sau sự kiện
+        self._queue = deque()             # Clip chờ ghi
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        # Thống kê
+        self.frames_encoded = 0
+        self.clips_started = 0
+        self.clips_written = 0
+        self.clips_dropped = 0
+        self.last_clip_path = None
+
+    def buffer(self):
+        """Vòng đệm mới cho 1 camera (lưu trong session của camera)"""
+        return EvidenceBuffer(self.pre_seconds, fps=self.fps)
+
+    def encode(self, frame):
+        h, w = frame.shape[:2]
+        if self.max_width and w > self.max_width:
+            frame = cv2.resize(frame, (self.max_width, int(h * self.max_width / w)),
+                               interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        self.frames_encoded += 1
+        return buffer.tobytes() if ok else None
+
+    def add_frame(self, camera_id, buffer, timestamp, frame=None, jpeg=None):
+        """
+        Đưa 1 frame vào vòng đệm của camera (jpeg có sẵn thì không encode lại)
+        Trả về JPEG đã lưu (để nơi khác dùng lại, vd: recording.py), None nếu frame bị bỏ
+        """
+        if not buffer.wants(timestamp):
+            return None
+        if jpeg is None:
+            jpeg = self.encode(frame)
+            if jpeg is None:
+                return None
+        buffer.push(timestamp, jpeg)
+
+        with self._cond:
+            clip = self._active.get(camera_id)
+            if clip is not None:
+                clip.add(timestamp, jpeg)
+                if clip.complete(timestamp):
+                    self._finish(camera_id)
+        return jpeg
+
+    def trigger(self, camera_id, buffer, timestamp, meta=None):
+        """Camera vừa chuyển sang RED: bắt đầu clip (bỏ qua nếu camera đang có clip chưa xong)"""
+        with self._cond:
+            if camera_id in self._active:
+                return False
+            self._active[camera_id] = EvidenceClip(
+                camera_id, timestamp, buffer.since(timestamp - self.pre_seconds),
+                timestamp + self.post_seconds, meta or {})
+            self.clips_started += 1
+            self._ensure_thread()
+            self._cond.notify()
+        return True
+
+    def pending(self):
+        return len(self._active) + len(self._queue)
+
+    def stats(self):
+        return {"started": self.clips_started, "written": self.clips_written,
+                "dropped": self.clips_dropped, "pending": self.pending(),
+                "frames_encoded": self.frames_encoded}
+
+    def close(self, timeout=5.0):
+        """Kết thúc các clip đang gom, ghi nốt hàng chờ (tối đa timeout giây)"""
+        deadline = time.time() + timeout
+        with self._cond:
+            for camera_id in list(self._active):
+                self._finish(camera_id)
+            while self._queue and time.time() < deadline:
+                self._cond.wait(timeout=0.1)
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=max(0.0, deadline - time.time()))
+
+    def _finish(self, camera_id):
+        """Chuyển clip sang hàng chờ ghi (gọi khi đang giữ lock)"""
+        clip = self._active.pop(camera_id)
+        if len(self._queue) >= self.max_pending:
+            self.clips_dropped += 1
+            print(f"⚠️  Hàng chờ ghi clip đầy, bỏ clip của camera {camera_id}")
+            return
+        self._queue.append(clip)
+        self._ensure_thread()
+        self._cond.notify()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="EvidenceWriter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    # Clip của camera đã ngừng gửi frame: ghi khi quá hạn (không đợi frame mãi)
+                    now = time.monotonic()
+                    for camera_id, clip in list(self._active.items()):
+                        if now >= clip.deadline:
+                            self._finish(camera_id)
+                    if not self._queue:
+                        self._cond.wait(timeout=1.0)
+                if not self._queue:
+                    return
+                clip = self._queue.popleft()
+                self._cond.notify_all()
+
+            try:
+                self._write(clip)
+            except Exception as e:
+                self.clips_dropped += 1
+                print(f"[LỖI] Không ghi được clip bằng chứng: {e}")
+
+    def _write(self, clip):
+        """Giải mã JPEG -> MJPEG .avi + .json (thời điểm từng frame, metadata cảnh báo)"""
+        if not clip.frames:
+            self.clips_dropped += 1
+            return
+        camera_dir = os.path.join(self.directory, camera_dirname(clip.camera_id))
+        os.makedirs(camera_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(clip.event_time))
+        stamp += f"-{int(clip.event_time * 1000) % 1000:03d}"
+        base = os.path.join(camera_dir, f"{stamp}_{clip.meta.get('trigger') or 'red'}")
+
+        timestamps = [t for t, _ in clip.frames]
+        span = timestamps[-1] - timestamps[0]
+        fps = (len(timestamps) - 1) / span if span > 0 else self.fps
+        writer = None
+        size = None
+        for _, jpeg in clip.frames:
+            image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            if writer is None:
+                size = (image.shape[1], image.shape[0])
+                writer = cv2.VideoWriter(base + ".avi", cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+            elif (image.shape[1], image.shape[0]) != size:
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            writer.write(image)
+        if writer is None:
+            self.clips_dropped += 1
+            return
+        writer.release()
+
+        info = {
+            "camera_id": clip.camera_id,
+            "event_time": clip.event_time,
+            "pre_event_frames": clip.pre_frames,
+            "frames": len(timestamps),
+            "fps": round(fps, 2),
+            "frame_times": [round(t - clip.event_time, 3) for t in timestamps],
+            **clip.meta,
+        }
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False)
+
+        self.clips_written += 1
+        self.last_clip_path = base + ".avi"
+        print(f"🎞️  Đã ghi clip bằng chứng: {self.last_clip_path} "
+              f"({len(timestamps)} frame, {clip.pre_frames} trước sự kiện)")
+        self._enforce_retention(camera_dir)
+
+    def _enforce_retention(self, camera_dir):
+        clips = sorted(name for name in os.listdir(camera_dir) if name.endswith(".avi"))
+        for name in clips[:max(0, len(clips) - self.max_clips)]:
+            for path in (os.path.join(camera_dir, name), os.path.join(camera_dir, name[:-4] + ".json")):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
@@ -0,0 +1,47 @@
+"""
+Ngữ cảnh phân tích của 1 frame
+Các ảnh dẫn xuất (RGB, grayscale, kết quả dò tường...) chỉ được tính MỘT lần
+rồi dùng chung cho mọi bộ phát hiện trong cùng frame.
+Có pool (frame_ingest.BufferPool): ảnh RGB / xám ghi vào bộ đệm dùng lại giữa các frame
+-> chỉ dùng khi frame trước không còn được tham chiếu (1 luồng xử lý tuần tự).
+"""
+import cv2
+
+
+class FrameContext:
+    def __init__(self, frame, pool=None):
+        self.frame = frame                  # Ảnh BGR gốc
+        self.h, self.w = frame.shape[:2]
+        self.pool = pool
+        self._rgb = None
+        self._gray = None
+        self._cache = {}
+
+    @property
+    def rgb(self):
+        """Ảnh RGB cho MediaPipe"""
+        if self._rgb is None:
+            dst = self.pool.get("rgb", self.frame.shape) if self.pool is not None else None
+            self._rgb = cv2.cvtColor(self.frame, cv2.COLOR_BGR2RGB, dst=dst)
+        return self._rgb
+
+    def rgb_crop(self, roi):
+        """RGB của vùng roi=(x1, y1, x2, y2): chỉ đổi màu vùng đó nếu chưa có ảnh RGB toàn khung"""
+        x1, y1, x2, y2 = roi
+        if self._rgb is not None:
+            return self._rgb[y1:y2, x1:x2]
+        return cv2.cvtColor(self.frame[y1:y2, x1:x2], cv2.COLOR_BGR2RGB)
+
+    @property
+    def gray(self):
+        """Ảnh xám toàn khung (dò tường, kiểm tra khẩu trang)"""
+        if self._gray is None:
+            dst = self.pool.get("gray", (self.h, self.w)) if self.pool is not None else None
+            self._gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY, dst=dst)
+        return self._gray
+
+    def cached(self, key, compute):
+        """Tính compute() lần đầu, các lần sau trả lại kết quả đã lưu"""
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
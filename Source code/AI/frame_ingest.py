@@ -0,0 +1,149 @@
+"""
+Giải mã JPEG đầu vào (ESP32-CAM / Node.js) theo đúng nhu cầu của từng bước
+- Đọc kích thước ảnh từ header SOF của JPEG (không cần giải mã)
+- Nguồn lớn hơn kích thước suy luận -> giải mã thu nhỏ 1/2, 1/4, 1/8 ngay trong libjpeg
+  (IMREAD_REDUCED_*), không giải mã đầy đủ rồi mới resize
+- Giải mã thẳng sang không gian màu cần dùng: xám 1/8 cho điểm chuyển động (scheduler),
+  BGR cho phân tích / ảnh cảnh báo, RGB nếu OpenCV hỗ trợ IMREAD_COLOR_RGB
+  (worker giải mã BGR: ảnh cảnh báo, clip bằng chứng, ghi hình, dò tường đều cần BGR; ảnh RGB cho
+  MediaPipe đổi từ BGR vào BufferPool. decode(color="rgb") cho nơi chỉ cần RGB)
+- BufferPool: ảnh dẫn xuất (RGB cho MediaPipe, xám) dùng lại bộ đệm giữa các frame
+  thay vì cấp phát mới mỗi frame; có đếm số lần cấp phát / dùng lại
+- Giới hạn chấp nhận: ảnh giải mã KHÔNG dùng lại bộ đệm - cv2.imdecode của Python không nhận dst,
+  mỗi lần giải mã là 1 mảng mới (1 mảng / frame suy luận, 1 ảnh xám 1/8 / frame bỏ qua)
+"""
+import struct
+import time
+
+import cv2
+import numpy as np
+
+
+# --- CẤU HÌNH ---
+INFERENCE_WIDTH = 640         # Ảnh rộng hơn -> giải mã thu nhỏ sao cho vẫn >= chiều rộng này
+MOTION_REDUCTION = 8          # Ảnh xám cho điểm chuyển động giải mã ở 1/8
+
+_REDUCED_FLAGS = {
+    "bgr": {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+            4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8},
+    "gray": {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+             4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8},
+}
+# OpenCV >= 4.10: giải mã thẳng ra RGB (bit thu nhỏ giữ nguyên, thay bit màu BGR bằng RGB)
+_IMREAD_COLOR_RGB = getattr(cv2, "IMREAD_COLOR_RGB", None)
+if _IMREAD_COLOR_RGB is not None:
+    _REDUCED_FLAGS["rgb"] = {factor: (flag & ~cv2.IMREAD_COLOR) | _IMREAD_COLOR_RGB
+                             for factor, flag in _REDUCED_FLAGS["bgr"].items()}
+
+# Marker SOF (Start Of Frame) chứa kích thước ảnh: SOF0-SOF15 trừ DHT (C4), JPG (C8), DAC (CC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(data):
+    """(width, height) đọc từ header JPEG, None nếu không phải JPEG hợp lệ"""
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    n = len(data)
+    while i + 4 <= n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:              # Byte đệm
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2                      # Marker không có độ dài
+            continue
+        length = struct.unpack_from(">H", data, i + 2)[0]
+        if marker in _SOF_MARKERS:
+            if i + 9 > n:
+                return None
+            height, width = struct.unpack_from(">HH", data, i + 5)
+            return width, height
+        if marker == 0xDA:              # Start Of Scan mà chưa thấy SOF
+            return None
+        i += 2 + length
+    return None
+
+
+def reduction_for(width, target_width=INFERENCE_WIDTH):
+    """Hệ số thu nhỏ lớn nhất (1, 2, 4, 8) mà ảnh vẫn rộng >= target_width"""
+    factor = 1
+    while factor < 8 and width // (factor * 2) >= target_width:
+        factor *= 2
+    return factor
+
+
+class BufferPool:
+    """Bộ đệm dùng lại theo tên; chỉ cấp phát mới khi kích thước / kiểu thay đổi"""
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+        self.reuses = 0
+
+    def get(self, key, shape, dtype=np.uint8):
+        buffer = self._buffers.get(key)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[key] = buffer
+            self.allocations += 1
+        else:
+            self.reuses += 1
+        return buffer
+
+    def nbytes(self):
+        return sum(b.nbytes for b in self._buffers.values())
+
+
+class FrameIngest:
+    """
+    Giải mã JPEG của 1 worker (không dùng chung giữa các luồng)
+    Thống kê: số frame, thời gian giải mã, số ảnh được giải mã thu nhỏ, ảnh giải mã (cấp phát) mỗi frame
+    """
+
+    def __init__(self, target_width=INFERENCE_WIDTH):
+        self.target_width = target_width
+        self.frames = 0
+        self.decodes = 0                # Số lần gọi imdecode (mỗi lần = 1 mảng mới, không có dst)
+        self.reduced = 0                # Số lần giải mã thu nhỏ
+        self.decode_seconds = 0.0
+        self.last_decode_seconds = 0.0  # Tổng thời gian giải mã của frame gần nhất
+
+    def begin_frame(self):
+        self.frames += 1
+        self.last_decode_seconds = 0.0
+
+    def _imdecode(self, data, flags):
+        t0 = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+        elapsed = time.perf_counter() - t0
+        self.decode_seconds += elapsed
+        self.last_decode_seconds += elapsed
+        self.decodes += 1
+        return image
+
+    def decode(self, data, color="bgr"):
+        """JPEG -> ảnh color ("bgr" | "rgb" | "gray"), thu nhỏ nếu rộng hơn target_width; None nếu lỗi"""
+        size = jpeg_size(data)
+        factor = reduction_for(size[0], self.target_width) if size else 1
+        if factor > 1:
+            self.reduced += 1
+        if color == "rgb" and "rgb" not in _REDUCED_FLAGS:
+            image = self._imdecode(data, _REDUCED_FLAGS["bgr"][factor])
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB) if image is not None else None
+        return self._imdecode(data, _REDUCED_FLAGS[color][factor])
+
+    def motion_gray(self, data):
+        """Ảnh xám 1/MOTION_REDUCTION cho điểm chuyển động (rẻ hơn nhiều so với giải mã đầy đủ)"""
+        return self._imdecode(data, _REDUCED_FLAGS["gray"][MOTION_REDUCTION])
+
+    def stats(self):
+        frames = max(1, self.frames)
+        return {
+            "frames": self.frames,
+            "decodes_per_frame": round(self.decodes / frames, 2),
+            "reduced": self.reduced,
+            "avg_decode_ms": round(self.decode_seconds / frames * 1000, 2),
+        }
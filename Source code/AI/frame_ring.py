@@ -0,0 +1,241 @@
+"""
+Vòng đệm frame trong bộ nhớ dùng chung (multiprocessing.shared_memory)
+Dùng khi camera, AI và stream chạy trên CÙNG một máy:
+webcam_stream.py ghi frame thô vào ring, main.py / ai_processor.py đọc thẳng ra
+mảng NumPy -> không encode JPEG, không qua HTTP loopback, không decode lại.
+
+Bố cục vùng nhớ:
+    [header: magic, số slot, h, w, c, write_seq]
+    [slot 0: seq, timestamp][frame 0 (h*w*c byte)]
+    [slot 1: seq, timestamp][frame 1] ...
+Writer đặt seq của slot = 0 trong lúc ghi; reader kiểm tra seq trước/sau khi đọc
+để phát hiện frame bị ghi đè giữa chừng.
+"""
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+
+# --- CẤU HÌNH ---
+DEFAULT_SLOTS = 8            # 8 slot ~ 260ms ở 30 FPS cho reader xử lý frame zero-copy
+POLL_INTERVAL = 0.002        # Chu kỳ kiểm tra frame mới của reader (giây)
+STALE_REATTACH = 3.0         # Không có frame mới quá lâu -> gắn lại ring (writer có thể đã khởi động lại)
+
+_MAGIC = b"FRNG"
+_HEADER = struct.Struct("<4sIIIIQ")      # magic, slots, h, w, c, write_seq
+_SLOT_HEADER = struct.Struct("<Qd")      # seq, timestamp
+_WRITE_SEQ_OFFSET = _HEADER.size - 8
+_SLOT_HEADER_SIZE = 64                   # Căn lề 64 byte cho dữ liệu frame
+
+
+def _frame_offset(slot, frame_bytes):
+    return _HEADER.size + slot * (_SLOT_HEADER_SIZE + frame_bytes) + _SLOT_HEADER_SIZE
+
+
+class FrameRingWriter:
+    """Process sở hữu camera tạo ring và ghi frame vào"""
+
+    def __init__(self, name, shape, slots=DEFAULT_SLOTS):
+        self.name = name
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.frame_bytes = int(np.prod(self.shape))
+        size = _HEADER.size + slots * (_SLOT_HEADER_SIZE + self.frame_bytes)
+
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Ring cũ còn sót lại (process trước bị kill) -> tạo lại
+            old = shared_memory.SharedMemory(name=name)
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        h, w, c = self.shape
+        _HEADER.pack_into(self.shm.buf, 0, _MAGIC, slots, h, w, c, 0)
+        self._views = [
+            np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf,
+                       offset=_frame_offset(i, self.frame_bytes))
+            for i in range(slots)
+        ]
+        self.seq = 0
+
+    def publish(self, frame):
+        """Ghi 1 frame BGR (tự resize nếu khác kích thước ring)"""
+        if frame.shape != self.shape:
+            frame = cv2.resize(frame, (self.shape[1], self.shape[0]))
+
+        seq = self.seq + 1
+        slot = seq % self.slots
+        slot_offset = _frame_offset(slot, self.frame_bytes) - _SLOT_HEADER_SIZE
+
+        _SLOT_HEADER.pack_into(self.shm.buf, slot_offset, 0, 0.0)           # Đang ghi
+        np.copyto(self._views[slot], frame)
+        _SLOT_HEADER.pack_into(self.shm.buf, slot_offset, seq, time.time())
+        struct.pack_into("<Q", self.shm.buf, _WRITE_SEQ_OFFSET, seq)
+        self.seq = seq
+        return seq
+
+    def close(self):
+        self._views = []
+        try:
+            self.shm.close()
+        except BufferError:
+            pass             # Còn view đang được dùng, vùng nhớ được giải phóng khi process thoát
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class FrameRingReader:
+    """Process đọc (AI) gắn vào ring đã có"""
+
+    def __init__(self, name):
+        self.name = name
+        self.shm = shared_memory.SharedMemory(name=name)
+        # Reader không sở hữu vùng nhớ: tránh resource_tracker xóa ring khi reader thoát
+        try:
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        except Exception:
+            pass
+
+        magic, slots, h, w, c, _ = _HEADER.unpack_from(self.shm.buf, 0)
+        if magic != _MAGIC:
+            self.shm.close()
+            raise ValueError(f"Shared memory '{name}' không phải frame ring")
+        self.slots = slots
+        self.shape = (h, w, c)
+        self.frame_bytes = h * w * c
+        self._views = [
+            np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf,
+                       offset=_frame_offset(i, self.frame_bytes))
+            for i in range(slots)
+        ]
+
+    def latest_seq(self):
+        return struct.unpack_from("<Q", self.shm.buf, _WRITE_SEQ_OFFSET)[0]
+
+    def slot_seq(self, seq):
+        offset = _frame_offset(seq % self.slots, self.frame_bytes) - _SLOT_HEADER_SIZE
+        return _SLOT_HEADER.unpack_from(self.shm.buf, offset)
+
+    def is_valid(self, seq):
+        """Frame zero-copy của seq còn nguyên (chưa bị writer ghi đè)?"""
+        return self.slot_seq(seq)[0] == seq
+
+    def read_latest(self, after_seq=0, copy=False):
+        """
+        Trả về (seq, timestamp, frame) của frame mới nhất nếu seq > after_seq, ngược lại None.
+        copy=False: frame là view trực tiếp vào shared memory (zero-copy), hợp lệ
+        cho tới khi writer quay vòng lại slot đó (slots - 1 frame sau) -> người dùng phải
+        gọi is_valid(seq) SAU khi dùng xong frame và bỏ kết quả nếu frame đã bị ghi đè.
+        """
+        for _ in range(3):
+            seq = self.latest_seq()
+            if seq == 0 or seq <= after_seq:
+                return None
+            slot_seq, timestamp = self.slot_seq(seq)
+            if slot_seq != seq:
+                continue             # Writer vừa quay vòng -> đọc lại
+            frame = self._views[seq % self.slots]
+            if copy:
+                frame = frame.copy()
+                if not self.is_valid(seq):
+                    continue         # Bị ghi đè trong lúc copy
+            return seq, timestamp, frame
+        return None
+
+    def close(self):
+        self._views = []
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+
+class RingFrameSource:
+    """
+    Nguồn frame từ ring, cùng giao diện với capture.LatestFrameReader
+    (start / read / stop / stats) để thay thế trực tiếp trong main.py.
+    copy=True (mặc định): read() trả bản sao -> giữ frame bao lâu cũng được (hàng chờ cảnh báo,
+    clip bằng chứng...). copy=False: view zero-copy, chỉ dùng khi xử lý xong trong vài frame
+    và kiểm tra frame_valid() sau khi dùng.
+    """
+
+    def __init__(self, name, copy=True):
+        self.ring_name = name
+        self.copy = copy
+        self.reader = None
+        self._last_seq = 0
+        self._last_frame_time = 0
+        self._stopped = threading.Event()
+
+        self.connected = False
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+
+    def start(self):
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self.connected = False
+
+    def _attach(self):
+        try:
+            self.reader = FrameRingReader(self.ring_name)
+        except (FileNotFoundError, ValueError):
+            return False
+        if self.frames_read:
+            self.reconnects += 1
+        self._last_seq = 0
+        self._last_frame_time = time.time()
+        self.connected = True
+        return True
+
+    def read(self, timeout=1.0):
+        deadline = time.time() + timeout
+        while not self._stopped.is_set():
+            if self.reader is not None or self._attach():
+                result = self.reader.read_latest(self._last_seq, copy=self.copy)
+                if result is not None:
+                    seq, _, frame = result
+                    if self._last_seq:
+                        self.frames_dropped += max(0, seq - self._last_seq - 1)
+                    self._last_seq = seq
+                    self._last_frame_time = time.time()
+                    self.frames_read += 1
+                    return True, frame
+                if time.time() - self._last_frame_time > STALE_REATTACH:
+                    # Writer có thể đã khởi động lại (tạo ring mới cùng tên) -> gắn lại
+                    self.reader.close()
+                    self.reader = None
+                    self.connected = False
+                    self._last_frame_time = time.time()
+            if time.time() >= deadline:
+                return False, None
+            time.sleep(POLL_INTERVAL if self.reader is not None else 0.2)
+        return False, None
+
+    def frame_valid(self):
+        """Frame vừa read() còn nguyên chưa (luôn đúng với copy=True)"""
+        if self.copy:
+            return True
+        return self.reader is not None and self._last_seq > 0 and self.reader.is_valid(self._last_seq)
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "frames_read": self.frames_read,
+            "frames_dropped": self.frames_dropped,
+            "reconnects": self.reconnects,
+        }
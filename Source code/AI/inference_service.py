@@ -0,0 +1,546 @@
+"""
+Dịch vụ AI nhận frame từ Node.js (port 5001)
+- POST /process_frame: {"image": <jpeg base64>, "camera_id": "..."} -> {"status": ...}
+- Mỗi worker process có một AIProcessor riêng, phục vụ nhiều camera
+  (trạng thái + graph Holistic theo từng camera, xem session_store.py)
+- Worker được fork từ process mẫu của forkserver đã nạp sẵn cv2 / MediaPipe (inference_worker.py)
+  -> thêm worker mất vài ms, bộ nhớ chỉ đọc dùng chung; Windows / không có forkserver -> spawn
+- Frame của cùng một camera luôn vào cùng một worker (giữ trạng thái theo dõi); camera mới vào
+  worker ít camera nhất, tự thêm worker khi mọi worker đã đủ AI_CAMERAS_PER_WORKER camera
+  (tối đa AI_MAX_LIVE_GRAPHS = số graph MediaPipe mỗi worker giữ được)
+- Khi worker bận, chỉ giữ frame MỚI NHẤT của mỗi camera (frame cũ bị bỏ)
+- GET /metrics: số đo Prometheus (độ trễ từng giai đoạn, frame theo camera, hàng chờ, RSS);
+  nhãn camera giới hạn AI_MAX_CAMERA_LABELS (camera_id đến từ client), còn lại gộp vào "other"
+- Worker chết (segfault, bị OOM kill...): frame đang xử lý trả lỗi ngay, worker được start lại
+  cùng ID (camera vẫn gắn với worker đó, dò lại từ đầu); chết trước khi sẵn sàng -> chờ lâu dần
+- GET /health: worker đã sẵn sàng chưa (503 khi có worker chưa sẵn sàng / đang start lại)
+- GET /recordings/<camera_id>?ts=...&before=5&after=5[&images=1]: frame ghi hình quanh thời điểm ts
+- GET /recordings/<camera_id>/frame?ts=...: JPEG gần ts nhất (kho ghi hình recording.py, RECORDING=1)
+Worker gửi kèm thời gian từng giai đoạn của mỗi frame + thống kê process (RSS, hàng chờ cảnh báo);
+process chính gom lại vào metrics.py.
+"""
+import base64
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from flask import Flask, Response, jsonify, request
+
+import metrics
+from recording import AROUND_SECONDS, RecordingArchive
+from session_store import MAX_LIVE_GRAPHS
+
+
+# --- CẤU HÌNH ---
+HOST = "0.0.0.0"
+PORT = 5001
+NUM_WORKERS = int(os.environ.get("AI_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+MAX_WORKERS = int(os.environ.get("AI_MAX_WORKERS", os.cpu_count() or 2))
+# > 0: camera mới mà mọi worker đã có đủ số camera này -> thêm worker (tối đa MAX_WORKERS)
+# Luôn <= MAX_LIVE_GRAPHS (AI_MAX_LIVE_GRAPHS): 0 / lớn hơn -> dùng MAX_LIVE_GRAPHS
+CAMERAS_PER_WORKER = int(os.environ.get("AI_CAMERAS_PER_WORKER", "0"))
+# "forkserver": fork từ process mẫu đã nạp sẵn model | "spawn": process mới import lại từ đầu
+START_METHOD = os.environ.get("AI_WORKER_START", "forkserver")
+MAX_PENDING = 32          # Tổng số frame chờ tối đa trước khi trả 503 (backpressure)
+MAX_BATCH = 4             # Số frame tối đa gửi sang worker trong một lượt
+REQUEST_TIMEOUT = 5.0     # Thời gian chờ kết quả tối đa (giây)
+DEFAULT_CAMERA_ID = "esp32cam"
+WATCH_INTERVAL = 1.0      # Chu kỳ tối đa giữa 2 lần kiểm tra worker còn sống (giây)
+RESPAWN_DELAY = 1.0       # Worker chết trước khi sẵn sàng: chờ 1, 2, 4... giây rồi mới start lại
+RESPAWN_MAX_DELAY = 30.0
+# camera_id đến từ request: chỉ bấy nhiêu camera đầu tiên có nhãn riêng trong /metrics, còn lại "other"
+MAX_CAMERA_LABELS = int(os.environ.get("AI_MAX_CAMERA_LABELS", "64"))
+
+
+def _start_context(method):
+    """Context multiprocessing theo START_METHOD, forkserver không có (Windows) -> spawn"""
+    if method not in multiprocessing.get_all_start_methods():
+        print(f"⚠️  Không hỗ trợ '{method}' trên nền tảng này -> dùng spawn")
+        method = "spawn"
+    ctx = multiprocessing.get_context(method)
+    if method == "forkserver":
+        # Process mẫu import inference_worker 1 lần (cv2, MediaPipe, module AI, chạy thử OpenCV)
+        # Worker fork ra vẫn chạy lại thân script chính -> script chính không tạo app / pool ở cấp module
+        ctx.set_forkserver_preload(["inference_worker"])
+    return ctx
+
+
+class InferencePool:
+    """
+    Pool worker xử lý frame.
+    Mỗi worker chỉ có tối đa 1 batch đang xử lý; các frame chờ nằm ở process chính
+    (theo từng camera) để có thể thay thế bằng frame mới hơn khi worker bị chậm.
+    """
+
+    def __init__(self, num_workers=NUM_WORKERS, max_pending=MAX_PENDING, max_batch=MAX_BATCH,
+                 start_method=START_METHOD, max_workers=MAX_WORKERS,
+                 cameras_per_worker=CAMERAS_PER_WORKER):
+        self.num_workers = max(1, num_workers)
+        self.max_workers = max(self.num_workers, max_workers)
+        # Worker giữ tối đa MAX_LIVE_GRAPHS graph: nhiều camera hơn -> LRU tạo lại graph mỗi frame
+        if cameras_per_worker <= 0 or cameras_per_worker > MAX_LIVE_GRAPHS:
+            cameras_per_worker = MAX_LIVE_GRAPHS
+        self.cameras_per_worker = cameras_per_worker
+        self.max_pending = max_pending
+        self.max_batch = max_batch
+
+        self._ctx = _start_context(start_method)
+        self.start_method = self._ctx.get_start_method()
+        self._lock = threading.Lock()
+        self._result_queue = self._ctx.Queue()
+        self._task_queues = []
+        self._processes = []
+        self._pending = []                # Theo worker: OrderedDict camera_id -> (job_id, jpeg, future)
+        self._in_flight = {}              # job_id -> future
+        self._batches = []                # Theo worker: (job_id, camera_id) của batch đang xử lý
+        self._busy = []
+        self._ready = set()
+        self._spawned_at = {}             # worker_id -> thời điểm start (đo thời gian khởi động)
+        self.startup_seconds = {}         # worker_id -> start -> "ready"
+        self._assignment = {}             # camera_id -> worker_id
+        self._respawn_at = {}             # worker_id đã chết -> thời điểm start lại (monotonic)
+        self._crash_streak = {}           # worker_id -> số lần chết liên tiếp trước khi sẵn sàng
+        self._stopping = False
+        self._next_job_id = 0
+        self._camera_labels = set()       # Camera có nhãn riêng trong metrics (tối đa MAX_CAMERA_LABELS)
+        self._label_lock = threading.Lock()
+
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_rejected = 0
+        self.worker_restarts = 0
+        self.started_at = time.time()
+
+        self.registry = metrics.Registry()
+        self._init_metrics()
+
+    def _init_metrics(self):
+        r = self.registry
+        self.m_stage = r.histogram("ai_stage_seconds",
+                                   "Thoi gian tung giai doan xu ly frame trong worker", ["stage"])
+        self.m_request = r.histogram("ai_request_seconds",
+                                     "Thoi gian tu luc nhan frame toi luc tra ket qua (HTTP)")
+        self.m_alert_send = r.histogram("ai_alert_send_seconds",
+                                        "Do tre gui canh bao sang server Node.js")
+        self.m_frames = r.counter("ai_frames_total",
+                                  "So frame theo camera va ket qua "
+                                  "(inferred, skipped, dropped, rejected, timeout, error)",
+                                  ["camera", "result"])
+        self.m_alerts = r.counter("ai_alerts_total", "So canh bao theo worker va ket qua",
+                                  ["worker", "result"])
+        self.m_buffers = r.counter("ai_frame_buffers_total",
+                                   "Bo dem anh RGB/xam theo worker (allocated = cap phat moi, reused = dung lai)",
+                                   ["worker", "kind"])
+        self.m_decodes = r.counter("ai_jpeg_decodes_total",
+                                   "So lan giai ma JPEG theo worker (reduced = giai ma thu nho)",
+                                   ["worker", "kind"])
+        self.m_evidence = r.counter("ai_evidence_clips_total",
+                                    "Clip bang chung RED theo worker (written = da ghi, dropped = bi bo)",
+                                    ["worker", "result"])
+        self.m_recorded = r.counter("ai_recorded_frames_total",
+                                    "Frame ghi vao kho ghi hinh theo worker (written, dropped)",
+                                    ["worker", "result"])
+        self.m_pending = r.gauge("ai_pending_frames", "So frame dang cho worker")
+        self.m_in_flight = r.gauge("ai_in_flight_frames", "So frame worker dang xu ly")
+        self.m_workers_ready = r.gauge("ai_workers_ready", "So worker da san sang")
+        self.m_restarts = r.counter("ai_worker_restarts_total",
+                                    "So lan worker chet va duoc start lai", ["worker"])
+        self.m_worker_startup = r.gauge("ai_worker_startup_seconds",
+                                        "Thoi gian tu luc start toi luc worker san sang", ["worker"])
+        self.m_alert_queue = r.gauge("ai_alert_queue_depth", "Do sau hang cho canh bao", ["worker"])
+        self.m_sessions = r.gauge("ai_camera_sessions", "So session camera trong worker", ["worker"])
+        self.m_rss = r.gauge("ai_process_rss_bytes", "Bo nho RSS theo process", ["process"])
+
+    def render_metrics(self):
+        """Cập nhật các gauge của process chính rồi xuất text Prometheus"""
+        with self._lock:
+            self.m_pending.set(self.pending_count())
+            self.m_in_flight.set(len(self._in_flight))
+            self.m_workers_ready.set(len(self._ready))
+        self.m_rss.set(metrics.process_rss_bytes(), "main")
+        return self.registry.render()
+
+    def start(self):
+        with self._lock:
+            for _ in range(self.num_workers):
+                self._add_worker()
+        threading.Thread(target=self._collect_results, daemon=True).start()
+        threading.Thread(target=self._watch_workers, daemon=True).start()
+
+    def _start_process(self, worker_id):
+        """Start process cho worker_id (gọi khi đang giữ lock); forkserver: chỉ là 1 lần fork process mẫu"""
+        from inference_worker import worker_main
+
+        task_queue = self._ctx.Queue()
+        process = self._ctx.Process(target=worker_main,
+                                    args=(worker_id, task_queue, self._result_queue),
+                                    daemon=True)
+        self._spawned_at[worker_id] = time.perf_counter()
+        process.start()
+        return task_queue, process
+
+    def _add_worker(self):
+        """Start thêm 1 worker (gọi khi đang giữ lock)"""
+        worker_id = len(self._processes)
+        task_queue, process = self._start_process(worker_id)
+        self._task_queues.append(task_queue)
+        self._processes.append(process)
+        self._pending.append(OrderedDict())
+        self._batches.append(())
+        self._busy.append(False)
+        self.num_workers = len(self._processes)
+        return worker_id
+
+    def _watch_workers(self):
+        """Chờ sentinel của các worker: process kết thúc -> _worker_died(); start lại worker đến hạn"""
+        while not self._stopping:
+            with self._lock:
+                now = time.monotonic()
+                for worker_id in [w for w, at in self._respawn_at.items() if at <= now]:
+                    self._respawn(worker_id)
+                sentinels = {p.sentinel: worker_id for worker_id, p in enumerate(self._processes)
+                             if worker_id not in self._respawn_at}
+            # Worker mới thêm (scale_to / worker_for) được theo dõi từ vòng sau (tối đa WATCH_INTERVAL)
+            for sentinel in wait(list(sentinels), timeout=WATCH_INTERVAL):
+                self._worker_died(sentinels[sentinel])
+
+    def _worker_died(self, worker_id):
+        """Trả lỗi cho batch đang xử lý, bỏ worker khỏi _ready, hẹn start lại"""
+        with self._lock:
+            if self._stopping:
+                return
+            process = self._processes[worker_id]
+            process.join(timeout=0)
+            failed = [(self._in_flight.pop(job_id, None), camera_id)
+                      for job_id, camera_id in self._batches[worker_id]]
+            self._batches[worker_id] = ()
+            self._busy[worker_id] = True              # Không gửi batch vào hàng chờ của process đã chết
+            was_ready = worker_id in self._ready
+            self._ready.discard(worker_id)
+            streak = 0 if was_ready else self._crash_streak.get(worker_id, 0) + 1
+            self._crash_streak[worker_id] = streak
+            delay = 0.0 if streak == 0 else min(RESPAWN_MAX_DELAY, RESPAWN_DELAY * 2 ** (streak - 1))
+            self._respawn_at[worker_id] = time.monotonic() + delay
+            self.worker_restarts += 1
+            cameras = sum(1 for w in self._assignment.values() if w == worker_id)
+        print(f"💥 Worker {worker_id} (pid {process.pid}) đã dừng, exitcode={process.exitcode}: "
+              f"{len(failed)} frame lỗi, {cameras} camera chờ start lại sau {delay:.0f} s")
+        self.m_restarts.inc(str(worker_id))
+
+        for future, camera_id in failed:
+            self.m_frames.inc(self.camera_label(camera_id), "error")
+            if future is not None:
+                future.set_result({"success": False, "status": "ERROR",
+                                   "error": f"Worker {worker_id} dung dot ngot",
+                                   "camera_id": camera_id})
+
+    def _respawn(self, worker_id):
+        """Start lại worker đã chết cùng ID, gửi tiếp frame đang chờ (gọi khi đang giữ lock)"""
+        del self._respawn_at[worker_id]
+        old_queue, old_process = self._task_queues[worker_id], self._processes[worker_id]
+        self._task_queues[worker_id], self._processes[worker_id] = self._start_process(worker_id)
+        old_queue.cancel_join_thread()            # Batch chưa gửi xong vào process đã chết
+        old_queue.close()
+        old_process.close()
+        self._busy[worker_id] = False
+        self._dispatch(worker_id)
+
+    def scale_to(self, num_workers):
+        """Tăng số worker lên num_workers (không giảm: camera đang gắn với worker cũ); trả về ID worker mới"""
+        with self._lock:
+            target = min(num_workers, self.max_workers)
+            return [self._add_worker() for _ in range(target - len(self._processes))]
+
+    def worker_pids(self):
+        return [p.pid for p in self._processes]
+
+    def stop(self):
+        with self._lock:
+            self._stopping = True
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+
+    def worker_for(self, camera_id):
+        """
+        Camera luôn được gán cố định cho một worker (gọi khi đang giữ lock)
+        Camera mới: worker ít camera nhất; mọi worker đã đủ cameras_per_worker -> thêm worker
+        (đã đủ MAX_WORKERS -> vẫn vào worker ít camera nhất, graph bị LRU thay phiên)
+        """
+        worker_id = self._assignment.get(camera_id)
+        if worker_id is not None:
+            return worker_id
+
+        counts = [0] * len(self._processes)
+        for assigned in self._assignment.values():
+            counts[assigned] += 1
+        if min(counts) >= self.cameras_per_worker and len(self._processes) < self.max_workers:
+            worker_id = self._add_worker()
+            print(f"➕ Thêm worker {worker_id} cho camera {camera_id}")
+        else:
+            worker_id = counts.index(min(counts))
+            if counts[worker_id] >= MAX_LIVE_GRAPHS:
+                print(f"⚠️  Worker {worker_id} nhận camera thứ {counts[worker_id] + 1} (> AI_MAX_LIVE_GRAPHS="
+                      f"{MAX_LIVE_GRAPHS}): graph MediaPipe sẽ bị tạo lại liên tục, "
+                      f"tăng AI_MAX_WORKERS hoặc AI_MAX_LIVE_GRAPHS")
+        self._assignment[camera_id] = worker_id
+        return worker_id
+
+    def camera_label(self, camera_id):
+        """Nhãn camera cho metrics: số nhãn có giới hạn dù client gửi bao nhiêu camera_id"""
+        if camera_id in self._camera_labels:
+            return camera_id
+        with self._label_lock:
+            if len(self._camera_labels) < MAX_CAMERA_LABELS and len(camera_id) <= 64:
+                self._camera_labels.add(camera_id)
+                return camera_id
+        return "other"
+
+    def pending_count(self):
+        return sum(len(p) for p in self._pending)
+
+    def ready_count(self):
+        return len(self._ready)
+
+    def submit(self, camera_id, jpeg_bytes):
+        """
+        Đưa frame vào hàng chờ. Trả về Future hoặc None nếu hàng chờ đã đầy.
+        Frame cũ chưa xử lý của cùng camera sẽ bị thay thế (trả status DROPPED).
+        """
+        future = Future()
+
+        with self._lock:
+            worker_id = self.worker_for(camera_id)
+            self.frames_received += 1
+            pending = self._pending[worker_id]
+
+            stale = pending.pop(camera_id, None)
+            if stale is not None:
+                self.frames_dropped += 1
+                self.m_frames.inc(self.camera_label(camera_id), "dropped")
+                stale[2].set_result({"success": True, "status": "DROPPED",
+                                     "camera_id": camera_id,
+                                     "message": "Frame cu bi bo qua (co frame moi hon)"})
+            elif self.pending_count() >= self.max_pending:
+                self.frames_rejected += 1
+                self.m_frames.inc(self.camera_label(camera_id), "rejected")
+                return None
+
+            job_id = self._next_job_id
+            self._next_job_id += 1
+            pending[camera_id] = (job_id, jpeg_bytes, future)
+
+            if not self._busy[worker_id]:
+                self._dispatch(worker_id)
+
+        return future
+
+    def _dispatch(self, worker_id):
+        """Gửi batch frame chờ sang worker (gọi khi đang giữ lock)"""
+        pending = self._pending[worker_id]
+        if not pending:
+            return
+
+        batch = []
+        while pending and len(batch) < self.max_batch:
+            camera_id, (job_id, jpeg_bytes, future) = pending.popitem(last=False)
+            self._in_flight[job_id] = future
+            batch.append((job_id, camera_id, jpeg_bytes))
+
+        self._busy[worker_id] = True
+        self._batches[worker_id] = tuple((job_id, camera_id) for job_id, camera_id, _ in batch)
+        self._task_queues[worker_id].put(batch)
+
+    def _collect_results(self):
+        while True:
+            kind, worker_id, payload, stats = self._result_queue.get()
+
+            with self._lock:
+                if kind == "ready":
+                    self._ready.add(worker_id)
+                    self._crash_streak.pop(worker_id, None)
+                    seconds = time.perf_counter() - self._spawned_at[worker_id]
+                    self.startup_seconds[worker_id] = seconds
+                    self.m_worker_startup.set(round(seconds, 4), str(worker_id))
+                    print(f"✅ Worker {worker_id} sẵn sàng sau {seconds * 1000:.0f} ms ({self.start_method})")
+                    continue
+
+                futures = [(self._in_flight.pop(job_id, None), result) for job_id, result, _ in payload]
+                # Chỉ kết quả của batch đang chờ mới giải phóng worker (kết quả muộn của process
+                # đã chết không được làm worker mới nhận 2 batch cùng lúc)
+                if [job_id for job_id, _, _ in payload] == [job_id for job_id, _ in self._batches[worker_id]]:
+                    self._batches[worker_id] = ()
+                    self._busy[worker_id] = False
+                    self._dispatch(worker_id)
+
+            for future, result in futures:
+                if future is not None:
+                    future.set_result(result)
+            self._record(worker_id, payload, stats)
+
+    def _record(self, worker_id, payload, stats):
+        """Đưa thời gian giai đoạn + thống kê worker vào metrics (ngoài lock của pool)"""
+        for _, result, timings in payload:
+            camera = self.camera_label(result.get("camera_id", ""))
+            if not result.get("success"):
+                self.m_frames.inc(camera, "error")
+                continue
+            self.m_frames.inc(camera, "inferred" if result.get("inferred") else "skipped")
+            for stage, seconds in (timings or {}).items():
+                self.m_stage.observe(seconds, stage)
+
+        if stats is None:
+            return
+        worker = str(worker_id)
+        self.m_rss.set(stats["rss"], f"worker{worker_id}")
+        self.m_sessions.set(stats["sessions"], worker)
+        self.m_alert_queue.set(stats["alert_queue"], worker)
+        for latency_ms in stats["alert_latencies"]:
+            self.m_alert_send.observe(latency_ms / 1000)
+        for outcome, total in stats["alerts"].items():
+            self.m_alerts.set_total(total, worker, outcome)
+        for kind, total in stats["buffers"].items():
+            self.m_buffers.set_total(total, worker, kind)
+        for kind, total in stats["decodes"].items():
+            self.m_decodes.set_total(total, worker, kind)
+        for outcome, total in (stats.get("evidence") or {}).items():
+            self.m_evidence.set_total(total, worker, outcome)
+        for outcome, total in (stats.get("recording") or {}).items():
+            self.m_recorded.set_total(total, worker, outcome)
+
+    def health(self):
+        ready = len(self._ready)
+        alive = sum(1 for p in self._processes if p.is_alive())
+        if ready == len(self._processes):
+            status = "ok"
+        else:
+            status = "degraded" if ready else "starting"     # Có worker đang start / start lại
+        return {
+            "status": status,
+            "workers": self.num_workers,
+            "start_method": self.start_method,
+            "cameras": len(self._assignment),
+            "workers_ready": ready,
+            "workers_alive": alive,
+            "worker_restarts": self.worker_restarts,
+            "pending": self.pending_count(),
+            "frames_received": self.frames_received,
+            "frames_dropped": self.frames_dropped,
+            "frames_rejected": self.frames_rejected,
+            "uptime_s": round(time.time() - self.started_at, 1),
+        }
+
+
+def _query_time(name, default=None):
+    try:
+        return float(request.args[name]) if name in request.args else default
+    except ValueError:
+        return None
+
+
+def create_app(pool, archive):
+    """
+    App Flask của dịch vụ. Chỉ tạo trong run_server(): worker (spawn / forkserver) có thể chạy lại
+    thân module chính -> không được tạo app / pool / đọc kho ghi hình lúc import
+    """
+    app = Flask(__name__)
+
+    @app.route('/process_frame', methods=['POST'])
+    def process_frame():
+        data = request.get_json(silent=True) or {}
+        image_b64 = data.get('image')
+        if not image_b64:
+            return jsonify({"success": False, "error": "Thieu truong 'image'"}), 400
+
+        try:
+            jpeg_bytes = base64.b64decode(image_b64)
+        except (ValueError, TypeError):
+            return jsonify({"success": False, "error": "Anh base64 khong hop le"}), 400
+
+        camera_id = str(data.get('camera_id') or request.headers.get('X-Camera-Id') or DEFAULT_CAMERA_ID)
+
+        t0 = time.perf_counter()
+        future = pool.submit(camera_id, jpeg_bytes)
+        if future is None:
+            return jsonify({"success": False, "status": "BUSY", "camera_id": camera_id}), 503
+
+        try:
+            result = future.result(timeout=REQUEST_TIMEOUT)
+        except FutureTimeout:
+            pool.m_frames.inc(pool.camera_label(camera_id), "timeout")
+            return jsonify({"success": False, "status": "TIMEOUT", "camera_id": camera_id}), 504
+
+        pool.m_request.observe(time.perf_counter() - t0)
+        return jsonify(result)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_endpoint():
+        return Response(pool.render_metrics(), mimetype=None, content_type=metrics.CONTENT_TYPE)
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        info = pool.health()
+        return jsonify(info), (200 if info["status"] == "ok" else 503)
+
+    @app.route('/recordings/<camera_id>', methods=['GET'])
+    def recordings_around(camera_id):
+        ts = _query_time('ts')
+        before = _query_time('before', AROUND_SECONDS)
+        after = _query_time('after', AROUND_SECONDS)
+        if ts is None or before is None or after is None:
+            return jsonify({"success": False, "error": "Thieu hoac sai 'ts' (giay, epoch)"}), 400
+
+        frames = archive.frames_around(camera_id, ts, min(before, 60.0), min(after, 60.0))
+        with_images = request.args.get('images') == '1'
+        items = []
+        for timestamp, jpeg in frames:
+            item = {"timestamp": timestamp, "size": len(jpeg)}
+            if with_images:
+                item["image"] = base64.b64encode(jpeg).decode('ascii')
+            items.append(item)
+        return jsonify({"success": True, "camera_id": camera_id, "ts": ts, "frames": items})
+
+    @app.route('/recordings/<camera_id>/frame', methods=['GET'])
+    def recording_frame(camera_id):
+        ts = _query_time('ts')
+        if ts is None:
+            return jsonify({"success": False, "error": "Thieu hoac sai 'ts' (giay, epoch)"}), 400
+        frame = archive.frame_at(camera_id, ts)
+        if frame is None:
+            return jsonify({"success": False, "error": "Khong co frame quanh thoi diem nay"}), 404
+        response = Response(frame[1], mimetype='image/jpeg')
+        response.headers['X-Frame-Timestamp'] = f"{frame[0]:.3f}"
+        return response
+
+    return app
+
+
+def run_server():
+    pool = InferencePool()
+    archive = RecordingArchive()     # Worker ghi, process chính chỉ đọc (mmap, không cần khoá)
+    app = create_app(pool, archive)
+    print(f"\n🤖 AI Inference Service - {pool.num_workers} worker(s), {pool.start_method}")
+    pool.start()
+    print(f"📡 Nhận frame tại: http://localhost:{PORT}/process_frame")
+    print(f"📈 Metrics: http://localhost:{PORT}/metrics | Health: http://localhost:{PORT}/health")
+    print('\n⌨️  Nhấn Ctrl+C để dừng\n')
+
+    try:
+        app.run(host=HOST, port=PORT, threaded=True, debug=False)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print('\n⏹️  Đang dừng worker...')
+        pool.stop()
+        print('✅ Đã dừng AI service')
+
+
+if __name__ == '__main__':
+    run_server()
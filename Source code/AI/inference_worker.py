@@ -0,0 +1,122 @@
+"""
+Worker process của dịch vụ AI (inference_service.py)
+- worker_main(): giải mã JPEG -> scheduler -> AIProcessor -> trả kết quả + thời gian từng giai đoạn
+- Module này là process mẫu (template) của forkserver: import 1 lần cv2, NumPy, MediaPipe và toàn bộ
+  module AI, chạy thử phần OpenCV trên 1 frame giả (warm_up); worker được fork từ process mẫu
+  -> sẵn sàng sau vài ms thay vì ~1 s import, các trang chỉ đọc dùng chung (copy-on-write)
+- KHÔNG chạy MediaPipe trong process mẫu: runtime MediaPipe đã chạy (kể cả graph đã đóng) làm
+  process fork ra bị treo. Graph vẫn tạo trong từng worker, theo camera (session_store.py)
+"""
+import time
+
+import cv2
+import numpy as np
+import mediapipe as mp
+
+import metrics
+from ai_processor import AIProcessor
+from frame_context import FrameContext
+from frame_ingest import BufferPool, FrameIngest
+from scheduler import InferenceScheduler
+
+
+# --- CẤU HÌNH ---
+STATS_INTERVAL = 1.0      # Worker gửi thống kê process (RSS, cảnh báo) tối đa 1 lần / giây
+WARMUP_SIZE = (1280, 720)
+
+
+def warm_up():
+    """
+    Chạy thử phần OpenCV / NumPy của pipeline trên frame giả (giải mã, đổi màu, thu nhỏ, dò tường)
+    để nạp code + bảng tra của OpenCV, thread pool của OpenCV vẫn an toàn khi fork
+    """
+    w, h = WARMUP_SIZE
+    frame = np.zeros((h, w, 3), dtype=np.uint8)
+    frame[:, :, 1] = np.linspace(0, 255, w, dtype=np.uint8)
+    cv2.line(frame, (0, h * 2 // 3), (w, h * 2 // 3), (255, 255, 255), 3)
+    jpeg = cv2.imencode(".jpg", frame)[1].tobytes()
+
+    ingest = FrameIngest()
+    ingest.begin_frame()
+    ingest.motion_gray(jpeg)
+    ctx = FrameContext(ingest.decode(jpeg), BufferPool())
+    cv2.resize(ctx.gray, (64, 48), interpolation=cv2.INTER_AREA)
+    edges = cv2.Canny(cv2.GaussianBlur(ctx.gray, (5, 5), 0), 30, 100)
+    cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=50, minLineLength=w // 3, maxLineGap=20)
+    return ctx.rgb.shape
+
+
+# Import module = nạp sẵn (forkserver gọi qua set_forkserver_preload)
+_ = mp.solutions.pose, mp.solutions.face_mesh, mp.solutions.holistic
+warm_up()
+
+
+def worker_main(worker_id, task_queue, result_queue):
+    """Vòng lặp của worker process: giải mã JPEG -> AIProcessor -> trả kết quả"""
+    processor = AIProcessor()
+    ingest = FrameIngest()                       # Giải mã thu nhỏ / đúng không gian màu
+    processor.timer.enabled = True               # Thời gian từng giai đoạn -> /metrics
+    scheduler = InferenceScheduler(processor)   # Bỏ qua suy luận khi cảnh đứng yên
+    result_queue.put(("ready", worker_id, None, None))
+    last_stats = 0.0
+
+    while True:
+        batch = task_queue.get()
+        if batch is None:
+            break
+
+        results = []
+        for job_id, camera_id, jpeg_bytes in batch:
+            t0 = time.perf_counter()
+            try:
+                # Chỉ phân tích (headless): không copy / vẽ ảnh, lớp phủ chỉ vẽ khi gửi cảnh báo
+                # Cảnh tĩnh: chỉ giải mã ảnh xám 1/8 để tính chuyển động, không giải mã đầy đủ
+                analysis, inferred = scheduler.analyze_jpeg(jpeg_bytes, camera_id, ingest)
+                if analysis is None:
+                    results.append((job_id, {"success": False, "status": "ERROR",
+                                             "error": "Khong giai ma duoc anh",
+                                             "camera_id": camera_id}, None))
+                    continue
+                # Thời gian giai đoạn chỉ có nghĩa khi frame được suy luận thật
+                timings = dict(processor.timer.timings) if inferred else {}
+                timings["decode"] = ingest.last_decode_seconds
+                timings["total"] = time.perf_counter() - t0
+                session = processor.sessions.get(camera_id)
+                detection = session.last_result
+                results.append((job_id, {"success": True,
+                                         "status": session.current_status,
+                                         "message": session.current_message,
+                                         "inferred": inferred,
+                                         "detection": detection.to_dict() if detection else None,
+                                         "camera_id": camera_id,
+                                         "worker": worker_id}, timings))
+            except Exception as e:
+                results.append((job_id, {"success": False, "status": "ERROR",
+                                         "error": str(e), "camera_id": camera_id}, None))
+
+        stats = None
+        now = time.time()
+        if now - last_stats >= STATS_INTERVAL:
+            last_stats = now
+            alerts = processor.alerts
+            stats = {"rss": metrics.process_rss_bytes(),
+                     "sessions": len(processor.sessions),
+                     "alert_queue": alerts.queue_depth(),
+                     "alert_latencies": alerts.take_latencies(),
+                     "alerts": {k: getattr(alerts, k) for k in ("sent", "failed", "rejected", "dropped", "coalesced")},
+                     "buffers": {"allocated": processor.buffers.allocations,
+                                 "reused": processor.buffers.reuses},
+                     "decodes": {"total": ingest.decodes, "reduced": ingest.reduced}}
+            if processor.evidence is not None:
+                evidence = processor.evidence.stats()
+                stats["evidence"] = {k: evidence[k] for k in ("written", "dropped")}
+            if processor.recording is not None:
+                recording = processor.recording.stats()
+                stats["recording"] = {k: recording[k] for k in ("written", "dropped")}
+        result_queue.put(("results", worker_id, results, stats))
+
+    # Dừng: ghi nốt clip bằng chứng / frame ghi hình còn trong hàng chờ
+    if processor.evidence is not None:
+        processor.evidence.close()
+    if processor.recording is not None:
+        processor.recording.close()
@@ -0,0 +1,47 @@
+"""
+Chuyển landmark MediaPipe Pose sang mảng NumPy MỘT lần mỗi frame
+- Mảng float32 (33, 4): x, y, z, visibility (tọa độ chuẩn hóa 0-1)
+- Các luật (pose_rules.py) làm việc trên mảng này, không đọc từng thuộc tính protobuf
+"""
+import itertools
+
+import numpy as np
+
+
+NUM_LANDMARKS = 33
+
+# Chỉ số điểm Pose (giống mp.solutions.pose.PoseLandmark)
+NOSE = 0
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_WRIST, RIGHT_WRIST = 15, 16
+LEFT_HIP, RIGHT_HIP = 23, 24
+
+HEAD = list(range(0, 11))                                 # Mũi, mắt, tai, miệng
+SHOULDERS = [LEFT_SHOULDER, RIGHT_SHOULDER]
+HIPS = [LEFT_HIP, RIGHT_HIP]
+TORSO = SHOULDERS + HIPS
+
+# Lát cắt liên tiếp (view, rẻ hơn chỉ số dạng list khi xử lý từng frame)
+HEAD_SLICE = slice(0, 11)
+SHOULDER_SLICE = slice(LEFT_SHOULDER, RIGHT_SHOULDER + 1)
+HIP_SLICE = slice(LEFT_HIP, RIGHT_HIP + 1)
+
+X, Y, Z, VIS = 0, 1, 2, 3
+
+
+def to_array(pose_landmarks):
+    """results.pose_landmarks (hoặc list landmark) -> float32 (33, 4), None nếu không có người"""
+    if pose_landmarks is None:
+        return None
+    landmarks = getattr(pose_landmarks, "landmark", pose_landmarks)
+    values = itertools.chain.from_iterable((lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks)
+    return np.fromiter(values, dtype=np.float32, count=len(landmarks) * 4).reshape(-1, 4)
+
+
+def stack(arrays):
+    """Gộp nhiều mảng (33, 4) thành batch (frames, 33, 4); frame không có người -> NaN"""
+    batch = np.full((len(arrays), NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    for i, kp in enumerate(arrays):
+        if kp is not None:
+            batch[i] = kp
+    return batch
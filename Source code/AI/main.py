@@ -1,17 +1,29 @@
 import cv2
 import mediapipe as mp
+import os
 import time
-import requests
-import base64
-import threading
 import numpy as np
 
+from alert_dispatcher import AlertDispatcher
+from capture import open_frame_source
+from detection_result import DetectionResult
+from evidence_buffer import EVIDENCE_ENABLED, EvidenceRecorder
+from recording import RECORDING_ENABLED, Recorder
+import landmarks as lmk
+import overlay
+from overlay import FrameAnalysis
+import pose_rules
+from stage_timer import StageTimer
+
 # --- CẤU HÌNH ---
 SERVER_URL = "http://localhost:3000/api/alert"  # Server của bạn (iottesy)
-VIDEO_STREAM_URL = "http://localhost:5000/stream"  # Webcam stream từ webcam_stream.py
+# Webcam stream từ webcam_stream.py. Chạy cùng máy: đặt VIDEO_SOURCE=shm://iot_webcam
+# để đọc thẳng từ shared memory (không encode/decode JPEG, không qua HTTP)
+VIDEO_STREAM_URL = os.environ.get("VIDEO_SOURCE", "http://localhost:5000/stream")
 WALL_LINE_Y = 0.3         # Ngưỡng leo tường (0.0 - 1.0)
 WAVE_TRIGGER_FRAMES = 30  # Cần vẫy tay/giơ tay liên tục khoảng 30 khung hình (1 giây) để kích hoạt
 SAFE_DURATION = 30        # Thời gian duy trì trạng thái Xanh (giây)
+HEADLESS = os.environ.get("HEADLESS", "0") == "1"   # Không mở cửa sổ / không vẽ (chạy trên server)
 
 class SecuritySystem:
     def __init__(self):
@@ -21,13 +33,20 @@ class SecuritySystem:
                 min_detection_confidence=0.5, 
                 min_tracking_confidence=0.5
             )
-            self.mp_drawing = mp.solutions.drawing_utils
             
             # Biến trạng thái hệ thống
             self.current_status = "UNKNOWN"
+            self.current_message = ""
             self.last_sent_time = 0
-            self.send_cooldown = 2.0
+            self.sent_status = "UNKNOWN"    # Trạng thái đã gửi cảnh báo gần nhất
+            self.send_cooldown = 2.0        # Giãn cách cảnh báo không phải RED (RED luôn gửi ngay)
             self.safe_mode_until = 0
+            self.alerts = AlertDispatcher(SERVER_URL)  # Gửi cảnh báo trên 1 luồng nền
+            self.timer = StageTimer()                  # Đo thời gian từng giai đoạn (replay.py)
+            # Clip bằng chứng RED: vòng đệm JPEG vài giây gần nhất, ghi clip trên luồng nền
+            self.evidence = EvidenceRecorder() if EVIDENCE_ENABLED else None
+            self.evidence_buffer = self.evidence.buffer() if self.evidence is not None else None
+            self.recording = Recorder() if RECORDING_ENABLED else None   # Ghi liên tục (RECORDING=1)
 
             # --- CÁC BIẾN MỚI CHO LOGIC VẪY TAY ---
             self.wave_counter = 0       # Đếm số lần lắc tay
@@ -36,108 +55,61 @@ class SecuritySystem:
             self.WAVE_THRESHOLD = 6     # Cần lắc qua lại 6 lần (3 trái, 3 phải)
             self.MIN_MOVE_DIST = 0.02   # Khoảng cách di chuyển tối thiểu (tránh nhiễu)
 
-    def send_alert_thread(self, status, message, frame):
-        """Gửi cảnh báo sang luồng khác để không lag"""
-        try:
-            _, buffer = cv2.imencode('.jpg', frame)
-            jpg_as_text = base64.b64encode(buffer).decode('utf-8')
-            
-            payload = {
-                "status": status,
-                "message": message,
-                "timestamp": time.time(),
-                "image_base64": jpg_as_text # Gửi ảnh để server lưu bằng chứng
-            }
-            response = requests.post(SERVER_URL, json=payload, timeout=2)  # BẬT GỬI THẬT
-            print(f">>> [GỬI SERVER] {status}: {message}")
-            print(f"    Server response: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"[LỖI] Không gửi được: {e}")
-
-    def check_pose_logic(self, landmarks):
-        """Kiểm tra logic Ngã và Trèo"""
-        h_list = [lm.y for lm in landmarks]
-        w_list = [lm.x for lm in landmarks]
-        
-        height = max(h_list) - min(h_list)
-        width = max(w_list) - min(w_list)
-        
+    def check_pose_logic(self, keypoints):
+        """Kiểm tra logic Ngã và Trèo trên mảng keypoints (33, 4)"""
         # 1. Logic Ngã (Chiều rộng > 1.2 chiều cao)
-        if width > height * 1.2:
+        if pose_rules.extent_fall(keypoints, 1.2):
             return "FALL"
             
         # 2. Logic Trèo (Hông cao hơn vạch)
-        l_hip = landmarks[self.mp_holistic.PoseLandmark.LEFT_HIP].y
-        r_hip = landmarks[self.mp_holistic.PoseLandmark.RIGHT_HIP].y
-        if l_hip < WALL_LINE_Y or r_hip < WALL_LINE_Y:
+        if pose_rules.climb(keypoints, WALL_LINE_Y, points=lmk.HIPS):
             return "CLIMB"
             
         return "NORMAL"
 
-    def is_waving(self, landmarks):
+    def is_waving(self, keypoints):
             """
             Kiểm tra vẫy tay theo logic ĐẢO CHIỀU (Lắc qua lắc lại)
             Trả về True nếu đã vẫy đủ số lần quy định.
             """
-            l_wrist = landmarks[self.mp_holistic.PoseLandmark.LEFT_WRIST]
-            r_wrist = landmarks[self.mp_holistic.PoseLandmark.RIGHT_WRIST]
-            l_shoulder = landmarks[self.mp_holistic.PoseLandmark.LEFT_SHOULDER]
-            r_shoulder = landmarks[self.mp_holistic.PoseLandmark.RIGHT_SHOULDER]
-            
-            # 1. Kiểm tra điều kiện cần: Tay phải cao hơn vai
-            is_raised = l_wrist.y < l_shoulder.y or r_wrist.y < r_shoulder.y
-            
-            if not is_raised:
-                # Nếu hạ tay xuống -> Reset toàn bộ bộ đếm
-                self.wave_counter = 0
-                self.prev_wrist_x = 0
-                self.prev_direction = 0
-                return False
-
-            # 2. Chọn tay đang giơ để tính toán (ưu tiên tay phải nếu cả 2 cùng giơ)
-            current_x = r_wrist.x if r_wrist.y < r_shoulder.y else l_wrist.x
-
-            # Nếu là frame đầu tiên phát hiện giơ tay
-            if self.prev_wrist_x == 0:
-                self.prev_wrist_x = current_x
-                return False
-
-            # 3. Tính toán sự di chuyển
-            dx = current_x - self.prev_wrist_x
-            
-            # Chỉ tính nếu tay di chuyển một khoảng đáng kể (tránh run tay)
-            if abs(dx) > self.MIN_MOVE_DIST:
-                current_dir = 1 if dx > 0 else -1 # 1 là Phải, -1 là Trái
+            # Tay giơ cao hơn vai? + x của tay đang giơ (ưu tiên tay phải)
+            raised, wrist_x = pose_rules.wrist_signal(keypoints)
+            previous = self.wave_counter
+            waved = pose_rules.wave_step(self, raised, wrist_x, self.MIN_MOVE_DIST, self.WAVE_THRESHOLD)
+            if self.wave_counter > previous:
+                print(f"👋 Detect Wave: {self.wave_counter}/{self.WAVE_THRESHOLD}")
+            return waved
 
-                # LOGIC CHÍNH: Nếu đổi chiều so với lần trước (đang trái sang phải hoặc ngược lại)
-                if self.prev_direction != 0 and current_dir != self.prev_direction:
-                    self.wave_counter += 1
-                    print(f"👋 Detect Wave: {self.wave_counter}/{self.WAVE_THRESHOLD}")
-
-                self.prev_direction = current_dir
-                self.prev_wrist_x = current_x
-
-            # 4. Kiểm tra xem đã vẫy đủ chưa
-            if self.wave_counter >= self.WAVE_THRESHOLD:
-                self.wave_counter = 0 # Reset để dùng cho lần sau
-                return True # Đã xác nhận vẫy tay thành công!
-
-            return False
-
-    def process_frame(self, frame):
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.holistic.process(image)
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    def analyze(self, frame):
+        """Phân tích frame -> FrameAnalysis (không vẽ; lớp phủ vẽ bằng overlay.render khi cần)"""
+        timer = self.timer
+        timer.reset()
+        if self.evidence is not None or self.recording is not None:
+            with timer.stage("evidence"):
+                now = time.time()
+                jpeg = None
+                if self.evidence is not None:
+                    jpeg = self.evidence.add_frame("default", self.evidence_buffer, now, frame)
+                if self.recording is not None:
+                    self.recording.append("default", now, frame, jpeg)
+        with timer.stage("color"):
+            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with timer.stage("inference"):
+            results = self.holistic.process(rgb)
         
         status = "YELLOW" # Mặc định là cảnh báo vàng (theo dõi)
         message = "Dang quet khu vuc..."
         color = (0, 255, 255) # Vàng
+        analysis = FrameAnalysis("default", status, message, color)
+        analysis.set_wall(WALL_LINE_Y, color=(0, 0, 255))
+        keypoints = None
+        trigger = None      # Luật sinh ra cảnh báo (fall | climb | face)
 
         if results.pose_landmarks:
-            landmarks = results.pose_landmarks.landmark
-            
             # 1. KIỂM TRA MỐI NGUY HIỂM (Ưu tiên cao nhất)
-            pose_status = self.check_pose_logic(landmarks)
+            with timer.stage("pose_rules"):
+                keypoints = lmk.to_array(results.pose_landmarks)
+                pose_status = self.check_pose_logic(keypoints)
             has_face = results.face_landmarks is not None
             
             # Nếu phát hiện NGÃ hoặc TRÈO -> BÁO ĐỎ NGAY LẬP TỨC
@@ -146,14 +118,17 @@ class SecuritySystem:
                 status = "RED"
                 message = "NGUY HIEM: Phat hien nguoi NGA!"
                 color = (0, 0, 255)
+                trigger = "fall"
             elif pose_status == "CLIMB":
                 status = "RED"
                 message = "NGUY HIEM: Phat hien LEO TUONG!"
                 color = (0, 0, 255)
+                trigger = "climb"
             elif not has_face:
                 status = "RED"
                 message = "CANH BAO: Nguoi giau mat / Quay lung"
                 color = (0, 0, 255)
+                trigger = "face"
             
             else:
                 # Nếu không có nguy hiểm, kiểm tra logic XANH (AN TOÀN)
@@ -166,83 +141,131 @@ class SecuritySystem:
                     color = (0, 255, 0)
                 else:
                     # Nếu chưa an toàn, kiểm tra xem có đang vẫy tay để kích hoạt không
-                    if self.is_waving(landmarks):
+                    if self.is_waving(keypoints):
                         # Nếu hàm trả về True nghĩa là ĐÃ vẫy đủ 6 lần
                         self.safe_mode_until = time.time() + SAFE_DURATION
                         message = "DA KICH HOAT CHE DO AN TOAN!"
                         print(message)
                         # Nếu vẫy đủ số lượng frame -> Kích hoạt 30s
                     if self.wave_counter > 0:
-                         cv2.putText(image, f"Vay tay: {self.wave_counter}/{self.WAVE_THRESHOLD}", 
-                                   (10, 150), cv2.QT_FONT_NORMAL, 0.7, (0, 255, 255), 2)
+                         analysis.notes.append((f"Vay tay: {self.wave_counter}/{self.WAVE_THRESHOLD}",
+                                                (10, 150), (0, 255, 255)))
                     else:
                         # Nếu bỏ tay xuống thì reset bộ đếm (hoặc trừ dần nếu muốn mượt hơn)
                         self.wave_counter = 0
                         status = "YELLOW"
                         message = "Phat hien nguoi - Chua xac minh"
 
-            # Vẽ xương khớp
-            self.mp_drawing.draw_landmarks(image, results.pose_landmarks, self.mp_holistic.POSE_CONNECTIONS)
+            # Xương khớp (vẽ khi render)
+            analysis.add_person(results.pose_landmarks)
 
         else:
             status = "NORMAL" # Không có người
             message = "Khong co nguoi"
             color = (200, 200, 200)
 
-        # Gửi cảnh báo nếu trạng thái thay đổi
-        if status != self.current_status:
-            # Chỉ gửi nếu trạng thái quan trọng (Đỏ/Xanh) hoặc hết thời gian chờ
-            if time.time() - self.last_sent_time > self.send_cooldown:
-                t = threading.Thread(target=self.send_alert_thread, args=(status, message, image))
-                t.start()
-                self.last_sent_time = time.time()
-            self.current_status = status
-
-        # Hiển thị UI
-        cv2.rectangle(image, (0,0), (640, 80), (0,0,0), -1) # Nền đen cho chữ dễ đọc
-        cv2.putText(image, f"STATUS: {status}", (10, 30), cv2.QT_FONT_NORMAL, 1, color, 2)
-        cv2.putText(image, message, (10, 60), cv2.QT_FONT_NORMAL, 0.6, (255, 255, 255), 1)
-        
-        # Vẽ vạch tường
-        h, w, _ = image.shape
-        cv2.line(image, (0, int(h * WALL_LINE_Y)), (w, int(h * WALL_LINE_Y)), (0, 0, 255), 2)
+        analysis.status, analysis.message, analysis.color = status, message, color
+        # Kết quả gọn (keypoints float32, confidence, bbox, tường) gửi kèm cảnh báo
+        with timer.stage("pose_rules"):
+            result = DetectionResult.from_keypoints("default", status, message, keypoints,
+                                                    WALL_LINE_Y, trigger)
+        analysis.result = result
 
-        return image
+        now = time.time()
+        if status != self.current_status and status == "RED" and self.evidence is not None:
+            self.evidence.trigger("default", self.evidence_buffer, now,
+                                  {"status": status, "message": message, "trigger": trigger,
+                                   "detection": result.to_dict()})
+        self.current_status = status
+
+        # Gửi cảnh báo khi trạng thái đổi (ảnh gốc, lớp phủ vẽ lúc encode): RED gửi ngay,
+        # trạng thái khác đổi trong cooldown thì gửi trạng thái hiện tại khi hết cooldown
+        if status != self.sent_status and (status == "RED" or now - self.last_sent_time > self.send_cooldown):
+            self.alerts.submit(status, message, frame, result=result, render=overlay.renderer(analysis))
+            self.sent_status = status
+            self.last_sent_time = now
+        self.current_message = message
+
+        return analysis
+
+    def process_frame(self, frame):
+        """analyze() + vẽ lớp phủ (Hiển thị UI)"""
+        analysis = self.analyze(frame)
+        with self.timer.stage("draw"):
+            return overlay.render(frame.copy(), analysis)
 
 # --- CHẠY LẤY STREAM TỪ SERVER (giả lập ESP32) ---
-print(f"🔗 Đang kết nối đến stream: {VIDEO_STREAM_URL}")
-print("⏳ Đợi vài giây để kết nối...")
-
-cap = cv2.VideoCapture(VIDEO_STREAM_URL)
-system = SecuritySystem()
-
-if not cap.isOpened():
-    print("❌ KHÔNG THỂ KẾT NỐI STREAM!")
-    print("Kiểm tra:")
-    print("1. webcam_stream.py đã chạy chưa?")
-    print("2. URL đúng chưa:", VIDEO_STREAM_URL)
-    exit()
-
-print("✅ Đã kết nối stream thành công!")
-print("📺 Cửa sổ AI Monitor sẽ hiện ra")
-print("⌨️  Nhấn ESC để thoát\n")
-
-while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret: 
-        print("⚠️  Mất kết nối stream, thử lại...")
-        time.sleep(2)
-        cap = cv2.VideoCapture(VIDEO_STREAM_URL)
-        continue
-    
-    # Flip ảnh cho giống gương
-    frame = cv2.flip(frame, 1)
-    
-    output = system.process_frame(frame)
-    cv2.imshow('AI Monitor', output)
-    
-    if cv2.waitKey(1) & 0xFF == 27: break  # ESC để thoát
-
-cap.release()
-cv2.destroyAllWindows()
-print("\n✅ Đã đóng AI Monitor")
\ No newline at end of file
+def main(headless=HEADLESS):
+    print(f"🔗 Đang kết nối đến stream: {VIDEO_STREAM_URL}")
+    print("⏳ Đợi vài giây để kết nối...")
+
+    # Đọc stream trên luồng riêng: luôn lấy frame mới nhất, tự kết nối lại khi mất stream
+    reader = open_frame_source(VIDEO_STREAM_URL, name="stream")
+    system = SecuritySystem()
+
+    ok, frame = reader.read(timeout=10)
+    if not ok:
+        print("❌ KHÔNG THỂ KẾT NỐI STREAM!")
+        print("Kiểm tra:")
+        print("1. webcam_stream.py đã chạy chưa?")
+        print("2. URL đúng chưa:", VIDEO_STREAM_URL)
+        reader.stop()
+        return
+
+    print("✅ Đã kết nối stream thành công!")
+    if headless:
+        print("🖥️  Chế độ headless: chỉ in trạng thái khi thay đổi")
+        print("⌨️  Nhấn Ctrl+C để thoát\n")
+    else:
+        print("📺 Cửa sổ AI Monitor sẽ hiện ra")
+        print("⌨️  Nhấn ESC để thoát\n")
+
+    last_status = None
+    try:
+        while True:
+            if frame is not None:
+                # Flip ảnh cho giống gương - cả 2 chế độ, để phân tích / ảnh cảnh báo / clip
+                # bằng chứng cùng chiều dù HEADLESS bật hay tắt
+                frame = cv2.flip(frame, 1)
+
+            if headless:
+                # Chỉ phân tích (không vẽ, không cửa sổ)
+                if frame is not None:
+                    analysis = system.analyze(frame)
+                    if analysis.status != last_status:
+                        last_status = analysis.status
+                        print(f"[{time.strftime('%H:%M:%S')}] {analysis.status}: {analysis.message}")
+                ok, frame = reader.read(timeout=0.5)
+                if not ok:
+                    frame = None
+                continue
+
+            if frame is not None:
+                output = system.process_frame(frame)
+                cv2.imshow('AI Monitor', output)
+
+            if cv2.waitKey(1) & 0xFF == 27: break  # ESC để thoát
+
+            ok, frame = reader.read(timeout=0.5)
+            if not ok:
+                frame = None    # Đang chờ kết nối lại (reader tự xử lý)
+    except KeyboardInterrupt:
+        print("\n⚠️ Đã dừng bởi người dùng")
+    finally:
+        stats = reader.stats()
+        reader.stop()
+        system.alerts.close()
+        if system.evidence is not None:
+            system.evidence.close()
+        if system.recording is not None:
+            system.recording.close()
+        if not headless:
+            cv2.destroyAllWindows()
+        print(f"📊 Đã đọc {stats['frames_read']} frame, bỏ {stats['frames_dropped']} frame cũ, "
+              f"kết nối lại {stats['reconnects']} lần")
+        print("\n✅ Đã đóng AI Monitor")
+
+
+if __name__ == '__main__':
+    import sys
+    main(headless=HEADLESS or '--headless' in sys.argv)
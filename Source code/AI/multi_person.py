@@ -0,0 +1,132 @@
+"""
+Chế độ nhiều người (INFERENCE_BACKEND=multi) thay cho Holistic chỉ thấy 1 người
+- PersonDetector (HOG) mỗi DETECT_EVERY frame -> PersonTracker gán ID ổn định
+- Pose chỉ chạy trên vùng cắt (ROI) của từng track, tối đa MAX_POSE_PER_FRAME track / frame
+  (ưu tiên: track chưa có Pose, track đang báo đỏ, track lâu chưa được chạy)
+- Landmark của vùng cắt được đổi về tọa độ toàn khung -> dùng nguyên các luật, Face Mesh vùng đầu
+- Không phát hiện được ai (cận cảnh, chỉ thấy nửa người) -> chạy Pose toàn khung làm dự phòng
+"""
+import numpy as np
+
+import landmarks as lmk
+import pose_rules
+from cascade import POSE_MODEL_COMPLEXITY, CascadePipeline, CascadeResults, remap_landmarks
+from person_detector import PersonDetector
+from tracker import PersonTracker
+
+
+# --- CẤU HÌNH ---
+DETECT_EVERY = 3              # Chạy bộ phát hiện người mỗi N frame (frame giữa: bám theo Pose)
+MAX_POSE_PER_FRAME = 2        # Ngân sách: số track tối đa được chạy Pose trong 1 frame
+ROI_PADDING = 0.15            # Nới vùng cắt quanh khung người mỗi phía
+POSE_BOX_PADDING = 0.1        # Nới khung tính từ keypoints khi cập nhật track
+MIN_ROI_SIZE = 32             # Vùng cắt nhỏ hơn (pixel) -> bỏ qua
+
+
+def pad_box(box, padding, w, h):
+    x1, y1, x2, y2 = box[:4]
+    pw, ph = (x2 - x1) * padding, (y2 - y1) * padding
+    return (max(0, int(x1 - pw)), max(0, int(y1 - ph)),
+            min(w, int(x2 + pw)), min(h, int(y2 + ph)))
+
+
+def keypoints_box(keypoints, w, h):
+    """Khung pixel của các điểm nhìn thấy (đã nới POSE_BOX_PADDING)"""
+    x1, y1, x2, y2 = pose_rules.bbox(keypoints, pose_rules.VISIBLE_THRESHOLD)
+    return pad_box((x1 * w, y1 * h, x2 * w, y2 * h), POSE_BOX_PADDING, w, h)
+
+
+class MultiResults:
+    """Kết quả 1 frame: [(track, CascadeResults hoặc None nếu track không được chạy Pose)]"""
+
+    def __init__(self, people):
+        self.people = people
+
+    @property
+    def pose_landmarks(self):
+        """Tương thích code 1 người: landmark của track đầu tiên có Pose ở frame này"""
+        for _, result in self.people:
+            if result is not None and result.pose_landmarks is not None:
+                return result.pose_landmarks
+        return None
+
+
+class MultiPersonPipeline:
+    def __init__(self, model_complexity=POSE_MODEL_COMPLEXITY, detect_every=DETECT_EVERY,
+                 max_pose_per_frame=MAX_POSE_PER_FRAME, detector=None):
+        # Pose + Face Mesh ở chế độ ảnh tĩnh: vùng cắt mỗi lần một khác
+        self.engine = CascadePipeline(model_complexity=model_complexity, static_image_mode=True)
+        self.detector = detector or PersonDetector()
+        self.tracker = PersonTracker()
+        self.detect_every = detect_every
+        self.max_pose_per_frame = max_pose_per_frame
+        self.frame_index = 0
+
+        self.detect_runs = 0
+        self.pose_runs = 0
+        self.fallback_runs = 0
+
+    @property
+    def face_runs(self):
+        return self.engine.face_runs
+
+    def process(self, rgb):
+        h, w = rgb.shape[:2]
+        self.frame_index += 1
+        prefetched = {}
+
+        if (self.frame_index - 1) % self.detect_every == 0 or not self.tracker.tracks:
+            self.detect_runs += 1
+            detections = self.detector.detect(rgb)
+            fallback = None
+            if not detections:
+                fallback = self._full_frame_pose(rgb)
+                if fallback is not None:
+                    detections = [keypoints_box(lmk.to_array(fallback), w, h) + (0.0,)]
+            self.tracker.update(detections)
+            if fallback is not None:
+                # Track vừa ghép với khung dự phòng đã có Pose -> không chạy lại
+                for track in self.tracker.tracks:
+                    if track.visible and track.bbox == tuple(detections[0][:4]):
+                        prefetched[track.id] = CascadeResults(self.engine, rgb, fallback)
+                        track.last_pose_frame = self.frame_index
+                        break
+
+        # Ngân sách Pose: track chưa có Pose -> đang báo đỏ -> lâu chưa chạy nhất
+        candidates = [t for t in self.tracker.tracks if t.visible and t.id not in prefetched]
+        candidates.sort(key=lambda t: (t.last_pose_frame >= 0, t.status != "RED", t.last_pose_frame))
+        budget = max(0, self.max_pose_per_frame - len(prefetched))
+        chosen = {t.id for t in candidates[:budget]}
+
+        people = []
+        for track in self.tracker.tracks:
+            result = prefetched.get(track.id)
+            if result is None and track.id in chosen:
+                result = self._track_pose(rgb, track)
+            if result is not None and result.pose_landmarks is not None:
+                track.keypoints = lmk.to_array(result.pose_landmarks)
+                track.update_bbox(keypoints_box(track.keypoints, w, h))
+            people.append((track, result))
+        return MultiResults(people)
+
+    def _full_frame_pose(self, rgb):
+        self.fallback_runs += 1
+        self.pose_runs += 1
+        return self.engine.pose.process(rgb).pose_landmarks
+
+    def _track_pose(self, rgb, track):
+        h, w = rgb.shape[:2]
+        roi = pad_box(track.bbox, ROI_PADDING, w, h)
+        if roi[2] - roi[0] < MIN_ROI_SIZE or roi[3] - roi[1] < MIN_ROI_SIZE:
+            return None
+
+        crop = np.ascontiguousarray(rgb[roi[1]:roi[3], roi[0]:roi[2]])
+        self.pose_runs += 1
+        track.last_pose_frame = self.frame_index
+        landmarks = self.engine.pose.process(crop).pose_landmarks
+        if landmarks is not None:
+            landmarks = remap_landmarks(landmarks, roi, w, h)
+        return CascadeResults(self.engine, rgb, landmarks)
+
+    def close(self):
+        self.engine.close()
@@ -0,0 +1,93 @@
+"""
+Lớp phủ (overlay) tách khỏi phân tích
+- AIProcessor.analyze() / SecuritySystem.analyze() chỉ trả về FrameAnalysis (không copy, không vẽ)
+- render() vẽ skeleton, khung người, vạch tường, trạng thái lên ảnh KHI CẦN:
+  có người xem (cửa sổ cv2.imshow) hoặc lúc encode ảnh cảnh báo (trên luồng gửi)
+- Server headless không tốn chi phí copy / vẽ cho mỗi frame
+"""
+import cv2
+import mediapipe as mp
+
+
+# --- CẤU HÌNH ---
+STATUS_BOX = ((10, 10), (630, 80))
+WALL_COLOR = (0, 255, 0)
+
+_drawing = mp.solutions.drawing_utils
+_POSE_CONNECTIONS = mp.solutions.pose.POSE_CONNECTIONS
+
+
+class FrameAnalysis:
+    """Kết quả phân tích 1 frame + những gì cần vẽ (nhẹ, không giữ ảnh)"""
+
+    __slots__ = ("camera_id", "status", "message", "color", "result", "inferred",
+                 "wall_y", "wall_label", "wall_color", "people", "notes")
+
+    def __init__(self, camera_id, status, message, color, result=None, inferred=True):
+        self.camera_id = camera_id
+        self.status = status
+        self.message = message
+        self.color = color
+        self.result = result            # DetectionResult (None khi frame bị bỏ qua suy luận)
+        self.inferred = inferred        # False: scheduler bỏ qua, chỉ lặp lại trạng thái cũ
+        self.wall_y = None              # Vạch tường chuẩn hóa (None = không vẽ)
+        self.wall_label = None
+        self.wall_color = WALL_COLOR
+        self.people = []                # [(pose_landmarks, box pixel hoặc None, nhãn, màu)]
+        self.notes = []                 # [(chữ, (x, y), màu)] - vd. bộ đếm vẫy tay
+
+    def add_person(self, pose_landmarks, box=None, label=None, color=None):
+        self.people.append((pose_landmarks, box, label, color))
+
+    def set_wall(self, wall_y, label=None, color=WALL_COLOR):
+        self.wall_y = wall_y
+        self.wall_label = label
+        self.wall_color = color
+
+
+def draw_status(image, status, message, status_color):
+    """Vẽ khung trạng thái lên ảnh"""
+    (x1, y1), (x2, y2) = STATUS_BOX
+    cv2.rectangle(image, (x1, y1), (x2, y2), (0, 0, 0), -1)
+    cv2.putText(image, f"Status: {status}", (20, 40),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
+    cv2.putText(image, message, (20, 65),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
+
+def draw_wall(image, wall_y, label=None, color=WALL_COLOR):
+    h, w = image.shape[:2]
+    wall_pixel_y = int(wall_y * h)
+    cv2.line(image, (0, wall_pixel_y), (w, wall_pixel_y), color, 3)
+    if label:
+        cv2.putText(image, label, (10, wall_pixel_y - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+
+def draw_person(image, pose_landmarks, box=None, label=None, color=None):
+    """Skeleton + khung người có nhãn (chế độ nhiều người)"""
+    if pose_landmarks is not None:
+        _drawing.draw_landmarks(image, pose_landmarks, _POSE_CONNECTIONS)
+    if box is not None:
+        x1, y1, x2, y2 = box
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+        if label:
+            cv2.putText(image, label, (x1, max(15, y1 - 8)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+
+def render(image, analysis):
+    """Vẽ toàn bộ lớp phủ của analysis lên image (vẽ tại chỗ, trả về image)"""
+    if analysis.wall_y:
+        draw_wall(image, analysis.wall_y, analysis.wall_label, analysis.wall_color)
+    for pose_landmarks, box, label, color in analysis.people:
+        draw_person(image, pose_landmarks, box, label, color)
+    for text, position, color in analysis.notes:
+        cv2.putText(image, text, position, cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+    draw_status(image, analysis.status, analysis.message, analysis.color)
+    return image
+
+
+def renderer(analysis):
+    """Hàm vẽ lười cho AlertDispatcher: chỉ chạy khi thật sự encode ảnh cảnh báo"""
+    return lambda image: render(image, analysis)
@@ -0,0 +1,51 @@
+"""
+Phát hiện người nhẹ (nhiều người / frame) cho chế độ multi_person
+- Mặc định dùng HOG + SVM người đi bộ có sẵn trong OpenCV (không cần tải model)
+- Chạy trên ảnh thu nhỏ (DETECT_WIDTH) rồi đổi tọa độ về khung gốc
+- Gộp các khung trùng nhau bằng NMS
+HOG hợp với camera giám sát thấy toàn thân; cận cảnh (chỉ nửa người) thì
+multi_person.py tự chạy Pose toàn khung làm phương án dự phòng.
+"""
+import cv2
+import numpy as np
+
+
+# --- CẤU HÌNH ---
+DETECT_WIDTH = 320            # Chiều rộng ảnh đưa vào HOG (nhỏ hơn = nhanh hơn, bỏ sót người xa)
+MIN_SCORE = 0.3               # Ngưỡng điểm SVM
+NMS_THRESHOLD = 0.4
+HOG_WIN_STRIDE = (8, 8)
+HOG_SCALE = 1.05
+
+
+class PersonDetector:
+    def __init__(self, detect_width=DETECT_WIDTH, min_score=MIN_SCORE):
+        self.detect_width = detect_width
+        self.min_score = min_score
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def detect(self, frame):
+        """Trả về [(x1, y1, x2, y2, score)] theo pixel của frame gốc"""
+        h, w = frame.shape[:2]
+        scale = 1.0
+        small = frame
+        if self.detect_width and w > self.detect_width:
+            scale = w / self.detect_width
+            small = cv2.resize(frame, (self.detect_width, int(h / scale)), interpolation=cv2.INTER_AREA)
+
+        rects, weights = self.hog.detectMultiScale(small, winStride=HOG_WIN_STRIDE,
+                                                   padding=(8, 8), scale=HOG_SCALE)
+        if len(rects) == 0:
+            return []
+
+        scores = np.asarray(weights, dtype=np.float32).reshape(-1)
+        keep = cv2.dnn.NMSBoxes([list(map(int, r)) for r in rects], scores.tolist(),
+                                self.min_score, NMS_THRESHOLD)
+        detections = []
+        for i in np.asarray(keep).reshape(-1):
+            x, y, bw, bh = rects[i]
+            detections.append((int(x * scale), int(y * scale),
+                               int(min(w, (x + bw) * scale)), int(min(h, (y + bh) * scale)),
+                               float(scores[i])))
+        return detections
@@ -0,0 +1,201 @@
+"""
+Luật NGÃ / LEO TƯỜNG / VẪY TAY / khung người dạng vector hóa trên mảng keypoints
+- Đầu vào: (33, 4) của 1 frame hoặc batch (frames, 33, 4) (xem landmarks.py)
+- Đầu ra cùng số chiều batch: 1 frame -> giá trị 0 chiều, batch -> mảng (frames,)
+- Frame không có người trong batch để NaN (landmarks.stack) -> status "NO_PERSON"
+Dùng chung cho AIProcessor, SecuritySystem, replay và batch nhiều camera.
+"""
+import numpy as np
+
+from landmarks import HEAD_SLICE, HIP_SLICE, LEFT_SHOULDER, LEFT_WRIST, RIGHT_SHOULDER, \
+    RIGHT_WRIST, SHOULDER_SLICE, TORSO, VIS, X, Y
+
+
+# --- CẤU HÌNH ---
+VISIBLE_THRESHOLD = 0.5       # Điểm có visibility thấp hơn coi như không thấy
+HORIZONTAL_ANGLE = 45         # Trục vai-hông lệch khỏi phương ngang ít hơn -> nằm
+COMPRESSED_RATIO = 0.8        # Chiều dọc thân < 0.8 * bề rộng vai -> thân bị "bẹt"
+FALLBACK_FALL_RATIO = 1.5     # Không thấy thân: rộng > 1.5 * cao -> NGÃ
+
+
+def _as_wall(wall_y, shape):
+    """wall_y (số / None / mảng theo frame) -> mảng float, NaN = không có tường"""
+    if wall_y is None:
+        return np.full(shape, np.nan, dtype=np.float32)
+    wall = np.asarray(wall_y, dtype=np.float32)
+    return np.where(wall > 0, wall, np.nan)          # 0 / âm coi như không có tường
+
+
+def present(kp):
+    """Có người (frame không phải NaN)"""
+    return ~np.isnan(kp[..., 0, X])
+
+
+def bbox(kp, threshold=None):
+    """
+    Khung bao (x1, y1, x2, y2) -> (..., 4)
+    threshold: chỉ lấy điểm có visibility >= threshold (không điểm nào đạt -> lấy tất cả)
+    """
+    xy = kp[..., :2]
+    if threshold is not None:
+        visible = kp[..., VIS] >= threshold
+        visible |= ~visible.any(axis=-1, keepdims=True)
+        xy = np.where(visible[..., None], xy, np.nan)
+    lo = np.fmin.reduce(xy, axis=-2)
+    hi = np.fmax.reduce(xy, axis=-2)
+    return np.concatenate([lo, hi], axis=-1)
+
+
+def torso_axis(kp):
+    """(dx, dy, shoulder_width) của trục từ giữa vai xuống giữa hông"""
+    shoulders = kp[..., SHOULDER_SLICE, :2]
+    hips = kp[..., HIP_SLICE, :2]
+    d = (hips[..., 0, :] + hips[..., 1, :] - shoulders[..., 0, :] - shoulders[..., 1, :]) * 0.5
+    shoulder_width = np.abs(shoulders[..., 0, X] - shoulders[..., 1, X])
+    return d[..., X], d[..., Y], shoulder_width
+
+
+def extent_fall(kp, ratio):
+    """Khung người rộng hơn ratio * chiều cao"""
+    box = bbox(kp)
+    width = box[..., 2] - box[..., 0]
+    height = box[..., 3] - box[..., 1]
+    return width > height * ratio
+
+
+def fall(kp):
+    """
+    Luật NGÃ của AIProcessor:
+    - Thấy rõ vai + hông: trục thân nằm ngang (góc < 45 hoặc > 135 độ) hoặc thân bị bẹt
+    - Không thấy rõ: khung người rộng > 1.5 * cao
+    """
+    dx, dy, shoulder_width = torso_axis(kp)
+    confident = ((kp[..., SHOULDER_SLICE, VIS] > VISIBLE_THRESHOLD).all(axis=-1)
+                 & (kp[..., HIP_SLICE, VIS] > VISIBLE_THRESHOLD).all(axis=-1))
+
+    angle = np.abs(np.degrees(np.arctan2(dy, dx)))
+    horizontal = (angle < HORIZONTAL_ANGLE) | (angle > 180 - HORIZONTAL_ANGLE)
+    compressed = np.abs(dy) < shoulder_width * COMPRESSED_RATIO
+    torso_fall = horizontal | compressed
+
+    if kp.ndim == 2:
+        # 1 frame: chỉ tính khung người khi thật sự cần (không thấy rõ thân)
+        return torso_fall if confident else extent_fall(kp, FALLBACK_FALL_RATIO)
+    return np.where(confident, torso_fall, extent_fall(kp, FALLBACK_FALL_RATIO))
+
+
+def climb(kp, wall_y, points=TORSO):
+    """Điểm cao nhất trong points nằm trên vạch tường (y nhỏ hơn)"""
+    top = kp[..., points, Y].min(axis=-1)
+    wall = _as_wall(wall_y, top.shape)
+    return top < wall
+
+
+def pose_status(kp, wall_y=None):
+    """ "FALL" | "CLIMB" | "NORMAL" (| "NO_PERSON" trong batch)"""
+    is_fall = fall(kp)
+    is_climb = climb(kp, wall_y)
+    status = np.where(is_fall, "FALL", np.where(is_climb, "CLIMB", "NORMAL"))
+    return np.where(present(kp), status, "NO_PERSON")
+
+
+def wrist_signal(kp):
+    """
+    (raised, x): có tay nào giơ cao hơn vai không, và x của tay đang giơ
+    (ưu tiên tay phải nếu cả 2 cùng giơ)
+    """
+    right_up = kp[..., RIGHT_WRIST, Y] < kp[..., RIGHT_SHOULDER, Y]
+    left_up = kp[..., LEFT_WRIST, Y] < kp[..., LEFT_SHOULDER, Y]
+    x = np.where(right_up, kp[..., RIGHT_WRIST, X], kp[..., LEFT_WRIST, X])
+    return right_up | left_up, x
+
+
+def wave_step(state, raised, x, min_move, threshold):
+    """
+    Bước máy trạng thái vẫy tay (đếm số lần đổi chiều của cổ tay).
+    state: đối tượng có wave_counter, prev_wrist_x, prev_direction (session / SecuritySystem)
+    Trả về True khi đã vẫy đủ threshold lần.
+    """
+    if not raised:
+        state.wave_counter = 0
+        state.prev_wrist_x = 0
+        state.prev_direction = 0
+        return False
+
+    x = float(x)
+    if state.prev_wrist_x == 0:
+        state.prev_wrist_x = x
+        return False
+
+    dx = x - state.prev_wrist_x
+    if abs(dx) > min_move:
+        direction = 1 if dx > 0 else -1
+        if state.prev_direction != 0 and direction != state.prev_direction:
+            state.wave_counter += 1
+        state.prev_direction = direction
+        state.prev_wrist_x = x
+
+    if state.wave_counter >= threshold:
+        state.wave_counter = 0
+        return True
+    return False
+
+
+class _WaveState:
+    def __init__(self):
+        self.wave_counter = 0
+        self.prev_wrist_x = 0
+        self.prev_direction = 0
+
+
+def wave_triggers(kp, min_move, threshold):
+    """Batch (frames, 33, 4) -> mảng bool: frame nào hoàn thành 1 lần vẫy tay"""
+    raised, xs = wrist_signal(kp)
+    raised &= present(kp)
+    state = _WaveState()
+    return np.array([wave_step(state, r, x, min_move, threshold) for r, x in zip(raised, xs)],
+                    dtype=bool)
+
+
+def rule_confidence(kp, wall_y=None):
+    """
+    Độ tin cậy 0-1 cho từng luật, tính từ visibility và hình học của keypoints:
+    - person: visibility trung bình toàn thân
+    - fall:   visibility thân * độ nghiêng của trục vai-hông so với phương thẳng đứng
+    - climb:  visibility thân * mức thân trên vượt lên trên vạch tường
+    - face:   visibility trung bình các điểm mặt (mũi, mắt, tai, miệng)
+    """
+    torso = kp[..., TORSO, :]
+    torso_vis = torso[..., VIS].mean(axis=-1)
+    dx, dy, _ = torso_axis(kp)
+    length = np.hypot(dx, dy)
+    tilt = np.where(length > 1e-6, np.abs(dx) / np.maximum(length, 1e-6), 1.0)  # 0 đứng, 1 nằm
+
+    climb_score = np.zeros_like(torso_vis)
+    if wall_y is not None:
+        margin = _as_wall(wall_y, torso_vis.shape) - torso[..., Y].min(axis=-1)
+        climb_score = np.nan_to_num(torso_vis * np.clip(0.5 + margin * 5, 0.0, 1.0))
+
+    return {
+        "person": kp[..., VIS].mean(axis=-1),
+        "fall": torso_vis * np.minimum(1.0, tilt / np.sqrt(0.5)),
+        "climb": climb_score,
+        "face": kp[..., HEAD_SLICE, VIS].mean(axis=-1),
+    }
+
+
+def score(kp, wall_y=None, min_move=0.02, wave_threshold=3):
+    """
+    Chấm điểm toàn bộ batch (frames, 33, 4) trong 1 lần gọi (replay / nhiều camera):
+    status, fall, climb, bbox (điểm nhìn thấy), confidence từng luật, wave (nếu là chuỗi frame)
+    """
+    result = {
+        "status": pose_status(kp, wall_y),
+        "fall": fall(kp),
+        "climb": climb(kp, wall_y),
+        "bbox": bbox(kp, VISIBLE_THRESHOLD),
+        "confidence": rule_confidence(kp, wall_y),
+    }
+    if kp.ndim == 3:
+        result["wave"] = wave_triggers(kp, min_move, wave_threshold)
+    return result
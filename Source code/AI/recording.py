@@ -0,0 +1,343 @@
+"""
+Lưu trữ ghi hình liên tục theo segment + chỉ mục thời gian, tìm frame quanh 1 thời điểm cảnh báo
+- Mỗi camera: <RECORDING_DIR>/<camera>/<start_ms>.seg  = các JPEG nối liền nhau (không encode lại)
+                                        <start_ms>.idx  = chỉ mục 12 byte / frame:
+                                        (ms tính từ đầu segment, offset, size), uint32 little-endian
+- Segment mới sau SEGMENT_SECONDS giây hoặc SEGMENT_MAX_BYTES byte; khi đổi segment xoá segment cũ
+  nhất nếu tổng dung lượng > RECORDING_MAX_BYTES hoặc cũ hơn RECORDING_MAX_AGE
+  + Nhiều worker (process) ghi chung thư mục: không xoá segment vừa được ghi trong SEGMENT_SECONDS
+    giây (có thể đang là segment của worker khác), tên segment tạo độc quyền (O_EXCL)
+- Recorder.append() gọi trên luồng suy luận: chỉ đưa (camera, thời điểm, JPEG) vào hàng chờ giới hạn
+  byte, luồng nền ghi đĩa (ghi dữ liệu trước, chỉ mục sau -> bên đọc không thấy frame ghi dở)
+- RecordingArchive: đọc chỉ mục + segment qua mmap, tìm bằng searchsorted trên chỉ mục
+  -> lấy frame quanh 1 thời điểm chỉ chạm vài trang chỉ mục + đúng các byte JPEG cần lấy,
+  không quét / giải mã cả segment; đọc được cả segment đang ghi (từ process khác)
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+
+import cv2
+import numpy as np
+
+from evidence_buffer import camera_dirname
+
+
+# --- CẤU HÌNH ---
+RECORDING_ENABLED = os.environ.get("RECORDING", "0") == "1"     # Ghi liên tục: tốn đĩa, mặc định tắt
+RECORDING_DIR = os.environ.get("RECORDING_DIR",
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings"))
+SEGMENT_SECONDS = 60.0
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+RECORDING_MAX_BYTES = int(float(os.environ.get("RECORDING_MAX_GB", "2")) * 1024 ** 3)
+RECORDING_MAX_AGE = 24 * 3600.0
+RECORDING_FPS = 10.0                   # Frame dày hơn bị bỏ trước khi encode / ghi
+RECORDING_MAX_WIDTH = 640              # Frame BGR rộng hơn được thu nhỏ trước khi encode
+RECORDING_JPEG_QUALITY = 70
+MAX_QUEUE_BYTES = 8 * 1024 * 1024      # Hàng chờ ghi đĩa; đầy -> bỏ frame mới (không chặn)
+AROUND_SECONDS = 5.0                   # Mặc định frames_around(): 5 s trước + 5 s sau
+
+INDEX_RECORD = struct.Struct("<III")
+INDEX_DTYPE = np.dtype([("ms", "<u4"), ("offset", "<u4"), ("size", "<u4")])
+
+
+class Segment:
+    """Segment đang ghi của 1 camera (chỉ luồng ghi dùng)"""
+
+    def __init__(self, camera_dir, timestamp):
+        self.start_ms = int(timestamp * 1000)
+        while True:
+            # Tạo mới độc quyền: không bao giờ 2 bộ ghi cùng nối vào 1 segment (offset riêng -> hỏng chỉ mục)
+            self.base = os.path.join(camera_dir, f"{self.start_ms:013d}")
+            try:
+                self.data = open(self.base + ".seg", "xb")
+                break
+            except FileExistsError:
+                self.start_ms += 1
+        self.index = open(self.base + ".idx", "wb")
+        self.nbytes = 0                   # Đã ghi
+        self.size = 0                     # Đã ghi + đang chờ ghi trong loạt hiện tại
+        self.frames = 0
+        self.last_ms = 0
+
+    def fits(self, timestamp, size, max_seconds, max_bytes):
+        return (timestamp * 1000 - self.start_ms < max_seconds * 1000
+                and (self.size == 0 or self.size + size <= max_bytes))
+
+    def write(self, items):
+        """Ghi 1 loạt frame: dữ liệu + flush trước, chỉ mục sau"""
+        records = []
+        for timestamp, jpeg in items:
+            # Chỉ mục phải tăng dần để searchsorted (đồng hồ lùi -> giữ mốc cũ)
+            ms = max(int(timestamp * 1000) - self.start_ms, self.last_ms)
+            records.append(INDEX_RECORD.pack(ms, self.nbytes, len(jpeg)))
+            self.data.write(jpeg)
+            self.nbytes += len(jpeg)
+            self.last_ms = ms
+        self.data.flush()
+        self.index.write(b"".join(records))
+        self.index.flush()
+        self.frames += len(records)
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class RecordingArchive:
+    """Đọc kho ghi hình: segment theo thời gian, frame trong 1 khoảng / quanh 1 thời điểm"""
+
+    def __init__(self, directory=RECORDING_DIR):
+        self.directory = directory
+
+    def cameras(self):
+        try:
+            return sorted(name for name in os.listdir(self.directory)
+                          if os.path.isdir(os.path.join(self.directory, name)))
+        except OSError:
+            return []
+
+    def segments(self, camera_id):
+        """Thời điểm bắt đầu (ms) các segment của camera, tăng dần"""
+        return self.segments_in(camera_dirname(camera_id))
+
+    def segments_in(self, dirname):
+        """Như segments() nhưng theo tên thư mục (kết quả của cameras())"""
+        try:
+            names = os.listdir(os.path.join(self.directory, dirname))
+        except OSError:
+            return []
+        return sorted(int(name[:-4]) for name in names
+                      if name.endswith(".idx") and name[:-4].isdigit())
+
+    def frames_between(self, camera_id, start, end, limit=None):
+        """[(timestamp, jpeg bytes)] của camera trong [start, end], tăng dần theo thời gian"""
+        start_ms, end_ms = int(start * 1000), int(end * 1000)
+        starts = self.segments(camera_id)
+        # Segment chứa start = segment cuối cùng bắt đầu trước start
+        first = max(0, bisect_right(starts, start_ms) - 1)
+        camera_dir = os.path.join(self.directory, camera_dirname(camera_id))
+        frames = []
+        for seg_start in starts[first:]:
+            if seg_start > end_ms or (limit is not None and len(frames) >= limit):
+                break
+            base = os.path.join(camera_dir, f"{seg_start:013d}")
+            try:
+                frames.extend(self._read(base, seg_start, start_ms, end_ms))
+            except (OSError, ValueError):
+                continue       # Segment vừa bị xoá (retention) hoặc rỗng
+        return frames[:limit] if limit is not None else frames
+
+    def frames_around(self, camera_id, timestamp, before=AROUND_SECONDS, after=AROUND_SECONDS):
+        """Frame từ timestamp - before tới timestamp + after (vd: quanh thời điểm cảnh báo)"""
+        return self.frames_between(camera_id, timestamp - before, timestamp + after)
+
+    def frame_at(self, camera_id, timestamp, tolerance=1.0):
+        """Frame gần timestamp nhất (trong ± tolerance giây), None nếu không có"""
+        frames = self.frames_between(camera_id, timestamp - tolerance, timestamp + tolerance)
+        if not frames:
+            return None
+        return min(frames, key=lambda item: abs(item[0] - timestamp))
+
+    @staticmethod
+    def _read(base, seg_start, start_ms, end_ms):
+        index_size = os.path.getsize(base + ".idx")
+        count = index_size // INDEX_DTYPE.itemsize   # Bỏ bản ghi ghi dở ở cuối (nếu có)
+        if count == 0:
+            return []
+        index = np.memmap(base + ".idx", dtype=INDEX_DTYPE, mode="r", shape=(count,))
+        times = index["ms"]
+        lo = int(np.searchsorted(times, max(0, start_ms - seg_start), side="left"))
+        hi = int(np.searchsorted(times, end_ms - seg_start, side="right")) if end_ms >= seg_start else 0
+        entries = np.array(index[lo:hi]) if hi > lo else None
+        del times, index
+        if entries is None:
+            return []
+
+        frames = []
+        with open(base + ".seg", "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for ms, offset, size in entries.tolist():
+                if offset + size <= len(data):
+                    frames.append(((seg_start + ms) / 1000, data[offset:offset + size]))
+        return frames
+
+
+class Recorder:
+    """
+    Ghi liên tục nhiều camera vào kho segment + 1 luồng nền ghi đĩa
+    append() gọi trên luồng suy luận: giới hạn RECORDING_FPS, encode JPEG nhỏ khi chỉ có frame BGR
+    """
+
+    def __init__(self, directory=RECORDING_DIR, segment_seconds=SEGMENT_SECONDS,
+                 segment_max_bytes=SEGMENT_MAX_BYTES, max_bytes=RECORDING_MAX_BYTES,
+                 max_age=RECORDING_MAX_AGE, fps=RECORDING_FPS, max_width=RECORDING_MAX_WIDTH,
+                 jpeg_quality=RECORDING_JPEG_QUALITY, max_queue_bytes=MAX_QUEUE_BYTES):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.segment_max_bytes = segment_max_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_gap = 1.0 / fps if fps else 0.0
+        self.max_width = max_width
+        self.jpeg_quality = jpeg_quality
+        self.max_queue_bytes = max_queue_bytes
+        self.archive = RecordingArchive(directory)
+
+        self._last = {}                   # camera_id -> thời điểm frame cuối được nhận
+        self._segments = {}               # camera_id -> Segment đang ghi (chỉ luồng ghi dùng)
+        self._queue = deque()
+        self._queue_bytes = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        # Thống kê
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.frames_encoded = 0
+        self.bytes_written = 0
+        self.segments_removed = 0
+
+    def wants(self, camera_id, timestamp):
+        """Frame tại timestamp có cần ghi không (kiểm tra TRƯỚC khi encode)"""
+        last = self._last.get(camera_id)
+        # Dung sai 10% như vòng đệm bằng chứng
+        return last is None or timestamp - last >= self.min_gap * 0.9 or timestamp < last
+
+    def encode(self, frame):
+        h, w = frame.shape[:2]
+        if self.max_width and w > self.max_width:
+            frame = cv2.resize(frame, (self.max_width, int(h * self.max_width / w)),
+                               interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        self.frames_encoded += 1
+        return buffer.tobytes() if ok else None
+
+    def append(self, camera_id, timestamp, frame=None, jpeg=None):
+        """Đưa 1 frame vào hàng chờ ghi (jpeg có sẵn thì không encode lại)"""
+        if not self.wants(camera_id, timestamp):
+            return False
+        if jpeg is None:
+            if frame is None:
+                return False
+            jpeg = self.encode(frame)
+            if jpeg is None:
+                return False
+        self._last[camera_id] = timestamp
+
+        with self._cond:
+            if self._queue_bytes + len(jpeg) > self.max_queue_bytes:
+                self.frames_dropped += 1
+                return False
+            self._queue.append((camera_id, timestamp, jpeg))
+            self._queue_bytes += len(jpeg)
+            self._ensure_thread()
+            self._cond.notify()
+        return True
+
+    def stats(self):
+        return {"written": self.frames_written, "dropped": self.frames_dropped,
+                "encoded": self.frames_encoded, "bytes": self.bytes_written,
+                "segments_removed": self.segments_removed, "queue_bytes": self._queue_bytes}
+
+    def close(self, timeout=5.0):
+        """Ghi nốt hàng chờ (tối đa timeout giây) rồi đóng các segment"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="RecordingWriter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    break
+                batch = list(self._queue)
+                self._queue.clear()
+                self._queue_bytes = 0
+
+            try:
+                self._write(batch)
+            except Exception as e:
+                self.frames_dropped += len(batch)
+                print(f"[LỖI] Không ghi được frame vào kho ghi hình: {e}")
+
+        for segment in self._segments.values():
+            segment.close()
+        self._segments.clear()
+
+    def _write(self, batch):
+        """Gom frame theo camera / segment, mỗi segment ghi 1 lần (ít lời gọi hệ thống)"""
+        groups = {}
+        opened = False
+        for camera_id, timestamp, jpeg in batch:
+            segment = self._segments.get(camera_id)
+            if segment is None or not segment.fits(timestamp, len(jpeg), self.segment_seconds,
+                                                   self.segment_max_bytes):
+                if segment is not None:
+                    self._flush(segment, groups.pop(segment, None))
+                    segment.close()
+                camera_dir = os.path.join(self.directory, camera_dirname(camera_id))
+                os.makedirs(camera_dir, exist_ok=True)
+                segment = self._segments[camera_id] = Segment(camera_dir, timestamp)
+                opened = True
+            groups.setdefault(segment, []).append((timestamp, jpeg))
+            segment.size += len(jpeg)
+
+        for segment, items in groups.items():
+            self._flush(segment, items)
+        if opened:
+            self._enforce_retention()
+
+    def _flush(self, segment, items):
+        if not items:
+            return
+        segment.write(items)
+        self.frames_written += len(items)
+        self.bytes_written += sum(len(jpeg) for _, jpeg in items)
+
+    def _enforce_retention(self):
+        """
+        Xoá segment cũ nhất (mọi camera) khi vượt dung lượng / tuổi, không xoá segment đang ghi:
+        của process này (active) hoặc có thể của worker khác (mới ghi trong segment_seconds giây;
+        segment cũ hơn không còn được nối thêm vì frame mới sẽ sang segment mới)
+        """
+        active = {segment.base for segment in self._segments.values()}
+        now = time.time()
+        segments = []
+        total = 0
+        for camera in self.archive.cameras():
+            camera_dir = os.path.join(self.directory, camera)
+            for start_ms in self.archive.segments_in(camera):
+                base = os.path.join(camera_dir, f"{start_ms:013d}")
+                try:
+                    size = os.path.getsize(base + ".seg") + os.path.getsize(base + ".idx")
+                    modified = os.path.getmtime(base + ".seg")
+                except OSError:
+                    continue
+                total += size
+                if base not in active and now - modified > self.segment_seconds:
+                    segments.append((start_ms, base, size, modified))
+
+        for _, base, size, modified in sorted(segments):
+            if total <= self.max_bytes and now - modified <= self.max_age:
+                break
+            for path in (base + ".idx", base + ".seg"):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            self.segments_removed += 1
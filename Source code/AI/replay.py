@@ -0,0 +1,351 @@
+"""
+Chạy lại (replay) video / thư mục ảnh JPEG qua pipeline AI - không cần camera, không cần màn hình
+- Đo thời gian từng giai đoạn: decode, color, inference, wall, pose_rules, face, draw, alert_encode
+- FPS và độ trễ p50 / p95 / p99 mỗi frame
+- Timeline trạng thái theo frame (CSV) + so sánh với nhãn chuẩn (ground truth)
+- Số lần đổi trạng thái thô (từng frame) so với sau lọc thời gian, số cảnh báo sẽ gửi
+- Cấp phát mỗi frame: số ảnh giải mã + bộ đệm RGB / xám cấp phát mới so với dùng lại
+  (thư mục JPEG được giải mã qua frame_ingest giống inference_service)
+
+Cách chạy:
+    python replay.py video.mp4
+    python replay.py thu_muc_anh/ --pipeline security --timeline timeline.csv
+    python replay.py video.mp4 --labels nhan.csv      # nhan.csv: start_frame,end_frame,status
+    python replay.py video.mp4 --render               # tính cả chi phí vẽ lớp phủ (draw)
+
+Không gửi gì sang server: cảnh báo chỉ được encode (để đo) rồi bỏ.
+"""
+import argparse
+import csv
+import glob
+import os
+import sys
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from alert_dispatcher import Alert
+from evidence_buffer import EvidenceRecorder
+from recording import Recorder
+from frame_ingest import FrameIngest
+
+
+IMAGE_EXTENSIONS = ("*.jpg", "*.jpeg", "*.png")
+STAGE_ORDER = ["decode", "color", "inference", "wall", "pose_rules", "face", "draw", "alert_encode"]
+
+
+class ReplayAlertSink:
+    """Thay AlertDispatcher khi replay: chỉ đo thời gian encode, ghi lại sự kiện"""
+
+    def __init__(self, dispatcher, timer):
+        self.dispatcher = dispatcher
+        self.timer = timer
+        self.enabled = True
+        self.events = []
+
+    def submit(self, status, message, frame, camera_id=None, result=None, render=None):
+        with self.timer.stage("alert_encode"):
+            self.dispatcher.build_request(Alert(status, message, frame, camera_id, result, render))
+        self.events.append((status, message))
+
+    def close(self, timeout=0):
+        pass
+
+
+def iter_frames(source, max_frames=None, ingest=None):
+    """Sinh (frame_index, decode_seconds, frame) từ video hoặc thư mục ảnh"""
+    if os.path.isdir(source):
+        paths = sorted(p for ext in IMAGE_EXTENSIONS for p in glob.glob(os.path.join(source, ext)))
+        for index, path in enumerate(paths):
+            if max_frames and index >= max_frames:
+                return
+            if ingest is not None and path.lower().endswith((".jpg", ".jpeg")):
+                # Giống inference_service: giải mã thu nhỏ nếu ảnh lớn hơn kích thước suy luận
+                with open(path, "rb") as f:
+                    data = f.read()
+                ingest.begin_frame()
+                frame = ingest.decode(data)
+                decode_time = ingest.last_decode_seconds
+            else:
+                t0 = time.perf_counter()
+                frame = cv2.imread(path)
+                decode_time = time.perf_counter() - t0
+            if frame is not None:
+                yield index, decode_time, frame
+        return
+
+    cap = cv2.VideoCapture(source)
+    index = 0
+    try:
+        while not max_frames or index < max_frames:
+            t0 = time.perf_counter()
+            ret, frame = cap.read()
+            decode_time = time.perf_counter() - t0
+            if not ret:
+                return
+            yield index, decode_time, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def source_fps(source, default=15.0):
+    if os.path.isdir(source):
+        return default
+    cap = cv2.VideoCapture(source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or default
+    cap.release()
+    return fps
+
+
+class ReplayClock:
+    """Đồng hồ theo thời gian của video (bộ lọc thời gian không phụ thuộc tốc độ replay)"""
+
+    def __init__(self):
+        self.start = time.time()
+        self.now = self.start
+
+    def set_position(self, seconds):
+        self.now = self.start + seconds
+
+    def __call__(self):
+        return self.now
+
+
+def build_pipeline(name, camera_id, backend=None, clock=None, render=False, evidence_dir=None,
+                   record_dir=None):
+    """
+    Trả về (hàm xử lý frame, timer, hàm lấy (status, message, raw_status), alert sink,
+            BufferPool của pipeline hoặc None, EvidenceRecorder hoặc None, Recorder hoặc None)
+    render=False: chỉ analyze() như server headless; True: thêm vẽ lớp phủ (process_frame)
+    evidence_dir: ghi clip bằng chứng RED vào thư mục này (mặc định replay không ghi clip)
+    record_dir: ghi liên tục vào kho segment ở thư mục này (recording.py)
+    """
+    if name == "security":
+        from main import SecuritySystem
+        system = SecuritySystem()
+        system.timer.enabled = True
+        system.alerts = ReplayAlertSink(system.alerts, system.timer)
+        system.evidence = None      # Dùng đồng hồ thật, không khớp thời gian video
+        system.recording = None
+        return (system.process_frame if render else system.analyze, system.timer,
+                lambda: (system.current_status, system.current_message, system.current_status),
+                system.alerts, None, None, None)
+
+    from ai_processor import AIProcessor
+    processor = AIProcessor() if backend is None else AIProcessor(backend=backend)
+    processor.timer.enabled = True
+    processor.alerts = ReplayAlertSink(processor.alerts, processor.timer)
+    if clock is not None:
+        processor.clock = clock
+    processor.evidence = EvidenceRecorder(evidence_dir) if evidence_dir else None
+    processor.recording = Recorder(record_dir) if record_dir else None
+
+    def status():
+        session = processor.sessions.get(camera_id)
+        return session.current_status, session.current_message, session.raw_status
+
+    process = processor.process_frame if render else processor.analyze
+    return ((lambda frame: process(frame, camera_id)), processor.timer, status, processor.alerts,
+            processor.buffers, processor.evidence, processor.recording)
+
+
+def load_labels(path):
+    """
+    Đọc nhãn chuẩn dạng đoạn: start_frame,end_frame,status (end_frame tính cả)
+    Trả về dict frame_index -> status
+    """
+    labels = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if not row or row[0].strip().startswith("#") or not row[0].strip().isdigit():
+                continue
+            start, end, status = int(row[0]), int(row[1]), row[2].strip()
+            for index in range(start, end + 1):
+                labels[index] = status
+    return labels
+
+
+def compare_with_labels(timeline, labels):
+    matched = total = 0
+    confusion = Counter()
+    for index, _, status, *_ in timeline:
+        expected = labels.get(index)
+        if expected is None:
+            continue
+        total += 1
+        if status == expected:
+            matched += 1
+        else:
+            confusion[(expected, status)] += 1
+    return matched, total, confusion
+
+
+def status_segments(timeline):
+    """Gộp timeline thành các đoạn trạng thái liên tiếp [(start, end, status)]"""
+    segments = []
+    for index, _, status, *_ in timeline:
+        if segments and segments[-1][2] == status:
+            segments[-1][1] = index
+        else:
+            segments.append([index, index, status])
+    return segments
+
+
+def percentile_line(values_ms):
+    arr = np.asarray(values_ms)
+    return (f"mean={arr.mean():7.2f}  p50={np.percentile(arr, 50):7.2f}  "
+            f"p95={np.percentile(arr, 95):7.2f}  p99={np.percentile(arr, 99):7.2f}")
+
+
+def count_changes(values):
+    return sum(1 for a, b in zip(values, values[1:]) if a != b)
+
+
+def run_replay(source, pipeline="ai", camera_id="replay", max_frames=None, backend=None,
+               render=False, evidence_dir=None, record_dir=None):
+    clock = ReplayClock()
+    process, timer, get_status, sink, buffers, evidence, recording = build_pipeline(
+        pipeline, camera_id, backend, clock, render, evidence_dir, record_dir)
+    ingest = FrameIngest()
+    fps = source_fps(source)
+
+    latencies = []
+    stage_samples = {}
+    timeline = []
+    wall_start = time.perf_counter()
+
+    for index, decode_time, frame in iter_frames(source, max_frames, ingest):
+        clock.set_position(index / fps)
+        t0 = time.perf_counter()
+        process(frame)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+        timings = dict(timer.timings)
+        timings["decode"] = decode_time
+        for stage, seconds in timings.items():
+            stage_samples.setdefault(stage, []).append(seconds * 1000)
+
+        status, message, raw_status = get_status()
+        timeline.append((index, index / fps, status, message, raw_status))
+
+    elapsed = time.perf_counter() - wall_start
+    if evidence is not None:
+        evidence.close(timeout=30.0)
+    if recording is not None:
+        recording.close(timeout=30.0)
+    return {
+        "latencies": latencies,
+        "stages": stage_samples,
+        "timeline": timeline,
+        "elapsed": elapsed,
+        "alerts": len(sink.events),
+        "ingest": ingest.stats() if ingest.frames else None,
+        "buffers": (buffers.allocations, buffers.reuses) if buffers is not None else None,
+        "evidence": evidence.stats() if evidence is not None else None,
+        "recording": recording.stats() if recording is not None else None,
+    }
+
+
+def print_report(result, labels=None):
+    latencies = result["latencies"]
+    frames = len(latencies)
+    print(f"\n📊 {frames} frame trong {result['elapsed']:.2f}s "
+          f"-> {frames / result['elapsed']:.1f} FPS (tính cả decode)")
+    print(f"   Độ trễ xử lý (ms): {percentile_line(latencies)}")
+
+    print("\n⏱️  Theo giai đoạn (ms / frame, tính trên mọi frame):")
+    total_mean = sum(np.sum(v) for v in result["stages"].values()) / frames
+    stages = sorted(result["stages"], key=lambda s: STAGE_ORDER.index(s) if s in STAGE_ORDER else 99)
+    for stage in stages:
+        samples = result["stages"][stage]
+        per_frame = np.sum(samples) / frames
+        share = per_frame / total_mean * 100 if total_mean else 0
+        print(f"   {stage:<13} {per_frame:7.2f}  ({share:4.1f}%)  "
+              f"[{len(samples)} frame, p95={np.percentile(samples, 95):.2f}]")
+
+    # Cấp phát ảnh mỗi frame: ảnh giải mã (luôn mới) + bộ đệm RGB / xám cấp phát mới
+    decodes = result["ingest"]["decodes_per_frame"] if result["ingest"] else 1.0
+    line = f"\n🧮 Cấp phát ảnh: giải mã {decodes:.2f} ảnh/frame"
+    if result["ingest"]:
+        line += f" ({result['ingest']['reduced']} frame giải mã thu nhỏ)"
+    if result["buffers"]:
+        allocated, reused = result["buffers"]
+        line += (f", bộ đệm RGB/xám {allocated} cấp phát mới / {reused} dùng lại "
+                 f"-> {decodes + allocated / frames:.2f} cấp phát/frame")
+    print(line)
+
+    print("\n🕒 Timeline trạng thái:")
+    for start, end, status in status_segments(result["timeline"]):
+        print(f"   frame {start:>5} - {end:>5}: {status}")
+
+    timeline = result["timeline"]
+    print(f"\n🔁 Đổi trạng thái: thô {count_changes([row[4] for row in timeline])} lần, "
+          f"sau lọc {count_changes([row[2] for row in timeline])} lần "
+          f"-> {result['alerts']} cảnh báo được gửi")
+
+    if result["evidence"]:
+        clips = result["evidence"]
+        print(f"🎞️  Clip bằng chứng: {clips['written']} đã ghi, {clips['dropped']} bị bỏ "
+              f"({clips['frames_encoded']} frame encode JPEG)")
+
+    if result["recording"]:
+        rec = result["recording"]
+        print(f"📼 Kho ghi hình: {rec['written']} frame ({rec['bytes'] / 1024 / 1024:.1f} MB), "
+              f"{rec['dropped']} bị bỏ, {rec['segments_removed']} segment bị xoá (retention)")
+
+    if labels:
+        matched, total, confusion = compare_with_labels(result["timeline"], labels)
+        if total:
+            print(f"\n🎯 Khớp nhãn chuẩn: {matched}/{total} frame ({matched / total * 100:.1f}%)")
+            for (expected, got), count in confusion.most_common():
+                print(f"   nhãn {expected:<7} -> ra {got:<7}: {count} frame")
+
+
+def write_timeline(path, timeline):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["frame", "time_s", "status", "message", "raw_status"])
+        for index, t, status, message, raw_status in timeline:
+            writer.writerow([index, f"{t:.3f}", status, message, raw_status])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay video/ảnh qua pipeline AI (headless)")
+    parser.add_argument("source", help="File video hoặc thư mục ảnh JPEG")
+    parser.add_argument("--pipeline", choices=["ai", "security"], default="ai",
+                        help="ai = AIProcessor (ai_processor.py), security = SecuritySystem (main.py)")
+    parser.add_argument("--backend", choices=["cascade", "holistic", "multi"], default=None,
+                        help="Backend suy luận của AIProcessor")
+    parser.add_argument("--render", action="store_true",
+                        help="Vẽ lớp phủ mỗi frame (mặc định: chỉ phân tích như server headless)")
+    parser.add_argument("--camera-id", default="replay")
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--timeline", help="Ghi timeline trạng thái ra file CSV")
+    parser.add_argument("--labels", help="Nhãn chuẩn CSV: start_frame,end_frame,status")
+    parser.add_argument("--evidence", help="Ghi clip bằng chứng RED vào thư mục này")
+    parser.add_argument("--record", help="Ghi liên tục vào kho segment (recording.py) ở thư mục này")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.source):
+        print(f"❌ Không tìm thấy {args.source}")
+        sys.exit(1)
+
+    result = run_replay(args.source, args.pipeline, args.camera_id, args.max_frames, args.backend,
+                        args.render, args.evidence, args.record)
+    if not result["latencies"]:
+        print(f"❌ Không đọc được frame nào từ {args.source}")
+        sys.exit(1)
+
+    labels = load_labels(args.labels) if args.labels else None
+    print_report(result, labels)
+
+    if args.timeline:
+        write_timeline(args.timeline, result["timeline"])
+        print(f"\n💾 Đã ghi timeline: {args.timeline}")
+
+
+if __name__ == "__main__":
+    main()
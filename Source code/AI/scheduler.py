@@ -0,0 +1,132 @@
+"""
+Bộ lập lịch suy luận theo chuyển động (đặt trước AIProcessor.analyze / process_frame)
+- Tính điểm chuyển động rẻ: ảnh xám thu nhỏ, so với frame trước
+- Cảnh đứng yên + trạng thái NORMAL -> bỏ qua Holistic, chỉ chạy định kỳ
+- Có chuyển động hoặc trạng thái khác NORMAL -> chạy lại đủ tốc độ ngay
+- Ngưỡng / chu kỳ chỉnh qua biến môi trường SCHEDULER_* (không cần sửa code)
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+import overlay
+from overlay import FrameAnalysis
+
+
+# --- CẤU HÌNH ---
+# "motion": bỏ frame khi cảnh tĩnh | "always": chạy mọi frame
+POLICY = os.environ.get("SCHEDULER_POLICY", "motion")
+# Độ lệch xám trung bình (0-255) coi là có chuyển động
+MOTION_THRESHOLD = float(os.environ.get("SCHEDULER_MOTION_THRESHOLD", "3.0"))
+# Cảnh tĩnh: vẫn chạy Holistic ít nhất 1 lần / IDLE_INTERVAL giây
+IDLE_INTERVAL = float(os.environ.get("SCHEDULER_IDLE_INTERVAL", "1.0"))
+# Giới hạn tốc độ tối đa (giây giữa 2 lần chạy, 0 = không giới hạn)
+MIN_INTERVAL = float(os.environ.get("SCHEDULER_MIN_INTERVAL", "0.0"))
+THUMB_SIZE = (64, 48)
+
+
+class InferenceScheduler:
+    def __init__(self, processor, policy=POLICY, motion_threshold=MOTION_THRESHOLD,
+                 idle_interval=IDLE_INTERVAL, min_interval=MIN_INTERVAL):
+        if policy not in ("motion", "always"):
+            print(f"⚠️  SCHEDULER_POLICY không hợp lệ: {policy} -> dùng motion")
+            policy = "motion"
+        self.processor = processor
+        self.policy = policy
+        self.motion_threshold = motion_threshold
+        self.idle_interval = idle_interval
+        self.min_interval = min_interval
+
+    def motion_score(self, frame, session, gray=None):
+        """
+        Độ lệch trung bình giữa ảnh xám thu nhỏ của frame này và frame trước
+        gray: ảnh xám nhỏ đã có sẵn (vd. giải mã JPEG 1/8, frame_ingest) -> không cần frame
+        """
+        if gray is not None:
+            thumb = cv2.resize(gray, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        else:
+            thumb = cv2.cvtColor(cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA),
+                                 cv2.COLOR_BGR2GRAY)
+        prev = session.motion_thumb
+        session.motion_thumb = thumb
+        if prev is None:
+            return float("inf")
+        return float(np.mean(cv2.absdiff(thumb, prev)))
+
+    def should_run(self, frame, session, now=None, gray=None):
+        """Quyết định có chạy suy luận đầy đủ cho frame này không"""
+        now = time.time() if now is None else now
+        elapsed = now - session.last_inference_time
+
+        if self.min_interval and elapsed < self.min_interval:
+            return False
+        if self.policy == "always":
+            return True
+
+        score = self.motion_score(frame, session, gray)
+        if session.current_status not in ("NORMAL", "UNKNOWN"):
+            return True              # Đang có người / cảnh báo -> luôn đủ tốc độ
+        if score >= self.motion_threshold:
+            return True
+        return elapsed >= self.idle_interval
+
+    def analyze(self, frame, camera_id):
+        """
+        Như AIProcessor.analyze nhưng có thể bỏ qua suy luận.
+        Trả về (FrameAnalysis, ran): ran=False nghĩa là chỉ lặp lại trạng thái cũ.
+        """
+        session = self.processor.sessions.get(camera_id)
+        now = time.time()
+
+        if self.should_run(frame, session, now):
+            session.last_inference_time = now
+            session.frames_inferred += 1
+            return self.processor.analyze(frame, camera_id), True
+
+        session.frames_skipped += 1
+        self.processor.record_frame(camera_id, frame, session=session)
+        return FrameAnalysis(camera_id, session.current_status, session.current_message,
+                             session.current_color, inferred=False), False
+
+    def analyze_jpeg(self, jpeg, camera_id, ingest):
+        """
+        Như analyze() nhưng nhận JPEG (frame_ingest.FrameIngest):
+        - Frame có thể bị bỏ qua (cảnh NORMAL) -> chỉ giải mã ảnh xám 1/8 để tính chuyển động,
+          giải mã BGR (thu nhỏ nếu ảnh lớn) khi thật sự suy luận
+        - Đang có người / cảnh báo -> luôn suy luận, giải mã BGR ngay (không giải mã 2 lần)
+        Trả về (FrameAnalysis, ran) hoặc (None, False) nếu ảnh lỗi.
+        """
+        ingest.begin_frame()
+        session = self.processor.sessions.get(camera_id)
+        now = time.time()
+
+        frame = gray = None
+        if self.policy == "motion" and session.current_status in ("NORMAL", "UNKNOWN"):
+            gray = ingest.motion_gray(jpeg)
+            if gray is None:
+                return None, False
+        else:
+            frame = ingest.decode(jpeg)
+            if frame is None:
+                return None, False
+
+        if self.should_run(frame, session, now, gray):
+            if frame is None:
+                frame = ingest.decode(jpeg)
+                if frame is None:
+                    return None, False
+            session.last_inference_time = now
+            session.frames_inferred += 1
+            return self.processor.analyze(frame, camera_id, jpeg), True
+
+        session.frames_skipped += 1
+        self.processor.record_frame(camera_id, jpeg=jpeg, session=session)
+        return FrameAnalysis(camera_id, session.current_status, session.current_message,
+                             session.current_color, inferred=False), False
+
+    def process_frame(self, frame, camera_id):
+        """analyze() + vẽ lớp phủ (có người xem). Trả về (ảnh, ran)"""
+        analysis, ran = self.analyze(frame, camera_id)
+        return overlay.render(frame.copy(), analysis), ran
@@ -20,34 +20,74 @@ let latestAlert = {
     image_base64: null
 };
 
+function badRequest(message) {
+    const error = new Error(message);
+    error.statusCode = 400;
+    return error;
+}
+
+// Đọc body alert: JSON (image_base64) hoặc binary [4 byte độ dài JSON][JSON][JPEG thô]
+function parseAlertBody(req) {
+    if (!Buffer.isBuffer(req.body)) {
+        const { status, message, timestamp, image_base64, detection } = req.body || {};
+        return {
+            status, message, timestamp, image_base64, detection,
+            imageBuffer: image_base64 ? Buffer.from(image_base64, 'base64') : null
+        };
+    }
+
+    // Cùng kiểm tra độ dài như server.js ở thư mục gốc: body ngắn / hỏng -> 400, không đọc rác
+    const body = req.body;
+    if (body.length < 4) {
+        throw badRequest('Binary alert body quá ngắn');
+    }
+    const metaLen = body.readUInt32BE(0);
+    if (4 + metaLen > body.length) {
+        throw badRequest('Binary alert body không hợp lệ');
+    }
+    let meta;
+    try {
+        meta = JSON.parse(body.subarray(4, 4 + metaLen).toString('utf8'));
+    } catch (error) {
+        throw badRequest('Metadata JSON của alert không hợp lệ');
+    }
+    const imageBuffer = body.subarray(4 + metaLen);
+    return {
+        ...meta,
+        image_base64: imageBuffer.length ? imageBuffer.toString('base64') : null,
+        imageBuffer: imageBuffer.length ? imageBuffer : null
+    };
+}
+
 // API nhận alert từ Python
-app.post('/api/alert', (req, res) => {
+app.post('/api/alert', express.raw({ type: 'application/octet-stream', limit: '10mb' }), (req, res) => {
     try {
-        const { status, message, timestamp, image_base64 } = req.body;
+        const { status, message, timestamp, image_base64, imageBuffer, detection } = parseAlertBody(req);
         
         latestAlert = {
             status,
             message,
             timestamp,
-            image_base64
+            image_base64,
+            detection: detection || null   // keypoints float32 (base64), confidence, bbox, wall_y
         };
 
         console.log(`[${new Date().toLocaleTimeString()}] Nhận: ${status} - ${message}`);
         
         // Lưu ảnh nếu là RED (tùy chọn)
-        if (status === 'RED' && image_base64) {
+        if (status === 'RED' && imageBuffer) {
             const filename = `alert_${Date.now()}.jpg`;
             fs.writeFileSync(
                 path.join(__dirname, 'alerts', filename),
-                Buffer.from(image_base64, 'base64')
+                imageBuffer
             );
             console.log(`  → Đã lưu ảnh: ${filename}`);
         }
 
         res.json({ success: true, received: timestamp });
     } catch (error) {
-        console.error('Lỗi nhận alert:', error);
-        res.status(500).json({ success: false, error: error.message });
+        console.error('Lỗi nhận alert:', error.statusCode ? error.message : error);
+        res.status(error.statusCode || 500).json({ success: false, error: error.message });
     }
 });
 
@@ -0,0 +1,146 @@
+"""
+Lưu trạng thái theo từng camera để một AIProcessor phục vụ được nhiều stream
+- CameraSession: bộ đếm vẫy tay, chế độ an toàn, trạng thái đã gửi...
+- PersonState: phần trạng thái luật dùng chung với từng track (chế độ nhiều người)
+- SessionStore: xóa session không hoạt động + giới hạn số graph MediaPipe (LRU)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from temporal_filter import TemporalFilter
+
+
+# --- CẤU HÌNH ---
+# Số graph MediaPipe (Holistic/Cascade) tối đa giữ trong bộ nhớ mỗi process; dịch vụ AI không gán
+# cho 1 worker nhiều camera hơn số này (vượt -> LRU đóng / tạo lại graph mỗi frame, mất theo dõi)
+MAX_LIVE_GRAPHS = int(os.environ.get("AI_MAX_LIVE_GRAPHS", "8"))
+SESSION_IDLE_TIMEOUT = 300   # Xóa session sau 5 phút không có frame (giây)
+EVICT_CHECK_INTERVAL = 10    # Chu kỳ kiểm tra session hết hạn (giây)
+
+
+class PersonState:
+    """Trạng thái luật của một người: vẫy tay, chế độ an toàn, lọc thời gian"""
+
+    def __init__(self):
+        self.safe_mode_until = 0
+        self.wave_counter = 0
+        self.prev_wrist_x = 0
+        self.prev_direction = 0
+        self.temporal = TemporalFilter()  # Lọc trạng thái theo thời gian (hysteresis)
+        self.raw_status = "UNKNOWN"     # Kết luận thô của frame cuối (chưa lọc, để debug)
+        self.face_issue = "NO_FACE"     # Vấn đề mặt gần nhất: NO_FACE | MASK
+
+
+class CameraSession(PersonState):
+    """Trạng thái theo dõi của một camera (chế độ 1 người: camera = người)"""
+
+    def __init__(self, camera_id):
+        super().__init__()
+        self.camera_id = camera_id
+        self.current_status = "UNKNOWN"
+        self.current_message = ""
+        self.current_color = (128, 128, 128)
+        self.last_sent_time = 0
+        self.sent_status = "UNKNOWN"    # Trạng thái đã gửi cảnh báo gần nhất (đổi trong cooldown -> gửi sau)
+        self.wall_tracker = None        # WallTracker, tạo khi xử lý frame đầu tiên
+        self.evidence = None            # EvidenceBuffer: JPEG vài giây gần nhất (clip bằng chứng RED)
+        self.motion_thumb = None        # Ảnh thu nhỏ frame trước (InferenceScheduler)
+        self.last_result = None         # DetectionResult của frame suy luận gần nhất
+        self.last_inference_time = 0
+        self.frames_inferred = 0
+        self.frames_skipped = 0
+        self.last_seen = time.time()
+
+
+class SessionStore:
+    """
+    Kho session theo camera_id.
+    Graph MediaPipe được tạo qua graph_factory và giữ theo LRU: khi vượt quá
+    max_graphs, graph ít dùng nhất bị đóng (camera đó sẽ dò lại từ đầu ở frame sau).
+    """
+
+    def __init__(self, graph_factory, max_graphs=MAX_LIVE_GRAPHS, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.graph_factory = graph_factory
+        self.max_graphs = max(1, max_graphs)
+        self.idle_timeout = idle_timeout
+
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._graphs = OrderedDict()
+        self._last_evict_check = time.time()
+
+        self.graphs_created = 0
+        self.graphs_evicted = 0
+        self.sessions_evicted = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, camera_id):
+        """Lấy (hoặc tạo) session của camera và cập nhật thời điểm hoạt động"""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(camera_id)
+            if session is None:
+                session = CameraSession(camera_id)
+                self._sessions[camera_id] = session
+            session.last_seen = now
+
+            if now - self._last_evict_check > EVICT_CHECK_INTERVAL:
+                self._evict_idle(now)
+        return session
+
+    def get_graph(self, camera_id):
+        """Lấy graph của camera, tạo mới nếu chưa có hoặc đã bị LRU loại bỏ"""
+        with self._lock:
+            graph = self._graphs.get(camera_id)
+            if graph is not None:
+                self._graphs.move_to_end(camera_id)
+                return graph
+
+            graph = self.graph_factory()
+            self.graphs_created += 1
+            self._graphs[camera_id] = graph
+
+            while len(self._graphs) > self.max_graphs:
+                _, old_graph = self._graphs.popitem(last=False)
+                self.graphs_evicted += 1
+                self._close_graph(old_graph)
+        return graph
+
+    def remove(self, camera_id):
+        with self._lock:
+            self._sessions.pop(camera_id, None)
+            graph = self._graphs.pop(camera_id, None)
+        if graph is not None:
+            self._close_graph(graph)
+
+    def close(self):
+        with self._lock:
+            graphs = list(self._graphs.values())
+            self._graphs.clear()
+            self._sessions.clear()
+        for graph in graphs:
+            self._close_graph(graph)
+
+    def _evict_idle(self, now):
+        """Xóa session + graph của camera không gửi frame quá idle_timeout (gọi khi giữ lock)"""
+        self._last_evict_check = now
+        expired = [cid for cid, s in self._sessions.items() if now - s.last_seen > self.idle_timeout]
+        for camera_id in expired:
+            del self._sessions[camera_id]
+            self.sessions_evicted += 1
+            graph = self._graphs.pop(camera_id, None)
+            if graph is not None:
+                self._close_graph(graph)
+        if expired:
+            print(f"🧹 Đã xóa {len(expired)} session không hoạt động: {', '.join(map(str, expired))}")
+
+    @staticmethod
+    def _close_graph(graph):
+        try:
+            graph.close()
+        except Exception:
+            pass
@@ -0,0 +1,51 @@
+"""
+Đo thời gian từng giai đoạn xử lý của 1 frame
+    with processor.timer.stage("wall"):
+        ...
+Khi enabled=False, stage() trả về context rỗng (gần như không tốn chi phí).
+"""
+import time
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "t0")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.t0
+        timings = self.timer.timings
+        timings[self.name] = timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+class StageTimer:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timings = {}     # stage -> tổng thời gian (giây) trong frame hiện tại
+
+    def reset(self):
+        """Gọi ở đầu mỗi frame"""
+        self.timings = {}
+
+    def stage(self, name):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
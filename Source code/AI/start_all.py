@@ -1,104 +1,357 @@
 """
-START ALL SERVICES - Khởi động đồng thời:
-1. Flask webcam stream (port 5000) - Dành cho test webcam laptop
-2. Flask AI processor (port 5001) - Nhận ảnh từ ESP32-CAM qua Node.js
+START ALL SERVICES - Trình giám sát (supervisor) khởi động và giữ các dịch vụ luôn chạy:
+1. Flask AI processor (port 5001) - Nhận ảnh từ ESP32-CAM qua Node.js
+2. Flask webcam stream (port 5000) - Dành cho test webcam laptop (tùy chọn)
 3. Node.js server (port 3000) - WebSocket + API
+
+- Các dịch vụ độc lập khởi động SONG SONG, chờ probe sẵn sàng (AI: /health, webcam: /test,
+  Node.js: cổng TCP) thay vì sleep cố định -> khởi động nguội = thời gian của dịch vụ chậm nhất
+- Dịch vụ chết / quá READY_TIMEOUT chưa sẵn sàng -> khởi động lại với backoff tăng dần
+  (reset khi đã chạy ổn định STABLE_AFTER giây); dịch vụ tùy chọn lỗi liên tục thì bỏ qua
+- Không chạy được lệnh (thiếu node / sai --python...) -> thử lại với backoff, quá
+  MAX_SPAWN_FAILURES lần liên tiếp thì đánh dấu failed (supervisor không bị treo chờ)
+- Ctrl+C / SIGTERM -> chuyển SIGINT cho từng dịch vụ con để tắt sạch, quá STOP_TIMEOUT mới kill
+- In thời gian khởi động của từng dịch vụ
+
+Cách chạy:
+    python start_all.py [--services ai,node] [--python đường/dẫn/python]
 """
+import argparse
+import os
+import shutil
+import signal
+import socket
 import subprocess
 import sys
-import os
+import threading
 import time
+import urllib.error
+import urllib.request
+
+
+# --- CẤU HÌNH ---
+READY_TIMEOUT = 90.0                      # Quá thời gian này chưa sẵn sàng -> coi như lỗi, khởi động lại
+PROBE_INTERVAL = 0.2                      # Chu kỳ probe sẵn sàng / kiểm tra tiến trình (giây)
+PROBE_TIMEOUT = 1.0                       # Timeout của 1 lần probe
+RESTART_BACKOFF = (1, 2, 4, 8, 15, 30)    # Giây chờ trước lần khởi động lại thứ 1, 2, ... (giữ mức cuối)
+STABLE_AFTER = 60.0                       # Chạy lâu hơn mới chết -> coi là lỗi mới, backoff về mức đầu
+MAX_OPTIONAL_FAILURES = 3                 # Dịch vụ tùy chọn lỗi liên tiếp mà chưa sẵn sàng -> bỏ
+MAX_SPAWN_FAILURES = 3                    # Không chạy được lệnh liên tiếp (mọi dịch vụ) -> failed
+STOP_TIMEOUT = 10.0                       # Chờ dịch vụ tự tắt trước khi kill
+
+IS_WINDOWS = os.name == "nt"
+
+
+def http_probe(url):
+    """Sẵn sàng khi GET url trả về 200 (AI trả 503 tới khi có worker nạp xong model)"""
+    def probe():
+        try:
+            with urllib.request.urlopen(url, timeout=PROBE_TIMEOUT) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+    return probe
+
+
+def tcp_probe(port, host="127.0.0.1"):
+    """Sẵn sàng khi cổng đã nhận kết nối (Node.js không có endpoint health riêng)"""
+    def probe():
+        try:
+            with socket.create_connection((host, port), timeout=PROBE_TIMEOUT):
+                return True
+        except OSError:
+            return False
+    return probe
+
+
+class Service:
+    """1 dịch vụ con: khởi động, chờ sẵn sàng, theo dõi, khởi động lại khi chết (chạy trên luồng riêng)"""
+
+    def __init__(self, name, cmd, cwd, probe, url=None, optional=False):
+        self.name = name
+        self.cmd = cmd
+        self.cwd = cwd
+        self.probe = probe
+        self.url = url
+        self.optional = optional
+
+        self.process = None
+        self.state = "stopped"                # starting | ready | backoff | failed | stopped
+        self.restarts = 0
+        self.startup_seconds = None           # Thời gian khởi động lần gần nhất
+        self.settled = threading.Event()      # Đã sẵn sàng lần đầu (hoặc đã bỏ cuộc)
+        self._lock = threading.Lock()
+
+    def _spawn(self, stop_event):
+        """Chạy tiến trình con; False nếu đang dừng, OSError nếu không chạy được lệnh"""
+        env = dict(os.environ, PYTHONUNBUFFERED="1", PYTHONIOENCODING="utf-8")
+        kwargs = {}
+        if IS_WINDOWS:
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True    # Ctrl+C của terminal chỉ tới supervisor, không tới thẳng con
+        with self._lock:
+            if stop_event.is_set():
+                return False
+            self.process = subprocess.Popen(
+                self.cmd, cwd=self.cwd, env=env,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                text=True, encoding="utf-8", errors="replace", bufsize=1, **kwargs)
+        threading.Thread(target=self._pump_output, args=(self.process,), daemon=True).start()
+        return True
 
-def run_command(cmd, cwd=None, name="Process"):
-    """Chạy command trong subprocess"""
-    try:
-        print(f"🚀 Starting {name}...")
-        process = subprocess.Popen(
-            cmd,
-            shell=True,
-            cwd=cwd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
-        )
-        
-        # Print output in real-time
+    def _pump_output(self, process):
+        """In log của dịch vụ con theo thời gian thực, có tiền tố tên dịch vụ"""
         for line in iter(process.stdout.readline, ''):
-            if line:
-                print(f"[{name}] {line.rstrip()}")
-        
+            print(f"[{self.name}] {line.rstrip()}", flush=True)
         process.stdout.close()
-        return_code = process.wait()
-        if return_code:
-            print(f"❌ {name} exited with code {return_code}")
-        
-    except Exception as e:
-        print(f"❌ Error starting {name}: {e}")
 
-if __name__ == "__main__":
-    print("\n" + "="*60)
-    print("🎯 ESP32-CAM + AI Detection System")
-    print("="*60 + "\n")
-    
-    # Tự động lấy đường dẫn tuyệt đối (không phụ thuộc path máy khác)
-    base_dir = os.path.dirname(os.path.abspath(__file__))  # Thư mục AI/
-    project_root = os.path.dirname(base_dir)                # Thư mục iottesy/
-    
-    print("📂 Project root:", project_root)
-    print("📂 AI folder:", base_dir)
-    print("\n⏳ Starting services...\n")
-    
-    # Tìm Python trong venv (tự động tìm Scripts hoặc bin)
+    def _wait_ready(self, started, stop_event):
+        while not stop_event.is_set():
+            if self.process.poll() is not None:
+                return False
+            if self.probe():
+                return True
+            if time.monotonic() - started > READY_TIMEOUT:
+                print(f"⏱️  {self.name} chưa sẵn sàng sau {READY_TIMEOUT:.0f}s -> khởi động lại")
+                self._kill()
+                return False
+            stop_event.wait(PROBE_INTERVAL)
+        return False
+
+    def _wait_exit(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                return self.process.wait(timeout=PROBE_INTERVAL)
+            except subprocess.TimeoutExpired:
+                pass
+        return None
+
+    def run(self, stop_event):
+        """Luồng của dịch vụ: lỗi bất ngờ -> failed + settled (không chết im lặng, không treo start())"""
+        try:
+            self._run(stop_event)
+        except Exception as e:
+            self.state = "failed"
+            print(f"⛔ Luồng giám sát {self.name} lỗi: {e!r} -> bỏ dịch vụ này")
+            self._kill()
+        finally:
+            self.settled.set()
+
+    def _fail(self, reason):
+        self.state = "failed"
+        print(f"⛔ {self.name}: {reason} -> bỏ qua dịch vụ này")
+        self.settled.set()
+
+    def _run(self, stop_event):
+        failures = 0             # Số lần chết liên tiếp (để tính backoff)
+        unready_failures = 0     # Số lần chết liên tiếp mà chưa kịp sẵn sàng
+        spawn_failures = 0       # Số lần liên tiếp không chạy được lệnh
+        while True:
+            started = time.monotonic()
+            self.state = "starting"
+            try:
+                if not self._spawn(stop_event):
+                    break
+                spawn_failures = 0
+            except OSError as e:
+                spawn_failures += 1
+                failures += 1
+                print(f"❌ Không chạy được {self.name} ({' '.join(self.cmd)}): {e}")
+                if spawn_failures >= MAX_SPAWN_FAILURES:
+                    self._fail(f"không chạy được lệnh {spawn_failures} lần liên tiếp")
+                    return
+                delay = RESTART_BACKOFF[min(failures, len(RESTART_BACKOFF)) - 1]
+                self.state = "backoff"
+                if stop_event.wait(delay):
+                    break
+                continue
+            ready = self._wait_ready(started, stop_event)
+            if ready:
+                self.startup_seconds = time.monotonic() - started
+                self.state = "ready"
+                note = f" (lần khởi động lại thứ {self.restarts})" if self.restarts else ""
+                print(f"✅ {self.name} sẵn sàng sau {self.startup_seconds:.1f}s{note}")
+                self.settled.set()
+                self._wait_exit(stop_event)
+            if stop_event.is_set():
+                break
+
+            code = self.process.wait()
+            uptime = time.monotonic() - started
+            failures = 1 if ready and uptime >= STABLE_AFTER else failures + 1
+            unready_failures = 0 if ready else unready_failures + 1
+            if self.optional and unready_failures >= MAX_OPTIONAL_FAILURES:
+                self._fail(f"(tùy chọn) lỗi {unready_failures} lần liên tiếp")
+                return
+
+            delay = RESTART_BACKOFF[min(failures, len(RESTART_BACKOFF)) - 1]
+            print(f"💥 {self.name} đã thoát (mã {code}) sau {uptime:.1f}s -> khởi động lại sau {delay}s")
+            self.state = "backoff"
+            if stop_event.wait(delay):
+                break
+            self.restarts += 1
+        self.state = "stopped"
+
+    def send_stop(self):
+        """Chuyển tín hiệu tắt sạch: SIGINT (Python -> KeyboardInterrupt, Node.js -> handler SIGINT)"""
+        with self._lock:
+            process = self.process
+        if process is None or process.poll() is not None:
+            return
+        try:
+            if IS_WINDOWS:
+                process.terminate()
+            else:
+                process.send_signal(signal.SIGINT)
+        except OSError:
+            pass
+
+    def _kill(self):
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        try:
+            if IS_WINDOWS:
+                process.kill()
+            else:
+                os.killpg(process.pid, signal.SIGKILL)    # Cả nhóm: gồm worker con của dịch vụ
+        except OSError:
+            pass
+        process.wait()
+
+    def finish_stop(self, deadline):
+        process = self.process
+        if process is None:
+            return
+        try:
+            process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            print(f"🔪 {self.name} không tự tắt sau {STOP_TIMEOUT:.0f}s -> kill")
+            self._kill()
+
+
+class Supervisor:
+    def __init__(self, services):
+        self.services = services
+        self.stop_event = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Khởi động song song, chờ tất cả sẵn sàng (hoặc bỏ cuộc) rồi in thời gian khởi động"""
+        t0 = time.monotonic()
+        for service in self.services:
+            print(f"🚀 Starting {service.name}...")
+            thread = threading.Thread(target=service.run, args=(self.stop_event,),
+                                      name=service.name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        for service in self.services:
+            while not service.settled.wait(PROBE_INTERVAL):
+                if self.stop_event.is_set():
+                    return False
+        if self.stop_event.is_set():
+            return False
+        self.print_startup(time.monotonic() - t0)
+        return True
+
+    def print_startup(self, total):
+        missing = [s.name for s in self.services if s.state == "failed" and not s.optional]
+        print("\n" + "=" * 60)
+        if missing:
+            print(f"⚠️  KHÔNG KHỞI ĐỘNG ĐƯỢC: {', '.join(missing)} (các dịch vụ khác vẫn chạy)")
+        else:
+            print("✅ ALL SERVICES STARTED!")
+        print("=" * 60)
+        print("\n⏱️  Thời gian khởi động:")
+        for service in self.services:
+            if service.state == "failed":
+                print(f"   {service.name:<16} ⛔ bỏ qua (không khởi động được)")
+            else:
+                print(f"   {service.name:<16} {service.startup_seconds:6.1f}s   {service.url or ''}")
+        print(f"   {'Tổng (song song)':<16} {total:6.1f}s")
+
+    def stop(self):
+        self.stop_event.set()
+        for service in self.services:
+            service.send_stop()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for service in self.services:
+            service.finish_stop(deadline)
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+
+
+def build_services(python, base_dir, project_root, names):
+    services = {
+        "ai": Service("AI Processor", [python, "ai_processor.py"], base_dir,
+                      http_probe("http://127.0.0.1:5001/health"), url="http://localhost:5001/health"),
+        "webcam": Service("Webcam Stream", [python, "webcam_stream.py"], base_dir,
+                          http_probe("http://127.0.0.1:5000/test"), url="http://localhost:5000/stream",
+                          optional=True),
+        "node": Service("Node.js Server", [shutil.which("node") or "node", "server.js"], project_root,
+                        tcp_probe(3000), url="http://localhost:3000/dashboard.html"),
+    }
+    unknown = [n for n in names if n not in services]
+    if unknown:
+        print(f"❌ Dịch vụ không tồn tại: {', '.join(unknown)} (chọn trong: {', '.join(services)})")
+        sys.exit(1)
+    return [services[n] for n in names]
+
+
+def find_python(base_dir):
+    """Python trong venv (tự động tìm Scripts hoặc bin)"""
     venv_python = os.path.join(base_dir, "venv_ai", "Scripts", "python.exe")
     if not os.path.exists(venv_python):
         venv_python = os.path.join(base_dir, "venv_ai", "bin", "python")  # Linux/Mac
-    
     if not os.path.exists(venv_python):
         print(f"❌ Virtual environment not found: {venv_python}")
-        print("Please run: python -m venv venv_ai")
+        print("Please run: python -m venv venv_ai (hoặc chỉ định --python)")
         sys.exit(1)
-    
-    try:
-        # Start AI Processor (port 5001)
-        print("🤖 Starting AI Processor (port 5001)...")
-        ai_cmd = f'"{venv_python}" ai_processor.py'
-        ai_process = subprocess.Popen(ai_cmd, shell=True, cwd=base_dir)
-        time.sleep(2)
-        
-        # Start Webcam Stream (port 5000) - Optional, for testing
-        print("\n📹 Starting Webcam Stream (port 5000)...")
-        webcam_cmd = f'"{venv_python}" webcam_stream.py'
-        webcam_process = subprocess.Popen(webcam_cmd, shell=True, cwd=base_dir)
-        time.sleep(2)
-        
-        # Start Node.js Server (port 3000)
-        print("\n🌐 Starting Node.js Server (port 3000)...")
-        node_cmd = "node server.js"
-        node_process = subprocess.Popen(node_cmd, shell=True, cwd=project_root)
-        time.sleep(2)
-        
-        print("\n" + "="*60)
-        print("✅ ALL SERVICES STARTED!")
-        print("="*60)
-        print("\n📌 URLs:")
-        print("   Dashboard:    http://localhost:3000/dashboard.html")
-        print("   Webcam Test:  http://localhost:5000/stream")
-        print("   AI Health:    http://localhost:5001/health")
+    return venv_python
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Khởi động và giám sát các dịch vụ")
+    parser.add_argument("--services", default="ai,webcam,node",
+                        help="Danh sách dịch vụ, cách nhau bởi dấu phẩy (ai, webcam, node)")
+    parser.add_argument("--python", help="Python dùng cho dịch vụ AI (mặc định: venv_ai)")
+    args = parser.parse_args()
+
+    print("\n" + "=" * 60)
+    print("🎯 ESP32-CAM + AI Detection System")
+    print("=" * 60 + "\n")
+
+    # Tự động lấy đường dẫn tuyệt đối (không phụ thuộc path máy khác)
+    base_dir = os.path.dirname(os.path.abspath(__file__))  # Thư mục AI/
+    project_root = os.path.dirname(base_dir)                # Thư mục gốc dự án
+
+    print("📂 Project root:", project_root)
+    print("📂 AI folder:", base_dir)
+    print("\n⏳ Starting services...\n")
+
+    python = args.python or find_python(base_dir)
+    names = [n.strip() for n in args.services.split(",") if n.strip()]
+    supervisor = Supervisor(build_services(python, base_dir, project_root, names))
+
+    # Ctrl+C / SIGTERM chỉ đặt cờ, việc tắt dịch vụ làm ở luồng chính
+    def request_stop(signum, frame):
+        supervisor.stop_event.set()
+    for sig in (signal.SIGINT, signal.SIGTERM, getattr(signal, "SIGBREAK", None)):
+        if sig is not None:
+            signal.signal(sig, request_stop)
+
+    if supervisor.start():
         print("\n📡 WebSocket:    ws://localhost:3000")
         print("\n⌨️  Press Ctrl+C to stop all services\n")
-        
-        # Wait for keyboard interrupt
-        try:
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            print("\n\n⚠️  Stopping all services...")
-            ai_process.terminate()
-            webcam_process.terminate()
-            node_process.terminate()
-            print("✅ All services stopped.\n")
-            
-    except Exception as e:
-        print(f"\n❌ Error: {e}\n")
-        sys.exit(1)
+
+    while not supervisor.stop_event.wait(1.0):
+        pass
+    print("\n\n⚠️  Stopping all services...")
+    supervisor.stop()
+    print("✅ All services stopped.\n")
+
+
+if __name__ == "__main__":
+    main()
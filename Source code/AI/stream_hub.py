@@ -0,0 +1,187 @@
+"""
+Bộ phát MJPEG cho nhiều người xem (encode JPEG MỘT lần / frame / biến thể)
+- Một luồng camera gọi hub.publish(frame)
+- Luồng fan-out encode mỗi biến thể (chiều rộng, chất lượng) đúng 1 lần
+  rồi đẩy bytes JPEG vào hàng chờ riêng của từng client
+- Hàng chờ mỗi client có giới hạn: client chậm chỉ bị bỏ frame cũ,
+  không làm chậm camera hay client khác
+- Mỗi client chọn FPS và độ phân giải riêng (?fps=5&width=320&quality=70)
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+import cv2
+
+
+# --- CẤU HÌNH ---
+CLIENT_QUEUE_SIZE = 2        # Số frame chờ tối đa mỗi client (cũ hơn thì bỏ)
+DEFAULT_QUALITY = 80
+MAX_WIDTH = 1920
+
+
+class Subscriber:
+    """Một người xem: hàng chờ JPEG có giới hạn + FPS / độ phân giải riêng"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, fps=None, width=None, quality=DEFAULT_QUALITY, queue_size=CLIENT_QUEUE_SIZE,
+                 on_frame=None):
+        self.id = next(self._ids)
+        self.interval = 1.0 / fps if fps else 0.0
+        self.width = min(int(width), MAX_WIDTH) if width else None
+        self.quality = int(quality)
+        self.on_frame = on_frame         # Callback khi có frame mới (dùng cho server asyncio)
+
+        self._queue = deque(maxlen=queue_size)
+        self._cond = threading.Condition()
+        self._closed = False
+        self.last_push = 0.0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    @property
+    def variant(self):
+        return self.width, self.quality
+
+    def due(self, now):
+        return now - self.last_push >= self.interval
+
+    def push(self, jpeg, now):
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.frames_dropped += 1        # Client chậm -> bỏ frame cũ nhất
+            self._queue.append(jpeg)
+            self.last_push = now
+            self._cond.notify()
+        if self.on_frame is not None:
+            self.on_frame()
+
+    def pop(self):
+        """Lấy frame không chờ (None nếu hàng chờ rỗng)"""
+        with self._cond:
+            if not self._queue:
+                return None
+            self.frames_sent += 1
+            return self._queue.popleft()
+
+    def get(self, timeout=None):
+        """Chờ frame tiếp theo (None nếu hết thời gian chờ hoặc hub đã đóng)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._queue or self._closed, timeout=timeout):
+                return None
+            if not self._queue:
+                return None
+            self.frames_sent += 1
+            return self._queue.popleft()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self.on_frame is not None:
+            self.on_frame()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class StreamHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._subscribers = {}
+        self._frame = None
+        self._seq = 0
+        self._running = False
+        self._thread = None
+
+        self.frames_published = 0
+        self.frames_encoded = 0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._fan_out, name="StreamHub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            subscribers = list(self._subscribers.values())
+            self._subscribers.clear()
+            self._cond.notify_all()
+        for sub in subscribers:
+            sub.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def publish(self, frame):
+        """Gọi từ luồng camera: chỉ lưu tham chiếu frame mới nhất (không encode ở đây)"""
+        with self._cond:
+            self._frame = frame
+            self._seq += 1
+            self.frames_published += 1
+            self._cond.notify()
+
+    def subscribe(self, **kwargs):
+        sub = Subscriber(**kwargs)
+        with self._lock:
+            self._subscribers[sub.id] = sub
+        print(f'📹 Client #{sub.id} đã kết nối (tổng {len(self._subscribers)})')
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            removed = self._subscribers.pop(sub.id, None)
+        sub.close()
+        if removed is not None:
+            print(f'⚠️  Client #{sub.id} đã ngắt kết nối '
+                  f'(đã gửi {sub.frames_sent}, bỏ {sub.frames_dropped} frame)')
+
+    def client_count(self):
+        return len(self._subscribers)
+
+    def stats(self):
+        return {
+            "clients": len(self._subscribers),
+            "frames_published": self.frames_published,
+            "frames_encoded": self.frames_encoded,
+        }
+
+    def _fan_out(self):
+        last_seq = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._seq != last_seq or not self._running)
+                if not self._running:
+                    return
+                frame, last_seq = self._frame, self._seq
+                subscribers = list(self._subscribers.values())
+
+            now = time.time()
+            due = [s for s in subscribers if s.due(now)]
+            if not due:
+                continue
+
+            # Encode mỗi biến thể đúng 1 lần cho frame này
+            encoded = {}
+            for sub in due:
+                variant = sub.variant
+                if variant not in encoded:
+                    encoded[variant] = self._encode(frame, *variant)
+                if encoded[variant] is not None:
+                    sub.push(encoded[variant], now)
+
+    def _encode(self, frame, width, quality):
+        if width and width < frame.shape[1]:
+            height = int(frame.shape[0] * width / frame.shape[1])
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            print('⚠️ Lỗi encode frame')
+            return None
+        self.frames_encoded += 1
+        return buffer.tobytes()
@@ -0,0 +1,84 @@
+"""
+Lọc trạng thái theo thời gian (hysteresis) cho từng track / camera
+- Mỗi luật (person, fall, climb, face) có điểm bỏ phiếu giảm dần theo hàm mũ:
+      score += (1 - exp(-dt / tau)) * (raw - score)
+  (tính theo thời gian thực, không phụ thuộc FPS hay số frame bị bỏ qua)
+- Bật khi score >= enter, tắt khi score <= exit (enter > exit -> không nhấp nháy)
+- Thời gian giữ tối thiểu: đã bật phải giữ ít nhất min_on giây, đã tắt phải chờ min_off giây
+- Tín hiệu thô của frame cuối vẫn lưu lại (raw) để debug / replay
+"""
+import math
+import time
+
+
+# --- CẤU HÌNH ---
+# luật: (tau giây, ngưỡng bật, ngưỡng tắt, giữ bật tối thiểu, giữ tắt tối thiểu)
+RULE_CONFIG = {
+    "person": (0.3, 0.5, 0.2, 1.0, 0.0),
+    "fall":   (0.5, 0.6, 0.3, 3.0, 1.0),
+    "climb":  (0.5, 0.6, 0.3, 3.0, 1.0),
+    "face":   (0.7, 0.7, 0.3, 3.0, 1.0),
+}
+FIRST_FRAME_DT = 1 / 15        # Quan sát đầu tiên được tính như 1 frame ở 15 FPS
+
+
+class RuleFilter:
+    def __init__(self, tau, enter, exit, min_on=0.0, min_off=0.0):
+        self.tau = tau
+        self.enter = enter
+        self.exit = exit
+        self.min_on = min_on
+        self.min_off = min_off
+
+        self.score = 0.0
+        self.active = False
+        self.raw = None
+        self._last_update = None
+        self._changed_at = -math.inf
+
+    def update(self, raw, now):
+        """raw: True/False của frame này, None = không quan sát được (giữ nguyên điểm)"""
+        self.raw = raw
+        if raw is not None:
+            if self._last_update is None:
+                dt = FIRST_FRAME_DT
+            else:
+                dt = max(0.0, now - self._last_update)
+            weight = 1.0 - math.exp(-dt / self.tau)
+            self.score += weight * ((1.0 if raw else 0.0) - self.score)
+            self._last_update = now
+
+        held = now - self._changed_at
+        if not self.active and self.score >= self.enter and held >= self.min_off:
+            self.active = True
+            self._changed_at = now
+        elif self.active and self.score <= self.exit and held >= self.min_on:
+            self.active = False
+            self._changed_at = now
+        return self.active
+
+
+class TemporalFilter:
+    """Bộ lọc cho 1 track: mỗi luật một RuleFilter"""
+
+    def __init__(self, config=RULE_CONFIG):
+        self.rules = {name: RuleFilter(*params) for name, params in config.items()}
+
+    def update(self, signals, now=None):
+        """
+        signals: {luật: True / False / None}; luật không có trong signals coi như None
+        Trả về {luật: đang bật (đã lọc)}
+        """
+        now = time.time() if now is None else now
+        return {name: rule.update(signals.get(name), now) for name, rule in self.rules.items()}
+
+    def active(self, name):
+        return self.rules[name].active
+
+    @property
+    def raw(self):
+        return {name: rule.raw for name, rule in self.rules.items()}
+
+    @property
+    def scores(self):
+        return {name: round(rule.score, 3) for name, rule in self.rules.items()}
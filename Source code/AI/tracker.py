@@ -0,0 +1,125 @@
+"""
+Theo dõi nhiều người qua các frame (IoU + khoảng cách tâm), gán ID ổn định
+- Ghép khung phát hiện với track cũ theo IoU cao nhất (tham lam),
+  phần còn lại ghép theo khoảng cách tâm (người di chuyển nhanh / khung nhảy)
+- Track mất dấu quá MAX_MISSES lần phát hiện liên tiếp thì bị xóa
+- Mỗi track mang trạng thái luật riêng (PersonState: vẫy tay, chế độ an toàn, lọc thời gian)
+"""
+import itertools
+
+import numpy as np
+
+from session_store import PersonState
+
+
+# --- CẤU HÌNH ---
+IOU_THRESHOLD = 0.3           # IoU tối thiểu để ghép khung với track
+CENTROID_THRESHOLD = 0.6      # Khoảng cách tâm tối đa (tỉ lệ với đường chéo khung của track)
+MAX_MISSES = 5                # Số lần phát hiện liên tiếp không thấy -> xóa track
+MIN_HITS = 2                  # Số lần thấy tối thiểu trước khi track được tính (tránh báo ảo)
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+
+def centroid(box):
+    return (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+
+
+class Track(PersonState):
+    _ids = itertools.count(1)
+
+    def __init__(self, bbox, score=0.0):
+        super().__init__()
+        self.id = next(self._ids)
+        self.bbox = tuple(bbox)         # (x1, y1, x2, y2) pixel
+        self.score = score
+        self.hits = 1
+        self.misses = 0
+        self.last_pose_frame = -1       # Frame cuối cùng được chạy Pose
+        self.keypoints = None           # (33, 4) gần nhất, tọa độ chuẩn hóa toàn khung
+        self.status = "UNKNOWN"
+        self.message = ""
+        self.color = (128, 128, 128)
+        self.trigger = None
+
+    @property
+    def confirmed(self):
+        return self.hits >= MIN_HITS
+
+    @property
+    def visible(self):
+        return self.misses == 0
+
+    def update_bbox(self, bbox, score=None):
+        self.bbox = tuple(int(v) for v in bbox)
+        if score is not None:
+            self.score = score
+
+
+class PersonTracker:
+    def __init__(self, iou_threshold=IOU_THRESHOLD, centroid_threshold=CENTROID_THRESHOLD,
+                 max_misses=MAX_MISSES):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+
+    def update(self, detections):
+        """detections: [(x1, y1, x2, y2, score)] -> danh sách track còn sống"""
+        unmatched_tracks = list(range(len(self.tracks)))
+        unmatched_dets = list(range(len(detections)))
+        matches = []
+
+        # 1. Ghép theo IoU (cặp IoU cao nhất trước)
+        if self.tracks and detections:
+            scores = np.array([[iou(t.bbox, d[:4]) for d in detections] for t in self.tracks])
+            for ti, di in zip(*np.unravel_index(np.argsort(-scores, axis=None), scores.shape)):
+                if scores[ti, di] < self.iou_threshold:
+                    break
+                if ti in unmatched_tracks and di in unmatched_dets:
+                    matches.append((ti, di))
+                    unmatched_tracks.remove(ti)
+                    unmatched_dets.remove(di)
+
+        # 2. Ghép phần còn lại theo khoảng cách tâm
+        for ti in list(unmatched_tracks):
+            track = self.tracks[ti]
+            tx, ty = centroid(track.bbox)
+            diag = np.hypot(track.bbox[2] - track.bbox[0], track.bbox[3] - track.bbox[1])
+            best, best_dist = None, self.centroid_threshold * diag
+            for di in unmatched_dets:
+                dx, dy = centroid(detections[di][:4])
+                dist = np.hypot(dx - tx, dy - ty)
+                if dist < best_dist:
+                    best, best_dist = di, dist
+            if best is not None:
+                matches.append((ti, best))
+                unmatched_tracks.remove(ti)
+                unmatched_dets.remove(best)
+
+        for ti, di in matches:
+            track = self.tracks[ti]
+            track.update_bbox(detections[di][:4], detections[di][4])
+            track.hits += 1
+            track.misses = 0
+
+        for ti in unmatched_tracks:
+            self.tracks[ti].misses += 1
+
+        for di in unmatched_dets:
+            self.tracks.append(Track(detections[di][:4], detections[di][4]))
+
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+        return self.tracks
+
+    def reset(self):
+        self.tracks = []
@@ -0,0 +1,156 @@
+"""
+Theo dõi vạch tường theo thời gian (thay cho dò Hough mỗi frame)
+- Tường là vật cố định: dò 1 lần, sau đó chỉ kiểm tra lại mỗi N frame
+  hoặc khi khung cảnh thay đổi (camera bị xoay, đèn bật/tắt...)
+- Làm mượt vị trí bằng trung bình trượt (EMA) + độ tin cậy
+- Khung cảnh thay đổi: vạch mới lệch xa chỉ được nhận khi lần kiểm tra sau (SCENE_CHECK_EVERY frame)
+  dò lại ra đúng vị trí đó (người đi sát camera cũng làm cảnh đổi), chưa dò được thì thử lại mỗi
+  SCENE_CHECK_EVERY frame tới khi thấy tường
+- Cho phép người vận hành ghim cố định vạch tường theo camera
+"""
+import os
+
+import cv2
+import numpy as np
+
+
+# --- CẤU HÌNH ---
+REVALIDATE_EVERY = 150        # Dò lại tường sau mỗi 150 frame (~10s ở 15 FPS)
+RETRY_EVERY = 30              # Chưa thấy tường: thử lại sau mỗi 30 frame
+SCENE_CHECK_EVERY = 5         # Đo thay đổi khung cảnh mỗi 5 frame
+SCENE_CHANGE_THRESHOLD = 18.0 # Độ lệch xám trung bình (0-255) để coi là cảnh thay đổi
+SMOOTHING = 0.3               # Hệ số EMA khi cập nhật vị trí tường
+MAX_JUMP = 0.08               # Lệch quá 8% chiều cao -> coi là ứng viên khác
+MIN_CONFIDENCE = 0.3          # Dưới ngưỡng này coi như không có tường
+THUMB_SIZE = (32, 24)
+
+
+def valid_wall_y(wall_y):
+    """Vạch tường tính theo tỉ lệ chiều cao frame: 0.0 (mép trên) -> 1.0 (mép dưới)"""
+    return wall_y is not None and 0.0 <= wall_y <= 1.0
+
+
+def load_pinned_walls(spec=None):
+    """
+    Đọc vạch tường ghim sẵn từ biến môi trường PINNED_WALLS
+    Ví dụ: PINNED_WALLS="esp32cam=0.55,default=0.6"
+    """
+    spec = os.environ.get("PINNED_WALLS", "") if spec is None else spec
+    pins = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        camera_id, value = item.split("=", 1)
+        try:
+            wall_y = float(value)
+        except ValueError:
+            wall_y = None
+        if not valid_wall_y(wall_y):
+            print(f"⚠️ PINNED_WALLS không hợp lệ (cần tỉ lệ 0.0 -> 1.0 chiều cao frame): {item}")
+            continue
+        pins[camera_id.strip()] = wall_y
+    return pins
+
+
+PINNED_WALLS = load_pinned_walls()
+
+
+class WallTracker:
+    """
+    Mô hình tường của một camera.
+    detector(frame, ctx) -> (has_wall, wall_y) là hàm dò đầy đủ (Canny + Hough).
+    """
+
+    def __init__(self, detector, pinned_y=None):
+        self.detector = detector
+        self.pinned_y = pinned_y
+        self.wall_y = None
+        self.confidence = 0.0
+        self.frames_since_check = 0
+        self.detections = 0
+        self._ref_thumb = None
+        self._scene_pending = False     # Cảnh đã đổi nhưng chưa dò lại được / chưa xác nhận tường
+        self._candidate_y = None        # Vạch lệch xa dò được sau khi cảnh đổi, chờ xác nhận
+
+    def pin(self, wall_y):
+        """Ghim vạch tường (0.0 -> 1.0), bỏ qua mọi lần dò tự động"""
+        if not valid_wall_y(wall_y):
+            raise ValueError(f"Vạch tường phải trong khoảng 0.0 -> 1.0 chiều cao frame: {wall_y}")
+        self.pinned_y = wall_y
+
+    def unpin(self):
+        self.pinned_y = None
+        self.frames_since_check = REVALIDATE_EVERY   # Dò lại ngay ở frame sau
+
+    def update(self, ctx):
+        """Trả về (has_wall, wall_y) cho frame hiện tại"""
+        if self.pinned_y is not None:
+            return True, self.pinned_y
+
+        self.frames_since_check += 1
+        if self._scene_pending:
+            interval = SCENE_CHECK_EVERY
+        elif self.wall_y is not None and self.confidence >= MIN_CONFIDENCE:
+            interval = REVALIDATE_EVERY
+        else:
+            interval = RETRY_EVERY
+
+        if self._ref_thumb is None or self.frames_since_check >= interval:
+            self._revalidate(ctx, self._scene_pending)
+        elif self._scene_changed(ctx):
+            self._revalidate(ctx, scene_changed=True)
+
+        has_wall = self.wall_y is not None and self.confidence >= MIN_CONFIDENCE
+        return has_wall, (self.wall_y if has_wall else None)
+
+    def _scene_changed(self, ctx):
+        if self.frames_since_check % SCENE_CHECK_EVERY:
+            return False
+        diff = cv2.absdiff(self._thumbnail(ctx), self._ref_thumb)
+        return float(np.mean(diff)) > SCENE_CHANGE_THRESHOLD
+
+    def _thumbnail(self, ctx):
+        return ctx.cached("wall_thumb", lambda: cv2.resize(ctx.gray, THUMB_SIZE,
+                                                            interpolation=cv2.INTER_AREA))
+
+    def _revalidate(self, ctx, scene_changed=False):
+        self.frames_since_check = 0
+        self.detections += 1
+        self._ref_thumb = self._thumbnail(ctx)
+
+        found, y = self.detector(ctx.frame, ctx)
+
+        if not found or y is None:
+            # Cảnh vừa đổi mà chưa thấy tường: dò lại sau SCENE_CHECK_EVERY frame (không đợi 150)
+            self._scene_pending = scene_changed
+            self.confidence *= 0.5
+            if self.confidence < MIN_CONFIDENCE / 2:
+                self.wall_y = None
+                self.confidence = 0.0
+            return
+
+        self._scene_pending = False
+        if self.wall_y is None:
+            self.wall_y = y
+            self.confidence = 0.5
+            self._candidate_y = None
+        elif abs(y - self.wall_y) <= MAX_JUMP:
+            self.wall_y += SMOOTHING * (y - self.wall_y)
+            self.confidence += (1.0 - self.confidence) * 0.5
+            self._candidate_y = None
+        elif scene_changed:
+            if self._candidate_y is not None and abs(y - self._candidate_y) <= MAX_JUMP:
+                # Camera bị xoay / dời: 2 lần dò liên tiếp cùng ra vạch mới -> vạch cũ không còn đúng
+                self.wall_y = y
+                self.confidence = 0.5
+                self._candidate_y = None
+            else:
+                # Có thể chỉ là người đi sát camera: giữ vạch cũ, xác nhận lại sau SCENE_CHECK_EVERY frame
+                self._candidate_y = y
+                self._scene_pending = True
+        else:
+            # Ứng viên lệch xa: giảm tin cậy, nếu quá thấp thì chuyển sang vị trí mới
+            self.confidence *= 0.5
+            if self.confidence < MIN_CONFIDENCE:
+                self.wall_y = y
+                self.confidence = 0.5
@@ -1,24 +1,44 @@
+import os
+import threading
+import time
+
 import cv2
-from flask import Flask, Response
+from flask import Flask, Response, request
 import sys
 
+from capture import MAX_RECONNECT_DELAY, RECONNECT_DELAY
+from frame_ring import FrameRingWriter
+from stream_hub import StreamHub, DEFAULT_QUALITY
+
+# Tên shared memory ring cho AI chạy cùng máy (VIDEO_SOURCE=shm://iot_webcam), "" để tắt
+FRAME_RING_NAME = os.environ.get("FRAME_RING_NAME", "iot_webcam")
+
 app = Flask(__name__)
 
-# Khởi tạo webcam (thử cả DirectShow backend)
+
+def open_camera():
+    """Mở webcam (DirectShow cho Windows), None nếu không mở được"""
+    cap = cv2.VideoCapture(0, cv2.CAP_DSHOW)
+    if not cap.isOpened():
+        cap.release()
+        return None
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    return cap
+
+
+# Khởi tạo webcam
 print('🔍 Đang tìm webcam...')
-camera = cv2.VideoCapture(0, cv2.CAP_DSHOW)  # DirectShow cho Windows
+camera = open_camera()
 
 # Kiểm tra webcam có mở được không
-if not camera.isOpened():
+if camera is None:
     print('❌ KHÔNG THỂ MỞ WEBCAM!')
     print('Kiểm tra:')
     print('1. Webcam có bị app khác sử dụng không?')
     print('2. Driver webcam đã cài đúng chưa?')
     sys.exit(1)
 
-camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
 # Test đọc 1 frame để chắc chắn webcam hoạt động
 success, test_frame = camera.read()
 if not success:
@@ -29,30 +49,83 @@ if not success:
 print('✅ Webcam đã sẵn sàng!')
 print(f'📐 Resolution: {int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT))}')
 
-def generate_frames():
-    """Generator để stream frames qua HTTP"""
+# Hub phát MJPEG: encode 1 lần / frame rồi chia cho mọi client HTTP
+hub = StreamHub()
+ring = FrameRingWriter(FRAME_RING_NAME, test_frame.shape) if FRAME_RING_NAME else None
+
+
+def capture_loop():
+    """
+    Luồng DUY NHẤT đọc webcam: ghi vào shared memory ring + đẩy frame cho hub HTTP
+    Mất webcam (rút cáp, driver lỗi...) -> mở lại với backoff như capture.LatestFrameReader,
+    client đang xem giữ kết nối và nhận tiếp frame khi webcam trở lại
+    """
+    global camera
+    delay = RECONNECT_DELAY
     while True:
+        if camera is None:
+            camera = open_camera()
+            if camera is None:
+                print(f'⚠️ Không mở được webcam, thử lại sau {delay:.1f}s')
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                continue
+            print('✅ Đã kết nối lại webcam')
+
         success, frame = camera.read()
         if not success:
-            print('⚠️ Lỗi đọc frame từ webcam')
-            break
-        
-        # Encode frame thành JPEG
-        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-        if not ret:
-            print('⚠️ Lỗi encode frame')
+            print('⚠️ Lỗi đọc frame từ webcam, đang kết nối lại...')
+            camera.release()
+            camera = None
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
             continue
-            
-        frame_bytes = buffer.tobytes()
-        
-        # Yield frame theo format multipart
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        delay = RECONNECT_DELAY
+
+        if ring is not None:
+            ring.publish(frame)
+        hub.publish(frame)
+
+
+def _query_number(name, cast, default=None):
+    try:
+        value = cast(request.args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+    return value if value and value > 0 else default
+
+
+def generate_frames(sub):
+    """Generator để stream frames qua HTTP: chỉ lấy JPEG đã encode sẵn từ hàng chờ của client"""
+    try:
+        while True:
+            frame_bytes = sub.get(timeout=2.0)
+            if frame_bytes is None:
+                if sub.closed:
+                    break
+                print('⚠️ Không có frame mới từ webcam')
+                continue
+
+            # Yield frame theo format multipart
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+    finally:
+        hub.unsubscribe(sub)
 
 @app.route('/stream')
 def video_feed():
-    print('📹 Client đã kết nối stream')
-    return Response(generate_frames(),
+    """
+    /stream                         -> đủ FPS camera, độ phân giải gốc
+    /stream?fps=5&width=320         -> bản nhẹ cho trình duyệt / điện thoại
+    /stream?quality=60
+    Các client cùng (width, quality) dùng chung 1 lần encode.
+    """
+    sub = hub.subscribe(
+        fps=_query_number('fps', float),
+        width=_query_number('width', int),
+        quality=min(_query_number('quality', int, DEFAULT_QUALITY), 100),
+    )
+    return Response(generate_frames(sub),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/test')
@@ -62,12 +135,24 @@ def test():
 if __name__ == '__main__':
     print('🎥 Webcam stream đang chạy tại http://localhost:5000/stream')
     print('🔗 Test endpoint: http://localhost:5000/test')
+    print('🎛️  Tùy chọn: /stream?fps=5&width=320&quality=70')
     print('📺 Xem stream tại: http://localhost:3000/')
+    if ring is not None:
+        print(f'🧠 Shared memory ring: shm://{FRAME_RING_NAME} (VIDEO_SOURCE cho main.py)')
     print('\n⌨️  Nhấn Ctrl+C để dừng server\n')
+
+    hub.start()
+    threading.Thread(target=capture_loop, daemon=True).start()
     
     try:
         app.run(host='0.0.0.0', port=5000, threaded=True, debug=False)
     except KeyboardInterrupt:
+        pass
+    finally:
         print('\n⏹️  Đang tắt webcam...')
-        camera.release()
+        hub.stop()
+        if camera is not None:
+            camera.release()
+        if ring is not None:
+            ring.close()
         print('✅ Đã tắt webcam')
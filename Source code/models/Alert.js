@@ -12,9 +12,10 @@ const alertSchema = new mongoose.Schema({
     min: 0,
     max: 100
   },
+  // Ảnh là tùy chọn: AI có thể chỉ gửi thumbnail hoặc không gửi ảnh (ALERT_SNAPSHOT)
   imageUrl: {
     type: String,
-    required: true
+    default: ''
   },
   keypoints: [{
     x: { type: Number, required: true },
@@ -25,6 +26,19 @@ const alertSchema = new mongoose.Schema({
     x: { type: Number },
     y: { type: Number }
   },
+  // Khung người và vạch tường (tọa độ chuẩn hóa 0-1)
+  bbox: {
+    x1: { type: Number },
+    y1: { type: Number },
+    x2: { type: Number },
+    y2: { type: Number }
+  },
+  wallY: {
+    type: Number
+  },
+  cameraId: {
+    type: String
+  },
   timestamp: {
     type: Date,
     default: Date.now
@@ -43,5 +57,6 @@ const alertSchema = new mongoose.Schema({
 alertSchema.index({ timestamp: -1 });
 alertSchema.index({ type: 1 });
 alertSchema.index({ acknowledged: 1 });
+alertSchema.index({ cameraId: 1, timestamp: -1 });
 
 module.exports = mongoose.model('Alert', alertSchema);
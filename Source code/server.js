@@ -51,9 +51,76 @@ app.use('/api/alerts', alertsRoutes);
 // Video được gửi trực tiếp từ ESP32-CAM qua WebSocket binary frames
 
 // ===== ROUTE NHẬN ALERT TỪ AI PYTHON =====
-app.post('/api/alert', async (req, res) => {
+// Hỗ trợ 2 kiểu body:
+// - application/json: { status, message, timestamp, image_base64 } (kiểu cũ)
+// - application/octet-stream: [4 byte độ dài JSON][JSON metadata][JPEG thô]
+// Body ngắn / hỏng -> lỗi 400 (AI không gửi lại), lỗi khác -> 500
+function badRequest(message) {
+    const error = new Error(message);
+    error.statusCode = 400;
+    return error;
+}
+
+function parseAlertBody(req) {
+    if (!Buffer.isBuffer(req.body)) {
+        const { image_base64, ...meta } = req.body || {};
+        return { ...meta, image_base64 };
+    }
+
+    const body = req.body;
+    if (body.length < 4) {
+        throw badRequest('Binary alert body quá ngắn');
+    }
+    const metaLen = body.readUInt32BE(0);
+    if (4 + metaLen > body.length) {
+        throw badRequest('Binary alert body không hợp lệ');
+    }
+    let meta;
+    try {
+        meta = JSON.parse(body.subarray(4, 4 + metaLen).toString('utf8'));
+    } catch (error) {
+        throw badRequest('Metadata JSON của alert không hợp lệ');
+    }
+    const image = body.subarray(4 + metaLen);
+    return { ...meta, image_base64: image.length ? image.toString('base64') : null };
+}
+
+// Đọc kết quả nhận diện gọn từ AI: keypoints là base64 của float32 (33 x 4: x, y, z, visibility)
+function parseDetection(detection) {
+    if (!detection) {
+        return { keypoints: [], confidence: null, center: null, bbox: null, wallY: null };
+    }
+
+    const keypoints = [];
+    if (detection.keypoints_f32) {
+        const raw = Buffer.from(detection.keypoints_f32, 'base64');
+        const stride = (detection.keypoints_shape && detection.keypoints_shape[1]) || 4;
+        for (let offset = 0; offset + stride * 4 <= raw.length; offset += stride * 4) {
+            keypoints.push({
+                x: raw.readFloatLE(offset),
+                y: raw.readFloatLE(offset + 4),
+                score: raw.readFloatLE(offset + (stride - 1) * 4)
+            });
+        }
+    }
+
+    const bbox = Array.isArray(detection.bbox) && detection.bbox.length === 4
+        ? { x1: detection.bbox[0], y1: detection.bbox[1], x2: detection.bbox[2], y2: detection.bbox[3] }
+        : null;
+    return {
+        keypoints,
+        confidence: typeof detection.confidence === 'number'
+            ? Math.round(Math.min(1, Math.max(0, detection.confidence)) * 100)
+            : null,
+        center: bbox ? { x: (bbox.x1 + bbox.x2) / 2, y: (bbox.y1 + bbox.y2) / 2 } : null,
+        bbox,
+        wallY: typeof detection.wall_y === 'number' ? detection.wall_y : null
+    };
+}
+
+app.post('/api/alert', express.raw({ type: 'application/octet-stream', limit: '10mb' }), async (req, res) => {
     try {
-        const { status, message, timestamp, image_base64 } = req.body;
+        const { status, message, timestamp, camera_id, image_base64, detection } = parseAlertBody(req);
         
         console.log(`🤖 [AI ALERT] ${status}: ${message}`);
         
@@ -102,14 +169,18 @@ app.post('/api/alert', async (req, res) => {
         
         // Chuyển timestamp từ Unix epoch (giây) sang milliseconds
         const alertTimestamp = timestamp ? new Date(timestamp * 1000) : new Date();
+        const result = parseDetection(detection);
         
         const alert = new Alert({
             type: alertType,
-            confidence: 95, // AI của Đạt chưa trả confidence, mặc định 95%
+            confidence: result.confidence ?? 95, // AI cũ không gửi detection -> mặc định 95%
             imageUrl: image_base64 ? `data:image/jpeg;base64,${image_base64}` : '',
             timestamp: alertTimestamp,
-            keypoints: [], // MediaPipe có thể thêm sau
-            center: { x: 0.5, y: 0.5 }
+            keypoints: result.keypoints,
+            center: result.center || { x: 0.5, y: 0.5 },
+            bbox: result.bbox || undefined,
+            wallY: result.wallY,
+            cameraId: camera_id
         });
         
         await alert.save();
@@ -125,7 +196,10 @@ app.post('/api/alert', async (req, res) => {
             imageUrl: alert.imageUrl,
             timestamp: alert.timestamp.toISOString(),
             keypoints: alert.keypoints,
-            center: alert.center
+            center: alert.center,
+            bbox: alert.bbox,
+            wallY: alert.wallY,
+            cameraId: alert.cameraId
         });
         
         sendToUsers(alertMessage, false);
@@ -134,8 +208,8 @@ app.post('/api/alert', async (req, res) => {
         
         res.json({ success: true, alertId: alert._id });
     } catch (error) {
-        console.error('❌ Lỗi xử lý alert:', error);
-        res.status(500).json({ success: false, error: error.message });
+        console.error('❌ Lỗi xử lý alert:', error.statusCode ? error.message : error);
+        res.status(error.statusCode || 500).json({ success: false, error: error.message });
     }
 });
 